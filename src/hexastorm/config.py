@@ -32,9 +32,38 @@ class Spi:
     command_bytes = 1
     word_bytes = 8
     move_instruction = dict(instruction=1, ticks=7)
+    # bits of the scanline header after the instruction byte, LSB first
+    # words is the number of data words of a run-length encoded scanline
+    # repeat is the number of times the line is exposed again
+    scanline_header = {"direction": 1, "half_period": 31, "words": 8, "repeat": 16}
+    # run of a run-length encoded scanline: [7 bits length - 1] + [1 bit laser]
+    rle_run_bits = 8
+    # maximum number of words written by a burst command
+    burst_words = 128
+    # signed start offset in ticks of a facet, see Instructions.facet_offset
+    facet_offset_bits = 16
+    # facet period statistics, a word with [count] + [min ticks] + [max ticks]
+    # followed by a word with the sum and a word with the sum of squares
+    facet_stats = {"count": 16, "ticks": 24}
+    # laserhead registers set by laser_timing instructions, in order of their
+    # index, each is limited by the maximum of the build, e.g. max_laser_ticks
+    laser_timing_registers = (
+        "laser_ticks",
+        "scanline_length",
+        "start_ticks",
+        "facet_ticks",
+        "motor_period",
+    )
 
     class Commands:
-        """SPI protocol command. Each command is followed by a word."""
+        """SPI protocol command. Each command is followed by a word.
+
+        A burst writes several words after a single command byte, bits 0-6
+        hold the number of words minus one, see Spi.burst_words.
+        Watermark sets the FIFO low-watermark to the word that follows.
+        Facet stats returns the period statistics of all facets, a word per
+        word sent, and clears them, see Spi.words_facet_stats.
+        """
 
         empty = 0
         write = 1
@@ -43,9 +72,20 @@ class Spi:
         flush = 4
         start = 5
         stop = 6
+        watermark = 7
+        facet_stats = 8
+        burst = 0x80
 
     class Instructions:
-        """Instruction types encoded in SPI words. Each word can contain a subcommand."""
+        """Instruction types encoded in SPI words. Each word can contain a subcommand.
+
+        The facet mask is read by the laserhead in front of scanlines, bit n of
+        the payload enables facet n.
+        The facet offset is also read by the laserhead, byte 1 holds the facet
+        and the bits after it the signed shift of the line start in ticks.
+        The laser timing sets a register of the laserhead, byte 1 holds its
+        index in Spi.laser_timing_registers and the bits after it the value.
+        """
 
         move = 1
         write_pin = 2
@@ -53,18 +93,36 @@ class Spi:
         last_scanline = 4
         set_fan = 5
         set_spindle = 6
+        rle_scanline = 7
+        facet_mask = 8
+        facet_offset = 9
+        laser_timing = 10
 
     class State:
-        """State word returned by SPI. Each bit represent a specific status flag."""
+        """State word returned by SPI. Each bit represent a specific status flag.
+
+        The state byte is followed by the pin state byte and, in bits 16-31,
+        the words of space available in the FIFO.
+        """
 
         full = 0
         parsing = 1
         error = 2
         empty = 3
 
-    def words_scanline(laser_timing):
-        """Returns the number of words required for a single scanline instruction."""
-        return ceil((8 + ceil(laser_timing["scanline_length"] / 8)) / Spi.word_bytes)
+    def words_scanline(laser_timing, channels=1, laser_bits=1):
+        """Returns the number of words required for a single scanline instruction.
+
+        With two laser channels the bits of both channels are interleaved,
+        i.e. a line holds two bits per pixel. With grayscale exposure every
+        channel takes `laser_bits` bits per pixel.
+        """
+        bits = channels * laser_bits * laser_timing["scanline_length"]
+        return ceil((8 + ceil(bits / 8)) / Spi.word_bytes)
+
+    def words_facet_stats(laser_timing):
+        """Returns the number of words read by a facet stats command."""
+        return 3 * laser_timing["facets"]
 
     def words_move(hdl_cfg):
         """Returns the number of words required for a single move instruction."""
@@ -132,7 +190,15 @@ class PlatformConfig:
     Holds platform configuration.
     """
 
-    def __init__(self, test=False):
+    def __init__(
+        self,
+        test=False,
+        fifo_memory="ebr",
+        spi_lanes=1,
+        pol_degree=2,
+        laser_channels=1,
+        laser_bits=1,
+    ):
         """
         Initialization follows one of two routes:
 
@@ -150,8 +216,50 @@ class PlatformConfig:
             - Perform sanity checks (e.g., ensure scanline fits within available ticks)
 
             The final result is stored in `self.laser_var`, a flat dictionary of all configuration values.
+
+            The instruction FIFO is stored in block RAM, `fifo_memory="ebr"`, or in
+            the single-port RAM, `fifo_memory="spram"`, which holds about 8x more words.
+
+            The SPI link between host and FPGA uses 1, 2 (dual) or 4 (quad) data
+            lanes per direction, `spi_lanes`. Several lanes are a simulation-only
+            option, the board routes a single lane and machine.SPI on the host
+            only drives one.
+
+            Moves are evaluated as polynomials of order `pol_degree`. Order 2
+            supports constant acceleration, order 3 adds jerk and enables the
+            jerk limited S-curve moves of the host. Order 3 is a simulation-only
+            option, its gateware does not fit the UP5K.
+
+            Scanlines drive one or two laser channels, `laser_channels`. With two
+            channels, a second diode offset across the scan exposes another lane
+            in the same sweep. Its lines are twice as long, in production they
+            only fit in the single-port RAM.
+
+            Pixels are exposed with 1, 2 or 4 bits, `laser_bits`. With more than
+            one bit a pixel is a grayscale level, the laser is on for a fraction
+            of the laser period, so a single pass sets the dose. Like two
+            channels, these lines only fit in the single-port RAM in production.
         """
+        if fifo_memory not in ("ebr", "spram"):
+            raise ValueError("fifo_memory must be 'ebr' or 'spram'")
+        if spi_lanes not in (1, 2, 4):
+            raise ValueError("spi_lanes must be 1, 2 or 4")
+        if spi_lanes != 1 and not test:
+            raise ValueError("Several spi_lanes are only supported in simulation")
+        if pol_degree not in (2, 3):
+            raise ValueError("Only polynomial orders 2 and 3 are supported")
+        if pol_degree == 3 and not test:
+            raise ValueError("Polynomial order 3 is only supported in simulation")
+        if laser_channels not in (1, 2):
+            raise ValueError("laser_channels must be 1 or 2")
+        if laser_bits not in (1, 2, 4):
+            raise ValueError("laser_bits must be 1, 2 or 4")
         self.test = test
+        self.fifo_memory = fifo_memory
+        self.spi_lanes = spi_lanes
+        self.pol_degree = pol_degree
+        self.laser_channels = laser_channels
+        self.laser_bits = laser_bits
         self._hdl_cfg = None
         if test:
             self.laser_timing = dict(
@@ -171,7 +279,6 @@ class PlatformConfig:
             )
         self.update_laser_timing()
         self.motor_cfg = self._init_motor_cfg()
-        self.laser_bits = 1  # enables adding pwm to laser (not widely tested)
 
     @property
     def paths(self):
@@ -230,12 +337,14 @@ class PlatformConfig:
             visible_pixels = last_record.get("visible_pixels", [])
         return visible_pixels
 
-    def get_optical_params(self, correction=False, exposures=4):
+    def get_optical_params(self, correction=False, exposures=4, scan_correction=True):
         """
         Returns a dictionary of physical parameters, including calculated Lanewidth.
 
         correction: If True, loads empirically derived corrections from calibration_history.json.
         exposures: Number of exposures per facet, used to calculate stepsperline for stage speed.
+        scan_correction: If False, the scan corrections are left out, as the laserhead
+            applies them with facet offsets, see facet_offset_ticks.
         """
         if correction is True:
             correction_data = self.load_latest_calibration()
@@ -294,6 +403,12 @@ class PlatformConfig:
                 # number of pixels in a line
                 "bitsinscanline": int(laz_tim["scanline_length"]),
                 "downsamplefactor": 1.0,
+                # laser channels, a sweep exposes a lane per channel
+                "laserchannels": float(self.laser_channels),
+                # bits per pixel and channel, grayscale with more than one
+                "laserbits": float(self.laser_bits),
+                # lanes between the lanes of the channels, see geometry
+                "channeloffset": 1.0,
                 # resist
                 "positiveresist": 0.0,
             }
@@ -318,9 +433,57 @@ class PlatformConfig:
             else:
                 params[f"f{i}_scan"] = 0.0
                 params[f"f{i}_orth"] = 0.0
+            if not scan_correction:
+                params[f"f{i}_scan"] = 0.0
 
         return params
 
+    def facet_offset_range(self):
+        """
+        Returns the lowest and highest facet offset in ticks.
+
+        A line must start after the photodiode pulse and end before the
+        earliest next pulse.
+        """
+        laz_tim = self.laser_timing
+        start = laz_tim["start_ticks"]
+        line_ticks = laz_tim["scanline_length"] * laz_tim["laser_ticks"]
+        end = laz_tim["facet_ticks"] - laz_tim["jitter_sync_ticks"] - 1
+        limit = 1 << (Spi.facet_offset_bits - 1)
+        return max(1 - start, -limit), min(end - line_ticks - start, limit - 1)
+
+    def facet_offset_ticks(self, correction=True):
+        """
+        Converts the scan corrections of the facets to facet offsets in ticks.
+
+        A line started k pixels later is shifted by k times the displacement
+        per pixel, the offset is chosen to cancel the correction of the facet.
+        The slicer then uses get_optical_params with scan_correction=False.
+
+        correction: see get_optical_params
+        """
+        params = self.get_optical_params(correction=correction)
+        start_pixel = params["startpixel"]
+        pixels = params["bitsinscanline"]
+        # mean displacement per pixel, negative as the scan runs backwards
+        slope = (
+            np.sin(params["tiltangle"])
+            * (
+                displacement_kernel(start_pixel + pixels - 1, params)
+                - displacement_kernel(start_pixel, params)
+            )
+            / (pixels - 1)
+        )
+        laser_ticks = self.laser_timing["laser_ticks"]
+        lowest, highest = self.facet_offset_range()
+        offsets = []
+        for i in range(self.laser_timing["facets"]):
+            ticks = round(-params[f"f{i}_scan"] / slope * laser_ticks)
+            if not lowest <= ticks <= highest:
+                logger.warning(f"Offset of facet {i} limited, {ticks} ticks required")
+            offsets.append(min(max(int(ticks), lowest), highest))
+        return offsets
+
     @property
     def esp32_cfg(self):
         """Connections to esp32S3."""
@@ -371,6 +534,7 @@ class PlatformConfig:
                 phase=1,
                 polarity=0,
                 baudrate=int(5e6),
+                lanes=self.spi_lanes,
             ),
             stepper_cs=16,  # enable pin stepper motors
             clk=dict(
@@ -382,6 +546,7 @@ class PlatformConfig:
                 reset=43,
                 done=44,
                 mem_full=1,
+                fifo_low=7,  # low-watermark pin, None if not routed
             ),
             device="/dev/ttyACM0",
         )
@@ -407,13 +572,20 @@ class PlatformConfig:
         cfg = dict(
             single_line=False,
             motor_freq=1e6,  # motor move interpolation freq in Hz
-            move_ticks=10_000,  # maximum ticks in move segment
+            move_ticks=(1 << 20) - 1,  # maximum ticks in move segment, ~1 s
             direction=0,  # axis parallel to laser, here x
             motors=len(self.motor_cfg["steps_mm"]),
             motor_divider=pow(2, 8),
-            pol_degree=2,
+            pol_degree=self.pol_degree,
             mem_width=Spi.word_bytes * 8,
-            words_scanline=Spi.words_scanline(laz_tim),
+            fifo_memory=self.fifo_memory,
+            spi_lanes=self.spi_lanes,
+            laser_channels=self.laser_channels,
+            laser_bits=self.laser_bits,
+            words_scanline=Spi.words_scanline(
+                laz_tim, self.laser_channels, self.laser_bits
+            ),
+            words_facet_stats=Spi.words_facet_stats(laz_tim),
             motor_debug="ticks_in_facet",
         )
         if self.test:
@@ -421,18 +593,28 @@ class PlatformConfig:
                 dict(
                     test=True,
                     lines_chunk=2,
+                    move_ticks=10_000,  # keeps simulations short
                 )
             )
         else:
-            mem_depth = int((114 * 1000) / (Spi.word_bytes * 8))
+            if self.fifo_memory == "spram":
+                # SPRAM 1 Mbit, 4 blocks of 16384 x 16 bit,
+                # the FIFO keeps one word free
+                mem_depth = 16384 - 1
+            else:
+                # listed max 120 kbit, practical 114 kbit
+                # you use EBR / sysMEM (Block RAM) 120 kbit
+                mem_depth = int((114 * 1000) / (Spi.word_bytes * 8))
             cfg.update(
                 dict(
                     test=False,
-                    # listed max 120 kbit, practical 114 kbit
-                    # you use EBR / sysMEM (Block RAM) 120 kbit
                     mem_depth=mem_depth,
                 )
             )
+            if self.laser_channels == 2 and self.fifo_memory != "spram":
+                raise ValueError("Two laser channels require fifo_memory 'spram'")
+            if self.laser_bits > 1 and self.fifo_memory != "spram":
+                raise ValueError("Grayscale exposure requires fifo_memory 'spram'")
             lines_in_mem = int(cfg["mem_depth"] / cfg["words_scanline"])
             lines_per_sec = laz_tim["rpm"] * laz_tim["facets"] / 60
             cfg["lines_chunk"] = 50
@@ -456,9 +638,11 @@ class PlatformConfig:
         return self._hdl_cfg
 
     def _init_motor_cfg(self):
-        """Returns the steps per mm and axis orthogonal to laserline."""
+        """Returns the steps per mm, axis orthogonal to laserline and the
+        acceleration (mm/s^2) and jerk (mm/s^3) limits of S-curve moves."""
 
         if self.test:
+            acceleration, jerk = 10_000, 2e6
             steps = OrderedDict([("x", 400), ("y", 400)])
             offset_mm = OrderedDict(
                 [
@@ -468,6 +652,7 @@ class PlatformConfig:
                 ]
             )
         else:
+            acceleration, jerk = 2_000, 2e5
             # offset mm and steps are overwritten by esp32_hexastorm!
             steps = OrderedDict(
                 [
@@ -488,6 +673,8 @@ class PlatformConfig:
             steps_mm=steps,
             offset_mm=offset_mm,
             orth2lsrline="x",
+            acceleration=acceleration,
+            jerk=jerk,
         )
 
     def update_laser_timing(self):
@@ -535,6 +722,7 @@ class PlatformConfig:
 
         scanline_length = round(facet_ticks * (end_frac - start_frac) / laser_ticks)
         motor_period = int(crystal_hz / (poly_hz * 6 * 2))
+        start_ticks = int(start_frac * facet_ticks)
 
         # Sanity checks
         assert laser_ticks > 2
@@ -564,11 +752,65 @@ class PlatformConfig:
                 "jitter_exp_perc": jitter_exp_perc,
                 "scanline_length": scanline_length,
                 "motor_period": motor_period,
+                "start_ticks": start_ticks,
                 "photodiode_trigger_ticks": pd_trigger_ticks,
                 "photodiode_rearm_ticks": pd_rearm_ticks,
+                # maximums of the runtime registers, see set_laser_timing
+                "max_laser_ticks": 4 * laser_ticks,
+                "max_scanline_length": scanline_length,
+                "max_start_ticks": 2 * facet_ticks,
+                "max_facet_ticks": 2 * facet_ticks,
+                "max_motor_period": 2 * motor_period,
             }
         )
 
+    def set_laser_timing(self, **timing):
+        """
+        Change the laser timing of a built bitstream.
+
+        The timing is given as for update_laser_timing, e.g. a lower laser_hz
+        halves the resolution of a draft job. The laserhead takes the values
+        of Spi.laser_timing_registers at runtime. These are limited by the
+        maximums of the build, the other timing, e.g. the synchronization
+        jitter and spin-up time, keeps the value of the build.
+
+        Returns:
+            list[int]: values of the laserhead registers
+
+        Raises:
+            ValueError: timing exceeds the maximums of the build
+        """
+        laz_tim = self.laser_timing
+        previous = dict(laz_tim)
+        build = {
+            key: previous[key]
+            for key in (
+                "crystal_hz",
+                "spinup_ticks",
+                "stable_ticks",
+                "jitter_sync_ticks",
+                "photodiode_trigger_ticks",
+                "photodiode_rearm_ticks",
+            )
+        }
+        build.update({key: value for key, value in previous.items() if "max_" in key})
+        laz_tim.update(timing)
+        try:
+            self.update_laser_timing()
+            laz_tim.update(build)
+            registers = [laz_tim[name] for name in Spi.laser_timing_registers]
+            for name, value in zip(Spi.laser_timing_registers, registers):
+                if not 0 < value <= laz_tim[f"max_{name}"]:
+                    raise ValueError(
+                        f"{name} must be between 1 and {laz_tim[f'max_{name}']}"
+                    )
+        except Exception:
+            # keep the dictionary, it is shared with the host
+            laz_tim.clear()
+            laz_tim.update(previous)
+            raise
+        return registers
+
 
 def getmovedct(platform):
     dct = Spi.move_instruction
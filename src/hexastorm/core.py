@@ -5,7 +5,7 @@ from .config import Spi
 from .spi_helpers import connect_synchronized_spi
 from .lasers import DiodeSimulator, Laserhead
 from .luna.spi import SPICommandInterface
-from .luna.memory import TransactionalizedFIFO
+from .luna.memory import SPRAMTransactionalizedFIFO, TransactionalizedFIFO
 from .pwm import HardwarePWM
 
 # from .motor import Driver
@@ -17,11 +17,18 @@ class SPIParser(Elaboratable):
 
     Supported commands:
         - status   : Return state (parsing, fifo full, error) + pin states
+                     + space available in the FIFO
         - start    : Enable parsing (process FIFO)
         - stop     : Disable parsing
-        - write    : Write instruction to FIFO
+        - write    : Write instruction to FIFO, the number of words depends on
+                     the instruction and for compressed scanlines on its header
         - read     : Return system state (used with status)
         - debug    : Return debug word
+        - burst    : Write several words after a single command byte, the
+                     number of words is encoded in the command byte
+        - watermark: Set the FIFO low-watermark, in words of space available
+        - facet_stats: Return the facet period statistics, a word per word
+                     received, and clear them
 
     Interface:
         Inputs:
@@ -31,10 +38,15 @@ class SPIParser(Elaboratable):
             - read_commit, read_en, read_discard : FIFO control
             - error_dispatch : Error detected in dispatcher
             - word_to_send  : Debug word to send
+            - stats_word    : Facet statistics word at stats_index
         Outputs:
             - parse        : Processing FIFO
+            - fifo_low     : Space available exceeds the low-watermark
             - read_data    : FIFO output
             - empty        : FIFO empty flag
+            - stats_index  : Facet statistics word to send
+            - stats_hold   : Keep the facet statistics stable while read
+            - stats_clear  : Clear the facet statistics after the read
     """
 
     def __init__(self, hdl_cfg):
@@ -44,18 +56,28 @@ class SPIParser(Elaboratable):
         self.hdl_cfg = hdl_cfg
 
         self.spi_command = SPICommandInterface(
-            command_size=Spi.command_bytes * 8, word_size=Spi.word_bytes * 8
+            command_size=Spi.command_bytes * 8,
+            word_size=Spi.word_bytes * 8,
+            lanes=hdl_cfg.spi_lanes,
         )
         self.pin_state = Signal(8)
         self.fifo_full = Signal()
-        self.fifo = TransactionalizedFIFO(
-            width=hdl_cfg.mem_width, depth=hdl_cfg.mem_depth
-        )
+        self.fifo_low = Signal()
+        if hdl_cfg.fifo_memory == "spram":
+            fifo_type = SPRAMTransactionalizedFIFO
+        else:
+            fifo_type = TransactionalizedFIFO
+        self.fifo = fifo_type(width=hdl_cfg.mem_width, depth=hdl_cfg.mem_depth)
 
         self.error_other = Signal()
         self.debug_word = Signal(hdl_cfg.mem_width)
         self.parse = Signal()
 
+        self.stats_word = Signal(hdl_cfg.mem_width)
+        self.stats_index = Signal(range(hdl_cfg.words_facet_stats + 1))
+        self.stats_hold = Signal()
+        self.stats_clear = Signal()
+
     def elaborate(self, platform):
         m = Module()
         hdl_cfg = self.hdl_cfg
@@ -68,13 +90,16 @@ class SPIParser(Elaboratable):
             connect_synchronized_spi(m, board_spi, spi_cmd)
             m.submodules += [
                 fifo_full_buf := Buffer("o", board_spi.fifo_full),
+                fifo_low_buf := Buffer("o", board_spi.fifo_low),
             ]
             m.d.comb += [
                 fifo_full_buf.o.eq(self.fifo_full),
+                fifo_low_buf.o.eq(self.fifo_low),
             ]
 
         # Internal state
         state = Signal(8)
+        space = Signal(16)
 
         words_rec = Signal(
             range(
@@ -86,6 +111,28 @@ class SPIParser(Elaboratable):
         )
         instr_rec = Signal(8)
         error_word = Signal()
+        # data words of a run-length encoded scanline, taken from its header
+        header = Spi.scanline_header
+        words_start = 8 + header["direction"] + header["half_period"]
+        rle_words = Signal(header["words"])
+        # words of a raw scanline, follows the scanline length set by
+        # laser_timing instructions, see Spi.words_scanline
+        words_scanline = Signal(
+            range(hdl_cfg.words_scanline + 1), init=hdl_cfg.words_scanline
+        )
+        word_shift = (Spi.word_bytes * 8).bit_length() - 1
+        scanline_length = Spi.laser_timing_registers.index("scanline_length")
+        # words left in the current burst, including the word being received
+        assert hdl_cfg.words_facet_stats <= Spi.burst_words
+        burst_left = Signal(range(Spi.burst_words + 1))
+        m.d.comb += spi_cmd.word_follows.eq(burst_left > 1)
+        with m.If(spi_cmd.idle):
+            m.d.sync += burst_left.eq(0)
+        with m.Elif(spi_cmd.word_complete & (burst_left != 0)):
+            m.d.sync += burst_left.eq(burst_left - 1)
+
+        # by default fifo_low is the inverse of fifo_full
+        watermark = Signal.like(fifo.space_available, init=hdl_cfg.space_available)
 
         status = Spi.State
 
@@ -98,7 +145,9 @@ class SPIParser(Elaboratable):
             state[status.full].eq(fifo.space_available <= hdl_cfg.space_available),
             state[status.error].eq(self.error_other | error_word),
             state[status.empty].eq(fifo.empty),
+            space.eq(fifo.space_available),
             self.fifo_full.eq(fifo.space_available <= hdl_cfg.space_available),
+            self.fifo_low.eq(fifo.space_available > watermark),
         ]
 
         with m.FSM(name="parser", init="RESET"):
@@ -112,7 +161,7 @@ class SPIParser(Elaboratable):
 
             with m.State("WAIT_COMMAND"):
                 with m.If(spi_cmd.command_ready):
-                    state_word = Cat(state, self.pin_state)
+                    state_word = Cat(state, self.pin_state, space)
                     cmd = Spi.Commands
                     with m.Switch(spi_cmd.command):
                         with m.Case(cmd.empty):
@@ -129,26 +178,79 @@ class SPIParser(Elaboratable):
                         with m.Case(cmd.write):
                             m.d.sync += spi_cmd.word_to_send.eq(state_word)
                             m.next = "WAIT_WORD"
+                        with m.Case("1-------"):
+                            # burst, the words are handled like writes
+                            m.d.sync += [
+                                spi_cmd.word_to_send.eq(state_word),
+                                burst_left.eq(spi_cmd.command[:7] + 1),
+                            ]
+                            m.next = "WAIT_WORD"
                         with m.Case(cmd.read):
                             m.d.sync += spi_cmd.word_to_send.eq(state_word)
                             m.next = "WAIT_COMMAND"
                         with m.Case(cmd.debug):
                             m.d.sync += spi_cmd.word_to_send.eq(self.debug_word)
                             m.next = "WAIT_COMMAND"
+                        with m.Case(cmd.watermark):
+                            m.d.sync += spi_cmd.word_to_send.eq(state_word)
+                            m.next = "WAIT_WATERMARK"
+                        with m.Case(cmd.facet_stats):
+                            # the words are sent like a burst
+                            m.d.comb += self.stats_hold.eq(1)
+                            m.d.sync += [
+                                spi_cmd.word_to_send.eq(self.stats_word),
+                                self.stats_index.eq(1),
+                                burst_left.eq(hdl_cfg.words_facet_stats),
+                            ]
+                            m.next = "SEND_STATS"
+
+            # the next word is loaded once the current word is latched
+            with m.State("SEND_STATS"):
+                m.d.comb += self.stats_hold.eq(1)
+                m.d.sync += spi_cmd.word_to_send.eq(self.stats_word)
+                with m.If(burst_left == 0):
+                    m.d.comb += self.stats_clear.eq(1)
+                    m.d.sync += self.stats_index.eq(0)
+                    m.next = "WAIT_COMMAND"
+                with m.Elif(spi_cmd.word_complete):
+                    m.d.sync += self.stats_index.eq(self.stats_index + 1)
+
+            with m.State("WAIT_WATERMARK"), m.If(spi_cmd.word_complete):
+                m.d.sync += watermark.eq(spi_cmd.word_received)
+                m.next = "WAIT_COMMAND"
 
             with m.State("WAIT_WORD"):
                 with m.If(spi_cmd.word_complete):
                     byte0 = spi_cmd.word_received[:8]
                     with m.If(words_rec == 0):
-                        valid_instr = (byte0 > 0) & (byte0 <= 6)
-                        with m.If(valid_instr):
+                        rle_field = spi_cmd.word_received[
+                            words_start : words_start + header["words"]
+                        ]
+                        # a compressed line must be shorter than a raw line
+                        valid_rle = (rle_field > 0) & (rle_field < words_scanline)
+                        valid_instr = (byte0 > 0) & (byte0 <= 10)
+                        with m.If(
+                            valid_instr
+                            & ((byte0 != Spi.Instructions.rle_scanline) | valid_rle)
+                        ):
                             m.d.sync += [
                                 instr_rec.eq(byte0),
+                                rle_words.eq(rle_field),
                                 fifo.write_en.eq(1),
                                 fifo.write_data.eq(spi_cmd.word_received),
                                 words_rec.eq(words_rec + 1),
                             ]
                             m.next = "WRITE"
+                            with m.If(
+                                (byte0 == Spi.Instructions.laser_timing)
+                                & (spi_cmd.word_received[8:16] == scanline_length)
+                            ):
+                                bits = spi_cmd.word_received[16:] * (
+                                    hdl_cfg.laser_channels * hdl_cfg.laser_bits
+                                )
+                                m.d.sync += words_scanline.eq(
+                                    1 + ((bits + Spi.word_bytes * 8 - 1) >> word_shift)
+                                )
                         with m.Else():
                             # Invalid instruction → mark error and discard
                             m.d.sync += error_word.eq(1)
@@ -171,25 +273,31 @@ class SPIParser(Elaboratable):
 
                 m.d.comb += ready_to_commit.eq(
                     ((instr_rec == instr.move) & (words_rec == hdl_cfg.words_move))
-                    | (
-                        (instr_rec == instr.scanline)
-                        & (words_rec == hdl_cfg.words_scanline)
-                    )
+                    | ((instr_rec == instr.scanline) & (words_rec == words_scanline))
+                    | ((instr_rec == instr.rle_scanline) & (words_rec == rle_words + 1))
                     | (instr_rec == instr.write_pin)
                     | (instr_rec == instr.last_scanline)
                     | (instr_rec == instr.set_fan)
                     | (instr_rec == instr.set_spindle)
+                    | (instr_rec == instr.facet_mask)
+                    | (instr_rec == instr.facet_offset)
+                    | (instr_rec == instr.laser_timing)
                 )
 
                 with m.If(ready_to_commit):
                     m.d.sync += [words_rec.eq(0), fifo.write_commit.eq(1)]
                     m.next = "COMMIT"
+                with m.Elif(burst_left != 0):
+                    m.next = "WAIT_WORD"
                 with m.Else():
                     m.next = "WAIT_COMMAND"
 
             with m.State("COMMIT"):
                 m.d.sync += fifo.write_commit.eq(0)
-                m.next = "WAIT_COMMAND"
+                with m.If(burst_left != 0):
+                    m.next = "WAIT_WORD"
+                with m.Else():
+                    m.next = "WAIT_COMMAND"
         return m
 
 
@@ -197,6 +305,12 @@ class Dispatcher(Elaboratable):
     """
     Top-level unit that *parses* the instruction FIFO and *dispatches* the work
     either to the laser-head or to the polynomial motion controller.
+
+    A move is parsed into the preload bank of the polynomial while the previous
+    move runs, consecutive moves are thus executed without a gap. Any other
+    instruction waits until the motion has finished. Facet mask, facet offset
+    and laser timing instructions are written to the laserhead directly, only
+    scanlines start the laserhead.
     """
 
     def __init__(self, plf_cfg):
@@ -262,6 +376,10 @@ class Dispatcher(Elaboratable):
             lh.enable_prism_in.eq(enable_prism),
             lh.lasers_in.eq(lasers),
             parser.debug_word.eq(lh.facet_period_ticks),
+            parser.stats_word.eq(lh.facet_stats.word),
+            lh.facet_stats.index.eq(parser.stats_index),
+            lh.facet_stats.hold.eq(parser.stats_hold),
+            lh.facet_stats.clear.eq(parser.stats_clear),
         ]
 
         # connect Parser
@@ -289,7 +407,7 @@ class Dispatcher(Elaboratable):
             parser.pin_state[len(poly.steppers) :].eq(
                 Cat(lh.photodiode_t, lh.synchronized)
             ),
-            busy.eq(poly.busy | lh.process_lines),
+            busy.eq(poly.busy | poly.pending | lh.process_lines),
         ]
 
         # pins you can write to
@@ -307,7 +425,12 @@ class Dispatcher(Elaboratable):
 
             with m.State("WAIT_INSTRUCTION"):
                 m.d.sync += [read_commit.eq(0), poly.start.eq(0)]
-                with m.If(~parser.fifo.empty & parser.parse & ~busy):
+                with m.If(
+                    ~parser.fifo.empty
+                    & parser.parse
+                    & ~lh.process_lines
+                    & ~poly.pending
+                ):
                     m.d.sync += read_en.eq(1)
                     m.next = "PARSE_HEAD"
 
@@ -317,8 +440,13 @@ class Dispatcher(Elaboratable):
                 payload = parser.fifo.read_data[8:]
                 m.d.sync += read_en.eq(0)
 
-                with m.Switch(instruction):
-                    instr = Spi.Instructions
+                instr = Spi.Instructions
+
+                # only a move can be preloaded while the polynomial runs
+                with m.If((instruction != instr.move) & poly.busy):
+                    m.d.sync += read_discard.eq(1)
+                    m.next = "WAIT_MOVE"
+                with m.Else(), m.Switch(instruction):
                     with m.Case(instr.move):
                         m.d.sync += [
                             poly.tick_limit.eq(payload),
@@ -331,7 +459,21 @@ class Dispatcher(Elaboratable):
                             read_commit.eq(1),
                         ]
                         m.next = "WAIT"
-                    with m.Case(instr.scanline, instr.last_scanline):
+                    # no lines are processed, the laserhead takes the
+                    # configuration without waiting for a facet
+                    with m.Case(
+                        instr.facet_mask,
+                        instr.facet_offset,
+                        instr.laser_timing,
+                    ):
+                        m.d.comb += lh.write_config.eq(1)
+                        m.d.sync += read_commit.eq(1)
+                        m.next = "WAIT"
+                    with m.Case(
+                        instr.scanline,
+                        instr.rle_scanline,
+                        instr.last_scanline,
+                    ):
                         m.d.sync += [
                             read_discard.eq(1),
                             lh.synchronize.eq(1),
@@ -372,6 +514,12 @@ class Dispatcher(Elaboratable):
                         read_en.eq(0),
                     ]
 
+            # instruction is parsed again once the motion has finished
+            with m.State("WAIT_MOVE"):
+                m.d.sync += read_discard.eq(0)
+                with m.If(~poly.busy):
+                    m.next = "WAIT_INSTRUCTION"
+
             with m.State("SCANLINE"):
                 m.d.sync += [
                     read_discard.eq(0),
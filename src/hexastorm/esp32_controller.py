@@ -1,8 +1,16 @@
+import logging
 import serial
 import time
 import textwrap
 import inspect
 import ast
+from binascii import crc32
+from pathlib import Path
+from struct import pack, unpack
+
+from . import rpc
+
+logger = logging.getLogger(__name__)
 
 
 class ESP32RemoteError(Exception):
@@ -12,22 +20,64 @@ class ESP32RemoteError(Exception):
 
 
 class ESP32Controller:
-    def __init__(self, port="/dev/ttyACM0", baud=115200, timeout=2.0):
+    """
+    Executes code on an ESP32 running MicroPython via its raw REPL.
+
+    Two modes are available.
+
+    exec_wait, exec_no_wait, exec_func
+        Source is sent and compiled on every call, results are parsed from
+        printed output.
+    call, submit, result
+        RPC mode, see :mod:`hexastorm.rpc`. Functions are uploaded once into a
+        registry on the board and called with compact binary frames.
+        Calls can be pipelined; up to ``rpc_window`` calls are in flight.
+
+    Using exec_* while the RPC loop runs stops it, the next call restarts it.
+    The registry and the globals of the REPL are retained.
+    """
+
+    def __init__(
+        self,
+        port="/dev/ttyACM0",
+        baud=115200,
+        timeout=2.0,
+        rpc_timeout=60.0,
+        rpc_window=8,
+    ):
         self.serial = serial.Serial(port, baud, timeout=timeout, write_timeout=timeout)
+        self.rpc_timeout = rpc_timeout
+        self.rpc_window = rpc_window
+        self._repl_ready = False
+        self._rpc_loaded = False
+        self._rpc_running = False
+        self._registered = {}
+        self._pending = set()
+        self._results = {}
+        self._seq = 0
         self._ensure_raw_repl()
 
     def close(self):
         if self.serial.is_open:
+            if self._rpc_running:
+                self.stop_rpc()
             self.serial.close()
 
     def stop(self):
         """
         Sends Ctrl-C to interrupt the running program.
+
+        Note that Ctrl-C is disabled while the RPC loop runs, use stop_rpc.
         """
         self.serial.write(b"\r\x03")
+        self._repl_ready = False
         time.sleep(0.1)
 
     def _ensure_raw_repl(self):
+        if self._rpc_running:
+            self.stop_rpc()
+        if self._repl_ready:
+            return
         self.serial.reset_input_buffer()
         for _ in range(3):
             self.serial.write(b"\r\x03")  # Ctrl-C
@@ -39,6 +89,7 @@ class ESP32Controller:
                 if self.serial.in_waiting:
                     data = self.serial.read(self.serial.in_waiting)
                     if b"raw REPL" in data and data.strip().endswith(b">"):
+                        self._repl_ready = True
                         return
                 time.sleep(0.05)
         raise RuntimeError("Could not connect to ESP32 REPL.")
@@ -52,6 +103,7 @@ class ESP32Controller:
         cmd_bytes = textwrap.dedent(command).encode("utf-8")
         self.serial.write(cmd_bytes)
         self.serial.write(b"\x04")
+        self._repl_ready = False
 
         ret = self.serial.read_until(b"OK")
         if b"OK" not in ret:
@@ -61,21 +113,24 @@ class ESP32Controller:
                 )
             raise RuntimeError(f"ESP32 stuck or timed out. Got: {ret}")
 
+        output, err = self._read_completion()
+        if err.strip():
+            decoded_err = err.decode(errors="replace").strip()
+            raise ESP32RemoteError(decoded_err)
+
+        return output.decode(errors="replace").strip()
+
+    def _read_completion(self):
+        """Read output and error of a finished raw REPL command."""
         output = self.serial.read_until(b"\x04")
         if not output.endswith(b"\x04"):
             raise RuntimeError(f"Timeout waiting for output. partial: {output}")
-        output = output[:-1]
-
         err = self.serial.read_until(b"\x04")
         if not err.endswith(b"\x04"):
             raise RuntimeError("Timeout waiting for error code.")
-        err = err[:-1]
-
-        if err.strip():
-            decoded_err = err.decode(errors="replace").strip()
-            raise ESP32RemoteError(decoded_err)
-
-        return output.decode(errors="replace").strip()
+        # raw REPL prompts for the next command with ">"
+        self._repl_ready = self.serial.read(1) == b">"
+        return output[:-1], err[:-1]
 
     def exec_no_wait(self, command):
         """
@@ -85,6 +140,7 @@ class ESP32Controller:
         cmd_bytes = textwrap.dedent(command).encode("utf-8")
         self.serial.write(cmd_bytes)
         self.serial.write(b"\x04")
+        self._repl_ready = False
 
         ret = self.serial.read_until(b"OK")
         if b"OK" not in ret:
@@ -141,3 +197,189 @@ class ESP32Controller:
                 )
         else:
             self.exec_no_wait(full_command)
+
+    def start_rpc(self):
+        """
+        Start the RPC request loop on the board.
+
+        The protocol module is uploaded once per connection.
+        """
+        if self._rpc_running:
+            return
+        if not self._rpc_loaded:
+            source = inspect.getsource(rpc)
+            self.exec_wait(f"_hs_rpc = {{}}\nexec({source!r}, _hs_rpc)")
+            self._rpc_loaded = True
+        self.exec_no_wait("_hs_rpc['serve'](globals())")
+        self._rpc_running = True
+        kind, _, _ = self._read_frame(self.serial.timeout)
+        if kind != rpc.READY:
+            self._rpc_running = False
+            raise RuntimeError("RPC loop did not start on the ESP32.")
+
+    def stop_rpc(self):
+        """Stop the RPC request loop, the raw REPL becomes available."""
+        if not self._rpc_running:
+            return
+        while self._pending:
+            self._read_result()
+        self.serial.write(rpc.frame(rpc.STOP, 0))
+        kind, _, _ = self._read_frame(self.serial.timeout)
+        self._rpc_running = False
+        if kind != rpc.STOP:
+            raise RuntimeError("RPC loop did not acknowledge stop.")
+        _, err = self._read_completion()
+        if err.strip():
+            raise ESP32RemoteError(err.decode(errors="replace").strip())
+
+    def register(self, func):
+        """
+        Define a function in the registry on the board.
+
+        The source is only sent again if it changed.
+
+        :param func: The local function object.
+        :return: name under which the function is registered
+        """
+        name = func.__name__
+        source = textwrap.dedent(inspect.getsource(func))
+        if self._registered.get(name) == source:
+            return name
+        self.start_rpc()
+        self.result(self._send(rpc.DEFINE, [name, source]))
+        self._registered[name] = source
+        return name
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a call without waiting for the result.
+
+        :param func: Function object, registered if needed, or registry name.
+        :return: sequence number, pass it to :meth:`result`
+        """
+        name = func if isinstance(func, str) else self.register(func)
+        self.start_rpc()
+        # bound the calls in flight so neither side blocks on a full buffer
+        while len(self._pending) >= self.rpc_window:
+            self._read_result()
+        return self._send(rpc.CALL, [name, list(args), kwargs])
+
+    def result(self, seq, timeout=None):
+        """
+        Wait for the result of a submitted call.
+
+        :raises ESP32RemoteError: if the call raised on the board
+        """
+        while seq not in self._results:
+            if seq not in self._pending:
+                raise KeyError(f"No call pending with sequence {seq}.")
+            self._read_result(timeout)
+        kind, value = self._results.pop(seq)
+        if kind == rpc.ERROR:
+            raise ESP32RemoteError(value.strip())
+        return value
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call a function on the board and return its result.
+
+        Unlike exec_func, arguments are positional or keyword and the return
+        value is transferred in binary; bytes are not converted to text.
+        """
+        return self.result(self.submit(func, *args, **kwargs))
+
+    def put_file(self, local, remote, chunk_size=16384, window=4, resume=True):
+        """
+        Transfer a file to the board, e.g. a pattern to the SD card.
+
+        Chunks are sent as binary DATA frames with a crc32 each. Up to
+        ``window`` chunks are unacknowledged; a rejected chunk is resent with
+        all chunks after it. If resume is set and the remote file starts with
+        the same data, only the remainder is sent.
+
+        :param local: Path of the local file.
+        :param remote: Path on the board.
+        :return: dict with bytes sent, resume offset, retries, seconds and MB/s
+        """
+        data = Path(local).read_bytes()
+        start = time.perf_counter()
+        offset, crc = self.call("file_open", remote, resume)
+        if offset > len(data) or (offset and crc32(data[:offset]) != crc):
+            offset, crc = self.call("file_open", remote, False)
+        resumed = sent = offset
+        retries = 0
+        in_flight = set()
+        while offset < len(data):
+            while sent < len(data) and len(in_flight) < window:
+                chunk = data[sent : sent + chunk_size]
+                header = pack(">II", sent, crc32(chunk))
+                self._seq = (self._seq + 1) & 0xFFFF
+                self.serial.write(rpc.frame(rpc.DATA, self._seq, header + chunk))
+                in_flight.add(self._seq)
+                sent += len(chunk)
+            kind, seq, payload = self._read_frame(self.rpc_timeout)
+            in_flight.discard(seq)
+            if kind == rpc.ERROR:
+                raise ESP32RemoteError(rpc.decode(payload).strip())
+            if kind == rpc.ACK:
+                offset = unpack(">I", payload)[0]
+            elif kind == rpc.NAK:
+                # chunks in flight are rejected as well, go back to offset
+                retries += 1
+                while in_flight:
+                    _, seq, _ = self._read_frame(self.rpc_timeout)
+                    in_flight.discard(seq)
+                offset = sent = unpack(">I", payload)[0]
+            else:
+                raise RuntimeError(f"Unexpected RPC frame kind {kind}.")
+        size, crc = self.call("file_close")
+        if size != len(data) or crc != crc32(data):
+            raise RuntimeError(f"Transfer of {remote} failed verification.")
+        seconds = time.perf_counter() - start
+        stats = {
+            "bytes": len(data) - resumed,
+            "resumed_from": resumed,
+            "retries": retries,
+            "seconds": seconds,
+            "mb_per_s": (len(data) - resumed) / seconds / 1e6,
+        }
+        logger.info(f"Sent {remote} at {stats['mb_per_s']:.3f} MB/s")
+        return stats
+
+    def _send(self, kind, value):
+        self._seq = (self._seq + 1) & 0xFFFF
+        self.serial.write(rpc.frame(kind, self._seq, rpc.encode(value)))
+        self._pending.add(self._seq)
+        return self._seq
+
+    def _read_result(self, timeout=None):
+        kind, seq, payload = self._read_frame(
+            self.rpc_timeout if timeout is None else timeout
+        )
+        if kind not in (rpc.RESULT, rpc.ERROR) or seq not in self._pending:
+            raise RuntimeError(f"Unexpected RPC frame kind {kind}, sequence {seq}.")
+        self._pending.discard(seq)
+        self._results[seq] = (kind, rpc.decode(payload))
+
+    def _read_exact(self, nbytes, deadline):
+        data = b""
+        while len(data) < nbytes:
+            if time.time() > deadline:
+                raise TimeoutError(f"Timeout waiting for RPC data. partial: {data}")
+            data += self.serial.read(nbytes - len(data))
+        return data
+
+    def _read_frame(self, timeout):
+        """Read next frame, printed output before it is logged."""
+        deadline = time.time() + timeout
+        skipped = bytearray()
+        while skipped[-2:] != rpc.MAGIC:
+            skipped += self._read_exact(1, deadline)
+        if len(skipped) > 2:
+            text = skipped[:-2].decode(errors="replace").strip()
+            if text:
+                logger.info(f"ESP32: {text}")
+        kind, seq, length = unpack(
+            rpc.HEADER, self._read_exact(rpc.HEADER_BYTES, deadline)
+        )
+        return kind, seq, self._read_exact(length, deadline)
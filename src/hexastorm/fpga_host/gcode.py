@@ -0,0 +1,241 @@
+"""
+Streaming G-code interpreter for the FPGA host.
+
+Lines are translated into FIFO instructions (move, fan, spindle) which are
+accumulated in a buffer and sent in large SPI batches. Commands do not wait
+for completion; the FPGA FIFO is kept full and back-pressure is handled by
+``send_command(..., timeout=True)`` which only blocks on ``mem_full``.
+
+Supported subset:
+    G0/G1 X Y Z F   linear move, F in mm/min (modal), an S-curve if pol_degree is 3
+    G28 [X Y Z]     home axes (all axes if none given)
+    G90 / G91       absolute / relative positioning
+    M3 [S]          spindle on (S 0-255)
+    M5              spindle off
+    M106 [S]        fan on (S 0-255)
+    M107            fan off
+"""
+
+import logging
+
+try:
+    from time import ticks_diff, ticks_ms
+except ImportError:
+    from time import perf_counter
+
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+from ..config import Spi
+
+try:
+    import numpy as np
+
+    NP_FLOAT = float
+except ImportError:
+    from ulab import numpy as np
+
+    NP_FLOAT = np.float
+
+logger = logging.getLogger(__name__)
+
+
+class GCodeInterpreter:
+    """
+    Translate a stream of G-code lines into batched FPGA FIFO instructions.
+
+    Args:
+        host (BaseHost): Host used to communicate with the FPGA.
+        batch_words (int): Number of SPI words sent per transaction. Defaults to
+            the FIFO reserve (``hdl_cfg.space_available``); this is the amount
+            guaranteed to fit once ``mem_full`` is deasserted.
+        feedrate (float): Default feedrate in mm/min, used until an F word is seen.
+
+    Usage:
+        gcode = GCodeInterpreter(host)
+        await gcode.run(open("job.gcode"))
+        print(gcode.stats)
+    """
+
+    COMMENT_CHARS = (";", "(")
+
+    def __init__(self, host, batch_words=None, feedrate=600.0):
+        self.host = host
+        hdl_cfg = host.cfg.hdl_cfg
+        if batch_words is None:
+            batch_words = hdl_cfg.space_available
+        self.batch_bytes = max(1, batch_words) * (Spi.word_bytes + 1)
+        self.axes = list(host.cfg.motor_cfg["steps_mm"].keys())[: hdl_cfg.motors]
+        self.feedrate = feedrate
+        self.absolute = True
+        self._buffer = bytearray()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset throughput counters."""
+        self.stats = {
+            "lines": 0,
+            "moves": 0,
+            "skipped": 0,
+            "bytes": 0,
+            "batches": 0,
+            "elapsed_ms": 0,
+            "lines_per_sec": 0.0,
+        }
+        self._start = None
+
+    def _tokenize(self, line):
+        """Strip comments and split a line into (letter, value) words."""
+        for char in self.COMMENT_CHARS:
+            idx = line.find(char)
+            if idx >= 0:
+                line = line[:idx]
+        words = []
+        for token in line.upper().split():
+            letter, value = token[0], token[1:]
+            if letter == "N":
+                continue
+            # bare axis letters, e.g. "G28 X", carry no value
+            words.append((letter, float(value) if value else 0.0))
+        return words
+
+    async def execute(self, line):
+        """
+        Interpret a single G-code line.
+
+        Instructions are buffered and only sent once a full batch is available,
+        call :meth:`flush` to push the remainder.
+        """
+        if self._start is None:
+            self._start = ticks_ms()
+            await self.host.set_parsing(True)
+
+        words = self._tokenize(line)
+        self.stats["lines"] += 1
+        if not words:
+            return
+
+        letter, value = words[0]
+        code = int(value)
+        params = dict(words[1:])
+
+        if letter == "G" and code in (0, 1):
+            self._queue_move(params)
+        elif letter == "G" and code == 28:
+            await self._home(params)
+        elif letter == "G" and code == 90:
+            self.absolute = True
+        elif letter == "G" and code == 91:
+            self.absolute = False
+        elif letter == "M" and code == 3:
+            self._queue_speed("spindle", params.get("S", 255))
+        elif letter == "M" and code == 5:
+            self._queue_speed("spindle", 0)
+        elif letter == "M" and code == 106:
+            self._queue_speed("fan", params.get("S", 255))
+        elif letter == "M" and code == 107:
+            self._queue_speed("fan", 0)
+        else:
+            self.stats["skipped"] += 1
+            logger.warning(f"Unsupported G-code skipped: {line.strip()}")
+
+        if len(self._buffer) >= self.batch_bytes:
+            await self._send_batches(partial=False)
+
+    async def run(self, lines, wait=True):
+        """
+        Stream an iterable of lines (e.g. an open file) to the FPGA.
+
+        Args:
+            lines (iterable[str]): G-code lines.
+            wait (bool): If True, wait until the FPGA FIFO is drained.
+
+        Returns:
+            dict: Throughput statistics, see :attr:`stats`.
+        """
+        for line in lines:
+            await self.execute(line)
+        await self.flush()
+        if wait:
+            await self.host.wait_fifo_empty()
+        self._update_rate()
+        return self.stats
+
+    async def flush(self):
+        """Send all buffered instructions to the FPGA."""
+        await self._send_batches(partial=True)
+
+    async def _send_batches(self, partial):
+        size = self.batch_bytes
+        buf = self._buffer
+        offset = 0
+        while len(buf) - offset >= size or (partial and offset < len(buf)):
+            chunk = buf[offset : offset + size]
+            await self.host.send_command(chunk, timeout=True)
+            self.stats["bytes"] += len(chunk)
+            self.stats["batches"] += 1
+            offset += len(chunk)
+        self._buffer = buf[offset:]
+        self._update_rate()
+
+    def _update_rate(self):
+        if self._start is None:
+            return
+        elapsed = ticks_diff(ticks_ms(), self._start)
+        self.stats["elapsed_ms"] = elapsed
+        if elapsed > 0:
+            self.stats["lines_per_sec"] = self.stats["lines"] * 1000 / elapsed
+
+    def _queue_move(self, params):
+        """Append a coordinated linear move to the batch buffer."""
+        host = self.host
+        if "F" in params:
+            self.feedrate = params["F"]
+        if self.feedrate <= 0:
+            raise ValueError("Feedrate must be positive")
+
+        if self.absolute:
+            target = host._position.tolist()
+            offset = host._work_offset.tolist()
+            for idx, axis in enumerate(self.axes):
+                key = axis.upper()
+                if key in params:
+                    target[idx] = params[key] + offset[idx]
+            displacement = np.array(target) - host._position
+        else:
+            displacement = np.array(
+                [params.get(axis.upper(), 0.0) for axis in self.axes],
+                dtype=NP_FLOAT,
+            )
+
+        chunks = list(host._move_chunks(displacement, self.feedrate / 60))
+        if not chunks:
+            return
+        for _, payload in chunks:
+            self._buffer.extend(payload)
+        host._position += displacement
+        self.stats["moves"] += 1
+
+    def _queue_speed(self, device, speed):
+        """Append a fan or spindle instruction to the batch buffer."""
+        speed = max(0, min(255, int(speed)))
+        if device == "fan":
+            self.host._fan_speed = speed
+            instruction = Spi.Instructions.set_fan
+        else:
+            self.host._spindle_speed = speed
+            instruction = Spi.Instructions.set_spindle
+        self._buffer.extend(self.host._instruction_word(instruction, speed))
+
+    async def _home(self, params):
+        """Drain pending instructions and home the requested axes."""
+        axes = [1 if axis.upper() in params else 0 for axis in self.axes]
+        if not any(axes):
+            axes = [1] * len(self.axes)
+        await self.flush()
+        await self.host.wait_fifo_empty()
+        await self.host.home_axes(axes, speed=self.feedrate / 60)
@@ -1,9 +1,13 @@
 import sys
 import logging
 from asyncio import sleep
+from math import sqrt
 
 from .. import ulabext
 from ..config import Spi, PlatformConfig
+from .telemetry import Telemetry
+from . import rle
+from .scurve import SCurve, fit_segments
 
 try:
     import numpy as np
@@ -25,17 +29,31 @@ class BaseHost:
 
     Args:
         test (bool): If True, runs in test mode with virtual FPGA platform.
+        pol_degree (int): Polynomial order of the bitstream, with order 3
+            coordinated moves follow a jerk limited S-curve. Order 3 is only
+            supported in test mode, see PlatformConfig.
+        laser_channels (int): Laser channels driven by scanlines, with 2
+            channels the bits of a line are interleaved, see write_line.
+        laser_bits (int): Bits per pixel and channel, with 2 or 4 bits a line
+            holds grayscale levels, see bit_to_byte_list.
 
     In test mode, the object uses mock settings and disables MicroPython-specific code.
     """
 
-    def __init__(self, test=False):
+    def __init__(self, test=False, pol_degree=2, laser_channels=1, laser_bits=1):
         self.test = test
-        self.cfg = PlatformConfig(self.test)
+        self.cfg = PlatformConfig(
+            self.test,
+            # two channel and grayscale lines only fit in the single-port RAM
+            fifo_memory="spram" if laser_channels * laser_bits > 1 else "ebr",
+            pol_degree=pol_degree,
+            laser_channels=laser_channels,
+            laser_bits=laser_bits,
+        )
         # mpy requires np.float
         self._position = np.array(
-                [0] * self.cfg.hdl_cfg.motors, dtype=NP_FLOAT
-            )  # machine position
+            [0] * self.cfg.hdl_cfg.motors, dtype=NP_FLOAT
+        )  # machine position
 
         self._work_offset = np.array([0] * self.cfg.hdl_cfg.motors, dtype=NP_FLOAT)
 
@@ -47,6 +65,19 @@ class BaseHost:
         self._fan_speed = 0
         self._spindle_speed = 0
 
+        # counters and histograms, see telemetry.py
+        self.telemetry = Telemetry()
+
+        # run-length encode scanlines if this is smaller, see rle.py; off on
+        # MicroPython, where the runs are found a bit per loop in Python
+        self.compress_lines = sys.implementation.name != "micropython"
+
+        # send scanlines with burst commands, i.e. without a command per word
+        self.burst_writes = True
+
+        # facets enabled on the FPGA, all after a reset, None if unknown
+        self._facet_mask = (1 << self.cfg.laser_timing["facets"]) - 1
+
     async def send_command(self, command, timeout=0):
         """
         Send a command to the FPGA via SPI and return the response.
@@ -60,6 +91,38 @@ class BaseHost:
         """
         pass  # implemented in subclasses
 
+    def _record_send(self, nbytes, start):
+        """Record a finished SPI transaction started at telemetry.now()."""
+        telemetry = self.telemetry
+        telemetry.observe("send_latency_us", telemetry.since(start))
+        telemetry.count("commands")
+        telemetry.count("bytes_sent", nbytes)
+
+    def _record_mem_full(self, start):
+        """Record time blocked on mem_full, started at telemetry.now()."""
+        telemetry = self.telemetry
+        telemetry.observe("mem_full_wait_us", telemetry.since(start))
+        telemetry.count("mem_full_waits")
+
+    @property
+    def fifo_low(self):
+        """Level of the fifo_low pin, implemented in subclasses."""
+        pass
+
+    async def _wait_fifo_low(self, flag):
+        """
+        Wait until the fifo_low pin is high.
+
+        The flag is set at a rising edge of the pin, e.g. by its interrupt,
+        and offers clear and wait like a ThreadSafeFlag.
+        """
+        while not self.fifo_low:
+            flag.clear()
+            # the edge could have passed before the flag was cleared
+            if self.fifo_low:
+                break
+            await flag.wait()
+
     def _bitflag(self, byte, index):
         """Return True if the bit at 'index' in 'byte' is set (0 = LSB)."""
         return bool((byte >> index) & 1)
@@ -85,14 +148,56 @@ class BaseHost:
 
         return cmd_list
 
-    def bit_to_byte_list(self, laser_bits, steps_line=1, direction=0):
+    def byte_to_burst(self, byte_lst):
+        """
+        Converts a byte list into burst write commands.
+
+        A burst is a single command byte followed by up to Spi.burst_words
+        words, this saves a command byte per word.
+
+        Args:
+            bytelst (List[int]): List of bytes to send, a multiple of a word.
+
+        Returns:
+            bytes: SPI data with one or more bursts.
+        """
+        word_bytes = Spi.word_bytes
+        burst_bytes = Spi.burst_words * word_bytes
+        out_buffer = bytearray()
+
+        for i in range(0, len(byte_lst), burst_bytes):
+            chunk = byte_lst[i : i + burst_bytes]
+            words = len(chunk) // word_bytes
+            out_buffer.append(Spi.Commands.burst | (words - 1))
+            for j in range(0, len(chunk), word_bytes):
+                # Reverse in place for SPI endian behavior
+                out_buffer.extend(bytes(chunk[j : j + word_bytes][::-1]))
+
+        return bytes(out_buffer)
+
+    def _byte_to_commands(self, byte_lst):
+        """SPI data for a byte list, as burst if burst_writes is set."""
+        if self.burst_writes:
+            return self.byte_to_burst(byte_lst)
+        return b"".join(self.byte_to_cmd_list(byte_lst))
+
+    def bit_to_byte_list(
+        self, laser_bits, steps_line=1, direction=0, repeat=0, compress=None
+    ):
         """
         Convert a bit list into a padded byte list suitable for FPGA scanline commands.
 
         Args:
-            laser_bits (List[int]): Bits to write to the substrate (laser on/off).
+            laser_bits (List[int]): Bits to write to the substrate (laser on/off),
+                                    interleaved per pixel for two laser channels.
+                                    With grayscale exposure, these are levels
+                                    from 0 up to 2**cfg.laser_bits - 1.
             steps_line (int): Number of motor steps for the scanline. Must be > 0.
             direction (int): 0 for backward, 1 for forward.
+            repeat (int): Number of times the laserhead exposes the line again
+                          without it being resent.
+            compress (bool): Run-length encode bits if the line gets smaller,
+                             defaults to compress_lines.
 
         Returns:
             List[int]: Byte list ready to be packed into SPI commands.
@@ -101,15 +206,36 @@ class BaseHost:
         byteorder = "little"
         scanline_length = self.cfg.laser_timing["scanline_length"]
         half_period = int((scanline_length - 1) // (steps_line * 2))
+        level_bits = self.cfg.laser_bits
+        pixels = self.cfg.laser_channels * scanline_length
+        line_bits = pixels * level_bits
         if half_period < 1:
             raise ValueError("Steps per line cannot be achieved (period < 1)")
 
+        header = Spi.scanline_header
+        if half_period >= 1 << header["half_period"]:
+            raise ValueError("Steps per line too small")
+        if not 0 <= repeat < 1 << header["repeat"]:
+            raise ValueError(f"Repeat must be below {1 << header['repeat']}")
+
+        if compress is None:
+            compress = self.compress_lines
+        encoded = None
+        # run-length encoded lines drive a single laser channel
+        if compress and len(laser_bits) == scanline_length == line_bits:
+            encoded = rle.encode(laser_bits, Spi.words_scanline(self.cfg.laser_timing))
+
         # 2. Build Header using Bitwise Math
-        # The FPGA expects 56 bits: [55 bits for Ticks] + [1 bit for Direction]
+        # The FPGA expects 56 bits:
+        #     [1 bit Direction] + [Ticks] + [RLE words] + [Repeat]
         # In Little Endian, the Direction is the Least Significant Bit (LSB).
         # So we shift Ticks left by 1, and OR in the Direction.
 
-        payload_int = (half_period << 1) | (direction & 1)
+        words_shift = header["direction"] + header["half_period"]
+        repeat_shift = words_shift + header["words"]
+        payload_int = (repeat << repeat_shift) | (half_period << 1) | (direction & 1)
+        if encoded is not None:
+            payload_int |= rle.words(encoded) << words_shift
 
         # Convert integer to 7 bytes (56 bits), little endian
         payload_bytes = payload_int.to_bytes(7, byteorder)
@@ -121,6 +247,9 @@ class BaseHost:
         # Handle Empty/Stop Case
         if len(laser_bits) == 0:
             out_buffer.append(Spi.Instructions.last_scanline)
+        elif encoded is not None:
+            out_buffer.append(Spi.Instructions.rle_scanline)
+            out_buffer.extend(payload_bytes)
         else:
             out_buffer.append(Spi.Instructions.scanline)
             out_buffer.extend(payload_bytes)
@@ -134,12 +263,21 @@ class BaseHost:
             out_buffer.extend(b"\x00" * padding)
 
         # 4. Append Laser Data
-        if len(laser_bits) > 0:
+        if encoded is not None:
+            out_buffer.extend(encoded)
+        elif len(laser_bits) > 0:
+            # grayscale levels are sent least significant bit first
+            if level_bits > 1 and len(laser_bits) == pixels:
+                laser_bits = [
+                    (level >> bit) & 1
+                    for level in laser_bits
+                    for bit in range(level_bits)
+                ]
             # Case A: Input is raw bits (0, 1, 1, 0...) -> Pack them
-            if len(laser_bits) == scanline_length:
+            if len(laser_bits) == line_bits:
                 out_buffer.extend(ulabext.packbits(laser_bits, bitorder=byteorder))
             # Case B: Input is already bytes -> Just append
-            elif len(laser_bits) == scanline_length // 8:
+            elif len(laser_bits) == line_bits // 8:
                 out_buffer.extend(laser_bits)
             else:
                 raise ValueError(f"Invalid laser_bits length: {len(laser_bits)}")
@@ -160,6 +298,8 @@ class BaseHost:
 
         Args:
             bitlst (List[int]): Laser on/off bits. Empty list sends stop command.
+                                With two laser channels, bit 2i is pixel i of
+                                the first and bit 2i+1 of the second channel.
             stepsperline (int): Number of steps to move during scanline.
                                 To disable motion, turn off the motor separately.
             direction (int): 0 = backward, 1 = forward.
@@ -168,43 +308,139 @@ class BaseHost:
 
         Behavior:
             Converts the bit list into a sequence of commands and
-            sends them to the FPGA controller. Commands are repeated
-            for the specified number of repetitions.
+            sends them to the FPGA controller. Without a facet, the line is
+            sent once with a repeat count and replayed by the laserhead.
+            For a facet, the other facets are disabled with the facet mask and
+            commands are repeated for the specified number of repetitions.
         """
-        active_byte_lst = self.bit_to_byte_list(bit_lst, steps_line, direction)
-        active_cmd_bytes = b"".join(self.byte_to_cmd_list(active_byte_lst))
+        facets = self.cfg.laser_timing["facets"]
+        if facet is not None and not 0 <= facet < facets:
+            raise ValueError(f"facet must be between 0 and {facets - 1}")
+        if len(bit_lst):
+            await self._set_facet_mask(
+                (1 << facets) - 1 if facet is None else 1 << facet
+            )
+        if facet is None and len(bit_lst):
+            max_lines = 1 << Spi.scanline_header["repeat"]
+            while repetitions > 0:
+                lines = min(repetitions, max_lines)
+                byte_lst = self.bit_to_byte_list(
+                    bit_lst, steps_line, direction, repeat=lines - 1
+                )
+                cmd_bytes = self._byte_to_commands(byte_lst)
+                await self.send_command(cmd_bytes, timeout=True)
+                self.telemetry.count("scanlines", lines)
+                repetitions -= lines
+            return
+
+        byte_lst = self.bit_to_byte_list(bit_lst, steps_line, direction)
+        cmd_bytes = self._byte_to_commands(byte_lst)
         packet_size = self.cfg.hdl_cfg.lines_chunk
-        if facet is None:
-            cmd_bytes = active_cmd_bytes
-        else:
-            # Create silent command for other facets
-            facets = self.cfg.laser_timing["facets"]
-            silent_bits = [0] * len(bit_lst)
-            silent_byte_lst = self.bit_to_byte_list(silent_bits, steps_line, direction)
-            silent_cmd_bytes = b"".join(self.byte_to_cmd_list(silent_byte_lst))
-
-            # Build full cycle with one active facet
-            facet_cycle = [silent_cmd_bytes] * facets
-            if 0 <= facet < facets:
-                facet_cycle[facet] = active_cmd_bytes
-            else:
-                raise ValueError(f"facet must be between 0 and {facets - 1}")
-            cmd_bytes = b"".join(facet_cycle)
-            packet_size //= facets
+        packet_words = len(byte_lst) // Spi.word_bytes
+        space = 0
+        i = 0
+        while i < repetitions:
+            # packets known to fit are sent without waiting for mem_full
+            fit = min(space // packet_words, packet_size)
+            repeat = min(fit or packet_size, repetitions - i)
+            response = await self.send_command(cmd_bytes * repeat, timeout=not fit)
+            # space reported at the start of the transfer, the FIFO can only
+            # have drained since
+            state = await self._read_fpga_state(
+                response[: Spi.command_bytes + Spi.word_bytes]
+            )
+            space = state["space_available"] - repeat * packet_words
+            if len(bit_lst):
+                self.telemetry.count("scanlines", repeat)
+            i += repeat
+
+    async def _set_facet_mask(self, mask):
+        """
+        Queue a facet mask instruction in front of the next lines.
+
+        Nothing is sent if the mask is already active, bit n enables facet n.
+        Between lines, the mask uses the facet slot of the pulse it is read at.
+        """
+        if mask == self._facet_mask:
+            return
+        word = (mask << 8) | Spi.Instructions.facet_mask
+        command = [Spi.Commands.write] + list(word.to_bytes(Spi.word_bytes, "big"))
+        await self.send_command(command, timeout=True)
+        self._facet_mask = mask
+
+    async def set_facet_offsets(self, offsets):
+        """
+        Shift the start of the lines of each facet.
 
-        for i in range(0, repetitions, packet_size):
-            last_index = min(i + packet_size, repetitions)
-            repeat = last_index - i
-            await self.send_command(cmd_bytes * repeat, timeout=True)
+        The offsets are queued in the FIFO. The dispatcher applies them if no
+        lines are processed, between lines the laserhead reads them together
+        with the next line, see PlatformConfig.facet_offset_ticks.
+
+        Args:
+            offsets (list[int]): Start offset in ticks per facet.
+
+        Raises:
+            ValueError: offset count differs from the facets or an offset
+                moves the line outside the facet.
+        """
+        if len(offsets) != self.cfg.laser_timing["facets"]:
+            raise ValueError("An offset is required for every facet")
+        lowest, highest = self.cfg.facet_offset_range()
+        mask = (1 << Spi.facet_offset_bits) - 1
+        command = []
+        for facet, offset in enumerate(offsets):
+            if not lowest <= offset <= highest:
+                raise ValueError(f"Facet offset must be between {lowest} and {highest}")
+            word = (offset & mask) << 16 | facet << 8 | Spi.Instructions.facet_offset
+            command += [Spi.Commands.write] + list(word.to_bytes(Spi.word_bytes, "big"))
+        await self.send_command(command, timeout=True)
+
+    async def set_laser_timing(self, **timing):
+        """
+        Change the laser timing of the next lines without rebuilding the bitstream.
+
+        The timing is queued in the FIFO. The dispatcher applies it if no lines
+        are processed, between lines the laserhead reads it together with the
+        next line, later lines have the new scanline length. Slice the job
+        with the same timing, e.g. ``Interpolator(laser_timing=dict(laser_hz=...))``.
+        A draft at half the laser frequency has half the resolution in the
+        scan direction and takes half the bytes per line.
+        If the rotation speed changes, the prism must synchronize again.
+
+        Args:
+            timing: Laser timing, e.g. laser_hz, start_frac, end_frac or rpm,
+                    see PlatformConfig.set_laser_timing.
+
+        Raises:
+            ValueError: timing exceeds the maximums of the bitstream.
+        """
+        registers = self.cfg.set_laser_timing(**timing)
+        command = []
+        for idx, value in enumerate(registers):
+            word = value << 16 | idx << 8 | Spi.Instructions.laser_timing
+            command += [Spi.Commands.write] + list(word.to_bytes(Spi.word_bytes, "big"))
+        await self.send_command(command, timeout=True)
+
+    def _instruction_word(self, instruction, value):
+        """
+        Build a single-word FIFO instruction carrying an 8-bit payload.
+
+        Byte layout expects: Write command + Padding + Data payload + Instruction Opcode
+
+        Args:
+            instruction (int): Instruction opcode, e.g. Spi.Instructions.set_fan.
+            value (int): Payload byte (0-255).
+
+        Returns:
+            bytes: Command ready for send_command.
+        """
+        return bytes(
+            [Spi.Commands.write] + [0] * (Spi.word_bytes - 2) + [value, instruction]
+        )
 
     async def _send_pin_state(self):
         """Helper to send the current internal pin state to the FPGA."""
-        data = (
-            [Spi.Commands.write]
-            + [0] * (Spi.word_bytes - 2)
-            + [self._pin_state]
-            + [Spi.Instructions.write_pin]
-        )
+        data = self._instruction_word(Spi.Instructions.write_pin, self._pin_state)
         await self.send_command(data)
 
     async def set_leds(self, blue=None, green=None, red=None):
@@ -274,7 +510,7 @@ class BaseHost:
                 self._pin_state |= 1 << 2
             else:
                 self._pin_state &= ~(1 << 2)
-                
+
         if laser1 is not None:
             if laser1:
                 self._pin_state |= 1 << 1
@@ -422,6 +658,7 @@ class BaseHost:
             - x, y, z (bool): State of the motor end switches (names depend on config).
             - photodiode_trigger (bool): True if photodiode was triggered during last prism rotation.
             - synchronized (bool): True if the prism is tracked by the photodiode.
+            - space_available (int): Words that can be written to the FIFO.
         """
         if data is None:
             command = [Spi.Commands.read] + [0] * Spi.word_bytes
@@ -436,6 +673,7 @@ class BaseHost:
             "error": self._bitflag(status_byte, Spi.State.error),
             "mem_full": self._bitflag(status_byte, Spi.State.full),
             "mem_empty": self._bitflag(status_byte, Spi.State.empty),
+            "space_available": (data[-4] << 8) | data[-3],
         }
 
         motor_keys = list(self.cfg.motor_cfg["steps_mm"].keys())
@@ -474,6 +712,28 @@ class BaseHost:
         pointer reset, instantly emptying the queue of pending instructions.
         """
         command = [Spi.Commands.flush] + [0] * Spi.word_bytes
+        # a facet mask could have been flushed before it was read
+        self._facet_mask = None
+        return await self.send_command(command)
+
+    async def set_watermark(self, space):
+        """
+        Set the low-watermark of the FPGA instruction FIFO.
+
+        The fifo_low pin is high while more than ``space`` words are available,
+        so the host can wait on an edge instead of polling for room.
+
+        Args:
+            space (int): Words of space available, at least the reserve of a
+                chunk of lines so fifo_low implies the FIFO is not full.
+        """
+        hdl_cfg = self.cfg.hdl_cfg
+        if not hdl_cfg.space_available <= space < hdl_cfg.mem_depth:
+            raise ValueError(
+                f"watermark must be between {hdl_cfg.space_available} "
+                f"and {hdl_cfg.mem_depth - 1}"
+            )
+        command = [Spi.Commands.watermark] + list(space.to_bytes(Spi.word_bytes, "big"))
         return await self.send_command(command)
 
     async def wait_fifo_empty(self, poll_interval=0.01, check_sensors=False):
@@ -494,6 +754,7 @@ class BaseHost:
             return None
 
         while not (await self.fpga_state)["mem_empty"]:
+            self.telemetry.count("fifo_empty_polls")
             if check_sensors:
                 switches = await self.read_switches()
                 if any(switches):
@@ -649,6 +910,92 @@ class BaseHost:
 
         return bytes(out_buffer)
 
+    def _pack_scurve_segments(self, displacement, speed):
+        """
+        Generates a packed SPI byte payload for a jerk limited coordinated move.
+
+        The path follows an S-curve limited by the acceleration and jerk of
+        motor_cfg. Requires a third order polynomial, i.e. pol_degree 3.
+
+        Args:
+            displacement (np.array): Displacement per axis in mm.
+            speed (float): Maximum vector feedrate in mm/s.
+
+        Returns:
+            list[tuple[int, bytes]]: Ticks and packed 'spline_move' instruction
+            per segment, empty if there is no displacement.
+        """
+        hdl_cfg = self.cfg.hdl_cfg
+        motor_cfg = self.cfg.motor_cfg
+        steps_per_mm = list(motor_cfg["steps_mm"].values())
+        distance_mm = float(np.sqrt(np.sum(displacement**2)))
+        if distance_mm == 0:
+            return []
+
+        counts = []
+        for axis in range(hdl_cfg.motors):
+            if displacement[axis] == 0:
+                counts.append(0)
+            else:
+                steps = int(round(displacement[axis] * steps_per_mm[axis]))
+                counts.append(self.steps_to_count(steps))
+
+        # path length of the counts, these are rounded to steps
+        count_mm = [
+            count / (steps_per_mm[axis] << (1 + hdl_cfg.bit_shift))
+            for axis, count in enumerate(counts)
+        ]
+        distance_mm = sqrt(sum(mm * mm for mm in count_mm))
+        profile = SCurve(
+            distance_mm, speed, motor_cfg["acceleration"], motor_cfg["jerk"]
+        )
+        segments = fit_segments(profile, counts, hdl_cfg.motor_freq, hdl_cfg.move_ticks)
+
+        write_byte = Spi.Commands.write.to_bytes(1, "big")
+        move_byte = Spi.Instructions.move.to_bytes(1, "big")
+        packed = []
+        for ticks, coefficients in segments:
+            out_buffer = bytearray(write_byte + ticks.to_bytes(7, "big") + move_byte)
+            for coeff in coefficients:
+                if sys.implementation.name == "micropython":
+                    out_buffer.extend(write_byte + int(coeff).to_bytes(8, "big", True))
+                else:
+                    out_buffer.extend(
+                        write_byte + int(coeff).to_bytes(8, "big", signed=True)
+                    )
+            packed.append((ticks, bytes(out_buffer)))
+        return packed
+
+    def _move_chunks(self, displacement, speed, chunk_ticks=None):
+        """
+        Yields (ticks, payload) batches of move instructions for a coordinated move.
+
+        Order 2 polynomials move at constant velocity, order 3 polynomials
+        follow an S-curve. A batch spans at least chunk_ticks, the last one
+        excepted; if chunk_ticks is None the move is a single batch.
+        """
+        if self.cfg.hdl_cfg.pol_degree >= 3:
+            batch, batch_ticks = bytearray(), 0
+            for ticks, payload in self._pack_scurve_segments(displacement, speed):
+                batch.extend(payload)
+                batch_ticks += ticks
+                if chunk_ticks is not None and batch_ticks >= chunk_ticks:
+                    yield batch_ticks, bytes(batch)
+                    batch, batch_ticks = bytearray(), 0
+            if batch_ticks:
+                yield batch_ticks, bytes(batch)
+        else:
+            ticks_remaining, velocities = self._calc_coordinated_velocities(
+                displacement, speed
+            )
+            while ticks_remaining > 0:
+                if chunk_ticks is None:
+                    ticks = ticks_remaining
+                else:
+                    ticks = min(ticks_remaining, chunk_ticks)
+                yield ticks, self._pack_linear_segments(ticks, velocities)
+                ticks_remaining -= ticks
+
     async def gotopoint(
         self,
         position,
@@ -663,7 +1010,8 @@ class BaseHost:
         position     --
             • If *absolute* is True,  absolute position (mm) for every axis.
             • If *absolute* is False, relative displacement (mm) for every axis.
-        speed        -- list with speed in mm/s, if None default speeds used 10 mm/s
+        speed        -- list with speed in mm/s, if None default speeds used 10 mm/s,
+                        with pol_degree 3 the peak speed of a jerk limited S-curve
         absolute     -- Position interpreted as absolute (True) or
                         a displacement (False).
         check_sensors -- If True, aborts motion if switch threshold is passed (home switch hit).
@@ -687,20 +1035,18 @@ class BaseHost:
             # Relative movement (JOG) is unaffected by coordinate system selection
             displacement = position
 
-        # Math Layer: Get coordinated velocities
-        total_ticks, velocities = self._calc_coordinated_velocities(displacement, speed)
-
-        # 3. Execution Layer
+        # Math Layer: Get coordinated move segments
         # Define how much time (in ticks) we send to the FPGA before polling sensors
         # 50,000 ticks at 1MHz = 50ms chunk size. This balances SPI speed with sensor reaction time.
         MAX_CHUNK_TICKS = 50_000
-        ticks_remaining = total_ticks
+        chunks = list(self._move_chunks(displacement, speed, MAX_CHUNK_TICKS))
+        total_ticks = sum(ticks for ticks, _ in chunks)
 
-        while ticks_remaining > 0:
-            current_chunk_ticks = min(ticks_remaining, MAX_CHUNK_TICKS)
+        # 3. Execution Layer
+        ticks_remaining = total_ticks
 
-            # Pack and send a batched chunk
-            payload = self._pack_linear_segments(current_chunk_ticks, velocities)
+        for current_chunk_ticks, payload in chunks:
+            # Send a batched chunk
             await self.send_command(payload, timeout=True)
 
             ticks_remaining -= current_chunk_ticks
@@ -730,7 +1076,8 @@ class BaseHost:
                         homeswitches_hit[axis] = 1
                         logger.warning(f"Limit switch hit on axis {axis} during move!")
 
-        # Calculate actual displacement if we aborted early
+        # Calculate actual displacement if we aborted early,
+        # approximate for S-curves as these are not linear in time
         if any(homeswitches_hit):
             percent_completed = 1.0 - (ticks_remaining / total_ticks)
             self._position += displacement * percent_completed
@@ -756,6 +1103,54 @@ class BaseHost:
         ticks_facet = int.from_bytes(payload[: word_size - 1], "big")
         return [ticks_facet, facet_cnt]
 
+    async def read_facet_stats(self):
+        """
+        Read and clear the facet period statistics of the FPGA.
+
+        The FPGA adds the period of every facet while synchronized, the
+        statistics cover all revolutions since the previous read.
+
+        Returns:
+            list[dict]: Per facet the number of periods ``count`` and the
+            ``mean``, ``std``, ``min`` and ``max`` period in ticks. Without
+            periods these are None.
+        """
+        word_size = Spi.word_bytes
+        words = self.cfg.hdl_cfg.words_facet_stats
+        command = [Spi.Commands.facet_stats] + [0] * (words * word_size)
+        raw = await self.send_command(command)
+
+        # strip command echo; a word is unsigned and big endian
+        payload = bytes(raw[Spi.command_bytes :])
+        values = [
+            int.from_bytes(payload[i : i + word_size], "big")
+            for i in range(0, len(payload), word_size)
+        ]
+        count_bits = Spi.facet_stats["count"]
+        ticks_bits = Spi.facet_stats["ticks"]
+        ticks_mask = (1 << ticks_bits) - 1
+        stats = []
+        for idx in range(0, words, 3):
+            head, total, squares = values[idx : idx + 3]
+            count = head & ((1 << count_bits) - 1)
+            if count == 0:
+                stats.append(
+                    {"count": 0, "mean": None, "std": None, "min": None, "max": None}
+                )
+                continue
+            # exact integer variance, count**2 times too large
+            variance = count * squares - total * total
+            stats.append(
+                {
+                    "count": count,
+                    "mean": total / count,
+                    "std": variance**0.5 / count,
+                    "min": (head >> count_bits) & ticks_mask,
+                    "max": (head >> (count_bits + ticks_bits)) & ticks_mask,
+                }
+            )
+        return stats
+
     @property
     def fan_speed(self):
         """
@@ -773,15 +1168,7 @@ class BaseHost:
             speed (int): Target speed / duty cycle value from 0 (Off) to 255 (100% On).
         """
         self._fan_speed = max(0, min(255, int(speed)))
-
-        # Structure payload: Opcode inside write command block
-        # Byte layout expects: Write command + Padding + Data payload + Instruction Opcode
-        data = (
-            [Spi.Commands.write]
-            + [0] * (Spi.word_bytes - 2)
-            + [self._fan_speed]
-            + [Spi.Instructions.set_fan]
-        )
+        data = self._instruction_word(Spi.Instructions.set_fan, self._fan_speed)
         await self.send_command(data)
 
     @property
@@ -801,14 +1188,7 @@ class BaseHost:
             speed (int): Target speed / duty cycle value from 0 (Off) to 255 (100% On).
         """
         self._spindle_speed = max(0, min(255, int(speed)))
-
-        # Structure payload matching standard instruction layout
-        data = (
-            [Spi.Commands.write]
-            + [0] * (Spi.word_bytes - 2)
-            + [self._spindle_speed]
-            + [Spi.Instructions.set_spindle]
-        )
+        data = self._instruction_word(Spi.Instructions.set_spindle, self._spindle_speed)
         await self.send_command(data)
 
     @property
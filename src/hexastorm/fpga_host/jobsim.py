@@ -0,0 +1,215 @@
+"""
+Discrete-event simulation of a print job, used for capacity planning.
+
+A job is replayed on the behavioral FPGA model (see model.py) as the host
+would stream it. The host reads and encodes a chunk of ``lines_chunk`` lines,
+waits while mem_full is set and sends the chunk in one SPI transaction. At
+the end of a lane it sends a stop line and moves the stage by a lane width,
+the lines of the next lane are written while the stage moves. The model
+drains the FIFO at the facet rate, so the simulation predicts
+
+    - the duration of the job, including spin-up and stage moves
+    - the minimum FIFO margin, i.e. the time the laserhead can continue
+      from the lines queued if the host stalls
+    - underruns, facets at which the laserhead found the FIFO empty within
+      a lane and the line is exposed a rotation later
+
+Example:
+
+    sim = JobSimulator(ModelHost(test=False), baudrate=2e6, encode_rate=1_000)
+    report = sim.run_file("job.pat")
+"""
+
+import asyncio
+
+from ..config import Spi
+from ..interpolator import io
+from .model import FPGAModel, ModelHost
+
+
+class _JobModel(FPGAModel):
+    """FPGA model which traces the FIFO as seen by the laserhead."""
+
+    def reset(self):
+        super().reset()
+        self.lines_written = 0
+        # a lane is open while the host still has lines of it to send
+        self.lane_open = False
+        self.lane = self.lane_line = 0
+        self.min_margin = None
+        self.underruns = []
+        self.occupancy = []
+
+    def _write_word(self, word):
+        accepted = super()._write_word(word)
+        instr = Spi.Instructions
+        committed = accepted and self._words_rec == 0
+        if committed and self._instr_rec in (instr.scanline, instr.rle_scanline):
+            self.lines_written += 1
+        return accepted
+
+    def _laserhead_read(self):
+        if self.lane_open and self.fifo.empty:
+            self.underruns.append((self.seconds, self.lane, self.lane_line))
+        exposed = self.lines_exposed
+        super()._laserhead_read()
+        if self.lines_exposed == exposed:
+            return
+        self.lane_line += 1
+        stored = self.plf_cfg.hdl_cfg.mem_depth - self.fifo.space_available
+        self.occupancy.append((self.seconds, stored))
+        if self.lane_open:
+            queued = self.lines_written - self.lines_exposed
+            if self.min_margin is None or queued < self.min_margin:
+                self.min_margin = queued
+
+
+class JobSimulator:
+    """
+    Predicts duration, FIFO margin and underruns of a job.
+
+    Args:
+        host (ModelHost): Host configured for the job, defaults to the
+            production configuration, i.e. ModelHost(test=False).
+        baudrate (float): SPI clock in Hz, defaults to the ESP32 configuration.
+        lines_chunk (int): Lines sent per SPI transaction, also sets the FIFO
+            reserve kept by mem_full, defaults to hdl_cfg.lines_chunk.
+        encode_rate (float): Lines per second the host reads and encodes,
+            None if the host is not the bottleneck.
+        transaction_time (float): Host overhead per SPI transaction in s.
+        move_speed (float): Stage speed in mm/s for the move between lanes.
+        laser_timing (dict): Timing the job was sliced for, sent at the start
+            of the job, see BaseHost.set_laser_timing.
+    """
+
+    def __init__(
+        self,
+        host=None,
+        baudrate=None,
+        lines_chunk=None,
+        encode_rate=None,
+        transaction_time=0.0,
+        move_speed=10.0,
+        laser_timing=None,
+    ):
+        if host is None:
+            host = ModelHost(test=False)
+        cfg = host.cfg
+        hdl_cfg = cfg.hdl_cfg
+        spi = cfg.esp32_cfg["spi"]
+        if baudrate is None:
+            baudrate = spi["baudrate"]
+        if lines_chunk is not None:
+            if lines_chunk * hdl_cfg.words_scanline >= hdl_cfg.mem_depth:
+                raise ValueError(
+                    f"A chunk of {lines_chunk} lines does not fit in the FIFO"
+                )
+            hdl_cfg.lines_chunk = lines_chunk
+            hdl_cfg.space_available = lines_chunk * hdl_cfg.words_scanline
+        spi_cycles_per_byte = (
+            8 / spi["lanes"] * cfg.laser_timing["crystal_hz"] / baudrate
+        )
+        host.model = _JobModel(cfg, spi_cycles_per_byte)
+        if laser_timing:
+            # validated and lines take the new length, the registers follow
+            cfg.set_laser_timing(**laser_timing)
+        self.laser_timing = laser_timing
+        self.host = host
+        self.encode_rate = encode_rate
+        self.transaction_time = transaction_time
+        self.move_speed = move_speed
+        # lanes are placed next to each other along the laser line
+        steps_mm = cfg.motor_cfg["steps_mm"]
+        self.lane_axis = next(
+            axis for axis in steps_mm if axis != cfg.motor_cfg["orth2lsrline"]
+        )
+
+    def run(self, lanes, lanewidth):
+        """
+        Simulate a job.
+
+        Args:
+            lanes (list[list[bytes]]): Scanline instructions per lane, the
+                bytes of every line starting with the instruction byte.
+            lanewidth (float): Distance between lanes in mm.
+
+        Returns:
+            dict: duration (s), lines, min_margin (s) and min_margin_lines,
+            i.e. lines queued in the FIFO at the lowest point of a lane,
+            underruns as (s, lane, line) and occupancy as (s, words stored).
+        """
+        host = self.host
+        model = host.model
+        model.reset()
+        laz_tim = host.cfg.laser_timing
+        crystal_hz = laz_tim["crystal_hz"]
+        chunk = host.cfg.hdl_cfg.lines_chunk
+        axes = list(host.cfg.motor_cfg["steps_mm"])
+        displacement = [0] * len(axes)
+        displacement[axes.index(self.lane_axis)] = lanewidth
+
+        async def job():
+            if self.laser_timing:
+                await host.set_laser_timing(**self.laser_timing)
+            for lane_idx, lines in enumerate(lanes):
+                if lane_idx:
+                    await host.gotopoint(
+                        displacement,
+                        speed=self.move_speed,
+                        absolute=False,
+                        check_sensors=False,
+                    )
+                model.lane, model.lane_line = lane_idx, 0
+                model.lane_open = True
+                for start in range(0, len(lines), chunk):
+                    packet = lines[start : start + chunk]
+                    if self.encode_rate is not None:
+                        model.advance(len(packet) / self.encode_rate * crystal_hz)
+                    model.advance(self.transaction_time * crystal_hz)
+                    data = b"".join(host._byte_to_commands(line) for line in packet)
+                    await host.send_command(data, timeout=True)
+                model.lane_open = False
+                await host.write_line([])
+            await host.wait_fifo_empty()
+
+        asyncio.run(job())
+        facet_s = laz_tim["facet_ticks"] / crystal_hz
+        margin = model.min_margin
+        return {
+            "duration": model.seconds,
+            "lines": model.lines_exposed,
+            "min_margin": None if margin is None else margin * facet_s,
+            "min_margin_lines": margin,
+            "underruns": model.underruns,
+            "occupancy": model.occupancy,
+        }
+
+    def run_file(self, filepath):
+        """Simulate the job of a binary laser file, see io.write_binary_file."""
+        cfg = self.host.cfg
+        facets, lanes, lanewidth, lines = io.read_scanlines(
+            filepath, cfg.laser_timing, cfg.laser_channels, cfg.laser_bits
+        )
+        job = [lines[lane * facets : (lane + 1) * facets] for lane in range(lanes)]
+        return self.run(job, lanewidth)
+
+    def run_params(self, params):
+        """
+        Simulate a job from interpolator parameters.
+
+        Lines are sent raw, the lines of a file which are run-length encoded
+        take less time to transfer.
+        """
+        host = self.host
+        length = host.cfg.laser_timing["scanline_length"]
+        blank = [0] * (host.cfg.laser_channels * length)
+        lanes = []
+        for lane in range(int(params["lanes"])):
+            # lanes are exposed in alternating direction, see write_binary_file
+            line = bytes(
+                host.bit_to_byte_list(
+                    blank, params["stepsperline"], (lane + 1) % 2, compress=False
+                )
+            )
+            lanes.append([line] * int(params["facetsinlane"]))
+        return self.run(lanes, params["lanewidth"])
@@ -1,11 +1,9 @@
-from asyncio import sleep, sleep_ms, wait_for
+from asyncio import sleep, sleep_ms, wait_for, ThreadSafeFlag
 import time
 import logging
 import os
-from random import randint
 from machine import Pin, SPI, I2C, PWM
 
-from ulab import numpy as np
 from tmc.uart import ConnectionFail
 from tmc.stepperdriver import TMC_2209
 
@@ -19,10 +17,20 @@ logger = logging.getLogger(__name__)
 class ESP32Host(BaseHost):
     """
     Host interface to interact with the FPGA using micropython.
+
+    Args:
+        pol_degree (int): Polynomial order of the bitstream, see :class:`BaseHost`.
+        laser_channels (int): Laser channels of the bitstream, see :class:`BaseHost`.
+        laser_bits (int): Bits per pixel of the bitstream, see :class:`BaseHost`.
     """
 
-    def __init__(self):
-        super().__init__(test=False)
+    def __init__(self, pol_degree=2, laser_channels=1, laser_bits=1):
+        super().__init__(
+            test=False,
+            pol_degree=pol_degree,
+            laser_channels=laser_channels,
+            laser_bits=laser_bits,
+        )
         self.steppers_init = False
         self.reset()
 
@@ -50,6 +58,8 @@ class ESP32Host(BaseHost):
         # hardware SPI works partly, set speed to 3e6
         # return bytes give issue in retrieving position
         spi = cfg["spi"]
+        if spi["lanes"] != 1:
+            raise ValueError("machine.SPI only supports a single data lane")
         self.spi = SPI(
             2,
             baudrate=spi["baudrate"],
@@ -63,6 +73,14 @@ class ESP32Host(BaseHost):
         self.fpga_done = Pin(cfg["fpga"]["done"], Pin.IN)
         self.stepper_cs = Pin(cfg["stepper_cs"], Pin.OUT)
         self._mem_full = Pin(cfg["fpga"]["mem_full"], Pin.IN)
+        # the low-watermark pin wakes up wait_mem_empty via an interrupt
+        self._fifo_low = None
+        if cfg["fpga"]["fifo_low"] is not None:
+            self._fifo_low = Pin(cfg["fpga"]["fifo_low"], Pin.IN)
+            self._fifo_low_flag = ThreadSafeFlag()
+            self._fifo_low.irq(
+                lambda pin: self._fifo_low_flag.set(), trigger=Pin.IRQ_RISING
+            )
 
     @property
     def mem_full(self):
@@ -71,13 +89,43 @@ class ESP32Host(BaseHost):
         """
         return self._mem_full.value()
 
+    @property
+    def fifo_low(self):
+        """
+        Returns whether space available exceeds the low-watermark (boolean).
+        """
+        return self._fifo_low.value()
+
     async def wait_mem_empty(self):
         """
-        Simulates a task waiting for memory to be cleared.
-        This will loop indefinitely in this example.
+        Wait until the FIFO has room for a chunk of lines.
+
+        If the low-watermark pin is routed, the task sleeps until its rising
+        edge, see set_watermark. Otherwise the mem_full pin is polled.
+        """
+        if self._fifo_low is None:
+            while self.mem_full:
+                await sleep(0)
+            return
+        await self._wait_fifo_low(self._fifo_low_flag)
+
+    async def wait_fifo_empty(self, poll_interval=0.01, check_sensors=False):
         """
-        while self.mem_full:
-            await sleep(0)
+        Wait until the FPGA instruction FIFO is empty.
+
+        Limit switches are only read while polling. Without check_sensors
+        and with the low-watermark pin routed, the watermark is raised so
+        the pin rises once every word is read and the task sleeps until then.
+        """
+        if check_sensors or self._fifo_low is None:
+            return await super().wait_fifo_empty(poll_interval, check_sensors)
+        hdl_cfg = self.cfg.hdl_cfg
+        await self.set_watermark(hdl_cfg.mem_depth - 1)
+        try:
+            await self._wait_fifo_low(self._fifo_low_flag)
+        finally:
+            await self.set_watermark(hdl_cfg.space_available)
+        return None
 
     async def send_command(self, command, timeout=0, debug=False):
         """
@@ -96,21 +144,23 @@ class ESP32Host(BaseHost):
         """
         command = bytearray(command)
         response = bytearray(command)
+        telemetry = self.telemetry
 
         if timeout and self.mem_full:
             if debug:
                 logger.info("Memory full, waiting for FIFO to empty")
-                start_time = time.ticks_ms()
-            # tried IRQ call back with await for --> cannot get it working
-            # the call back never propagates even with micropython.schedule
+            start_time = telemetry.now()
             # 254 move segments in memory, 2.54 seconds should suffice
             await wait_for(self.wait_mem_empty(), timeout=5)
+            self._record_mem_full(start_time)
             if debug:
-                elapsed = (time.ticks_ms() - start_time) / 1000
+                elapsed = telemetry.since(start_time) / 1e6
                 logger.info(f"Waited for mem_empty {elapsed} seconds")
+        start_time = telemetry.now()
         self.fpga_cs.value(0)
         self.spi.write_readinto(command, response)
         self.fpga_cs.value(1)
+        self._record_send(len(command), start_time)
 
         return response
 
@@ -232,6 +282,8 @@ class ESP32Host(BaseHost):
         self.fpga_cs.value(0)
         self.spi.write_readinto(command, response)
         self.fpga_cs.value(1)
+        # the bitstream enables all facets
+        self._facet_mask = (1 << self.cfg.laser_timing["facets"]) - 1
 
     @property
     def enable_steppers(self):
@@ -305,56 +357,37 @@ class ESP32Host(BaseHost):
         # assumed this is done during initialization
         self.i2c.writeto_mem(adr, 0, bytes([val]))
 
-    async def measure_facet_period_ms(self, samples=30, max_trials=10_000):
+    async def measure_facet_stats(self, samples=50):
         """
-        Measure the facet period in milliseconds and facet ID n_samples times.
+        Measure the period statistics of every facet over samples revolutions.
 
-        Parameters:
-          samples: target samples per facet
-          max_trials: maximum number of samples to reach target
+        The statistics are accumulated by the FPGA at every photodiode pulse,
+        they are cleared, collected for samples revolutions and read back.
 
-        Returns: (facet_ms, facet_ids) both lists of length n_samples
+        Parameters:
+          samples: target samples per facet, i.e. revolutions
 
-        - facet_ms: each entry is period in ms for given facet_id
-        - facet_id: each entry is facet ID
+        Returns: list with per facet a dict with count and the mean, std, min
+        and max period in ms, see BaseHost.read_facet_stats
         """
-
         laz_tim = self.cfg.laser_timing
-
-        # Sampling cadence to prevent oversampling
-        dt_facet_ms = int(60 / (laz_tim["rpm"] * laz_tim["facets"] / 1000))
-        facet_ms = np.zeros(max_trials)
-        facet_id = np.zeros(max_trials)
-
-        counts = np.zeros(laz_tim["facets"])
-
-        for sample in range(max_trials):
-            # improve distribution of samples
-            if sample % 25 == 0:
-                if np.min(counts) < samples:
-                    delay = randint(0, 4 * dt_facet_ms)
-                    await sleep_ms(delay)
-                else:
-                    return facet_ms[:sample], facet_id[:sample]
-            f_ticks, f_id = await self.read_facet_ticks_and_id()
-            counts[f_id] += 1
-            facet_id[sample] = f_id
-            facet_ms[sample] = f_ticks / (laz_tim["crystal_hz"] / 1000)
-            delay = randint(int(0.5 * dt_facet_ms), dt_facet_ms)
-            await sleep_ms(dt_facet_ms)
-        logger.error("Measurement fails")
-        return facet_ms, facet_id
-
-    async def measure_facet_means(
-        self,
-        samples=30,
-        max_trials=10_000,
-    ):
+        ticks_ms = laz_tim["crystal_hz"] / 1000
+        # one extra revolution so every facet reaches samples
+        revolution_ms = 60_000 / laz_tim["rpm"]
+        await self.read_facet_stats()
+        await sleep_ms(int((samples + 1) * revolution_ms))
+        stats = await self.read_facet_stats()
+        for facet_stats in stats:
+            for key in ("mean", "std", "min", "max"):
+                if facet_stats[key] is not None:
+                    facet_stats[key] /= ticks_ms
+        return stats
+
+    async def measure_facet_means(self, samples=30):
         """
-        Compute the mean period per facet in milliseconds using n_samples measurements.
+        Compute the mean period per facet in milliseconds over samples revolutions.
 
           samples: target samples per facet
-          max_trials: maximum number of samples to reach target
 
         Returns:
         - means_ms: list of length n_facets; each entry is mean period in ms or None if no samples
@@ -363,36 +396,37 @@ class ESP32Host(BaseHost):
         if not cur_sync:
             await self.synchronize(True)
 
-        facet_ms, facet_id = await self.measure_facet_period_ms(samples, max_trials)
-        facets = self.cfg.laser_timing["facets"]
+        stats = await self.measure_facet_stats(samples)
+        mean_ms = []
 
-        mean_ms = [0] * facets
-
-        for facet in range(facets):
-            facet_ms_id = facet_ms[facet_id == facet]
-            if len(facet_ms_id) > 0:
-                mean_ms[facet] = np.mean(facet_ms_id)
+        for facet, facet_stats in enumerate(stats):
+            mean_ms.append(facet_stats["mean"])
+            if facet_stats["count"]:
                 logger.debug(
-                    f"Facet {facet}: n={facet_ms_id.size}, mean={mean_ms[facet]:.5f}, std={np.std(facet_ms_id):.5f}"
+                    f"Facet {facet}: n={facet_stats['count']}, "
+                    f"mean={facet_stats['mean']:.5f}, std={facet_stats['std']:.5f}"
                 )
             else:
-                mean_ms[facet] = None
                 logger.debug(f"Facet {facet}: n=0, mean=None, std=None")
 
         if not cur_sync:
             await self.synchronize(False)
         return mean_ms
 
-    async def test_laserhead(self, shift=0):
+    async def test_laserhead(self, shift=0, samples=50):
         """
         Test laserhead by comparing jitter percentage of each facet against expected configuration.
 
-        Measures the period for each facet multiple times, computes the jitter
-        (ignoring statistical outliers) , and compares against the expected jitter percentage from configuration.
+        The period statistics of every facet are accumulated by the FPGA over
+        samples revolutions. The jitter is the range of the periods, i.e. the
+        measured maximum minus minimum, relative to the mean. Periods outside
+        the synchronization window of the laserhead are not counted.
 
         Args:
         - shift (int, optional): Rotational offset used to map raw hardware facet IDs
           to calibrated logical facet IDs. Defaults to 0.
+        - samples (int, optional): Revolutions to measure, at least this many
+          periods are required per facet.
 
         Returns:
         - dict: A report containing the overall pass/fail status, global RPM stats,
@@ -422,11 +456,19 @@ class ESP32Host(BaseHost):
             "facets": {},
         }
 
-        # Request 200 samples for the percentile trim
-        facet_ms, facet_ids = await self.measure_facet_period_ms(samples=200)
+        stats = await self.measure_facet_stats(samples)
+        periods = sum(facet_stats["count"] for facet_stats in stats)
+        if periods == 0:
+            logger.error("Global timing failure: no facet periods measured.")
+            report["passed"] = False
+            report["error_reason"] = "No facet periods measured"
+            await self.synchronize(False)
+            return report
 
         # --- CASE 1: Global Mean Check (RPM Accuracy) ---
-        global_mean_ms = float(np.mean(facet_ms))
+        global_mean_ms = (
+            sum(s["mean"] * s["count"] for s in stats if s["count"]) / periods
+        )
         global_deviation_perc = float(
             abs(global_mean_ms - exp_facet_ms) / exp_facet_ms * 100
         )
@@ -452,8 +494,8 @@ class ESP32Host(BaseHost):
         # --- CASE 2: Per-Facet Jitter Check ---
         for f_id in range(num_facets):
             raw_f_id = (f_id + shift) % num_facets
-            facet_data = facet_ms[facet_ids == raw_f_id]
-            n_samples = len(facet_data)
+            facet_stats = stats[raw_f_id]
+            n_samples = facet_stats["count"]
 
             # Default facet report
             facet_report = {
@@ -463,7 +505,7 @@ class ESP32Host(BaseHost):
                 "samples_used": n_samples,
             }
 
-            if n_samples < 50:
+            if n_samples < samples:
                 logger.error(
                     f"Facet {f_id} (Hardware {raw_f_id}): Insufficient samples ({n_samples})."
                 )
@@ -471,28 +513,17 @@ class ESP32Host(BaseHost):
                 report["facets"][f_id] = facet_report
                 continue
 
-            # 1. Sort the array in ascending order
-            sorted_data = np.sort(facet_data)
-
-            # 2. Drop 2% outliers from each end
-            drop_count = int(n_samples * 0.02)
-            clean_data = (
-                sorted_data[drop_count:-drop_count] if drop_count > 0 else sorted_data
-            )
-
-            # 3. Calculate metrics
-            clean_min = clean_data[0]
-            clean_max = clean_data[-1]
-            mean_val = np.mean(clean_data)
-
-            min_frac_perc = (mean_val - clean_min) / mean_val * 100
-            max_frac_perc = (clean_max - mean_val) / mean_val * 100
+            # Calculate metrics
+            mean_val = facet_stats["mean"]
+            min_frac_perc = (mean_val - facet_stats["min"]) / mean_val * 100
+            max_frac_perc = (facet_stats["max"] - mean_val) / mean_val * 100
             total_jitter_perc = min_frac_perc + max_frac_perc
 
-            # 4. Populate facet report (Rounded for consistency)
-            facet_report["mean_ms"] = round(float(mean_val), 4)
-            facet_report["jitter_perc"] = round(float(total_jitter_perc), 4)
-            facet_report["samples_used"] = len(clean_data)
+            # Populate facet report (Rounded for consistency)
+            facet_report["mean_ms"] = round(mean_val, 4)
+            facet_report["jitter_perc"] = round(total_jitter_perc, 4)
+            facet_report["min_ms"] = round(facet_stats["min"], 4)
+            facet_report["max_ms"] = round(facet_stats["max"], 4)
 
             jitter_limit = laz_tim["jitter_exp_perc"]
             is_facet_passed = total_jitter_perc <= jitter_limit
@@ -520,5 +551,7 @@ class ESP32Host(BaseHost):
 
 @syncable
 class ESP32HostSync(ESP32Host):
-    def __init__(self, sync=True):
-        super().__init__()
+    def __init__(self, sync=True, pol_degree=2, laser_channels=1, laser_bits=1):
+        super().__init__(
+            pol_degree=pol_degree, laser_channels=laser_channels, laser_bits=laser_bits
+        )
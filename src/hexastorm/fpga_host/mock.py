@@ -8,8 +8,13 @@ class MockHost(BaseHost):
     Host interface to interact with the FPGA for Amaranth HDL tests.
     """
 
-    def __init__(self, fifo_full, sim):
-        super().__init__(test=True)
+    def __init__(self, fifo_full, sim, pol_degree=2, laser_channels=1, laser_bits=1):
+        super().__init__(
+            test=True,
+            pol_degree=pol_degree,
+            laser_channels=laser_channels,
+            laser_bits=laser_bits,
+        )
         self.spi_tries = 10
         self.fifo_full = fifo_full
         self.sim = sim
@@ -0,0 +1,781 @@
+"""
+Transaction-level behavioral model of the FPGA (SPIParser + Dispatcher).
+
+The Amaranth simulation is cycle accurate but thousands of times slower than
+real time. This model reproduces the behaviour visible to the host:
+
+    - transactionalized FIFO with the same pointer arithmetic, i.e. identical
+      ``space_available``, ``full`` and ``empty`` flags
+    - instruction parsing and commit rules of the SPIParser
+    - dispatcher execution of move, write_pin, fan, spindle and scanline
+      instructions, including move tick accounting and exact step counts;
+      a move is preloaded while the previous one runs, so segments chain
+      without a gap
+    - scanline consumption at the facet rate of the laserhead
+    - state, pin and debug words returned over SPI
+    - facet period statistics, every synchronized period lasts facet_ticks
+
+Time is tracked in FPGA clock cycles. Each SPI byte advances the model by
+``spi_cycles_per_byte`` cycles, so the FIFO drains while the host writes.
+Timing is approximate (spin-up and dispatcher overhead are lumped), the logic
+of every transaction is exact.
+"""
+
+from asyncio import FIRST_COMPLETED, Event, ensure_future, sleep, wait
+from itertools import pairwise
+from math import ceil, floor
+
+from ..config import Spi
+from .interface import BaseHost
+from .telemetry import Telemetry
+
+
+class _TransactionalFIFO:
+    """Pointer-exact model of luna.memory.TransactionalizedFIFO."""
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.mem = [0] * (depth + 1)
+        self.flush()
+
+    def flush(self):
+        self.write_ptr = self.committed_write = 0
+        self.read_ptr = self.committed_read = 0
+
+    def _next(self, ptr):
+        return 0 if ptr == self.depth else ptr + 1
+
+    @property
+    def full(self):
+        return self._next(self.write_ptr) == self.committed_read
+
+    @property
+    def empty(self):
+        return self.read_ptr == self.committed_write
+
+    @property
+    def space_available(self):
+        stored = (self.write_ptr - self.committed_read) % (self.depth + 1)
+        return self.depth - stored
+
+    def write(self, word):
+        if not self.full:
+            self.mem[self.write_ptr] = word
+            self.write_ptr = self._next(self.write_ptr)
+
+    def write_commit(self):
+        self.committed_write = self.write_ptr
+
+    def read(self):
+        word = self.mem[self.read_ptr]
+        if not self.empty:
+            self.read_ptr = self._next(self.read_ptr)
+        return word
+
+    def read_commit(self):
+        self.committed_read = self.read_ptr
+
+    def read_discard(self):
+        self.read_ptr = self.committed_read
+
+
+class FPGAModel:
+    """
+    Behavioral model of the Dispatcher as seen through the SPI bus.
+
+    Args:
+        plf_cfg (PlatformConfig): Platform configuration, e.g.
+            PlatformConfig(test=True).
+        spi_cycles_per_byte (float): FPGA clock cycles needed to shift one SPI byte.
+            Defaults to the ESP32 SPI baudrate and number of data lanes.
+
+    Attributes:
+        now (float): Current time in FPGA clock cycles.
+        steps (list[int]): Step position per motor.
+        limits (list[bool]): Motor limit switch inputs.
+        lines_exposed (int): Scanlines consumed by the laserhead.
+    """
+
+    # dispatcher cycles: WAIT_INSTRUCTION, PARSE_HEAD, WAIT
+    INSTRUCTION_CYCLES = 3
+
+    def __init__(self, plf_cfg, spi_cycles_per_byte=None):
+        self.plf_cfg = plf_cfg
+        hdl_cfg = plf_cfg.hdl_cfg
+        laz_tim = plf_cfg.laser_timing
+        ice40_cfg = plf_cfg.ice40_cfg
+        if spi_cycles_per_byte is None:
+            spi = plf_cfg.esp32_cfg["spi"]
+            spi_cycles_per_byte = (
+                8 / spi["lanes"] * laz_tim["crystal_hz"] / spi["baudrate"]
+            )
+        self.spi_cycles_per_byte = spi_cycles_per_byte
+        self.divider = int(ice40_cfg["clks"][ice40_cfg["hfosc_div"]])
+        self.laser_idx = list(plf_cfg.motor_cfg["steps_mm"].keys()).index(
+            plf_cfg.motor_cfg["orth2lsrline"]
+        )
+        self.stephalfperiod_bits = laz_tim["max_scanline_length"].bit_length() + 4
+        # timing of the build, the host changes its configuration
+        self._build_timing = dict(laz_tim)
+        self.fifo = _TransactionalFIFO(hdl_cfg.mem_depth)
+        self.reset()
+
+    def reset(self):
+        """Return to the power-on state."""
+        motors = self.plf_cfg.hdl_cfg.motors
+        # laser timing registers, see Spi.laser_timing_registers
+        self.laser_timing = dict(self._build_timing)
+        self.fifo.flush()
+        self.now = 0.0
+        self.parse = True
+        self.error = False
+        self.watermark = self.plf_cfg.hdl_cfg.space_available
+        self.pins = 0
+        self.fan_duty = 0
+        self.spindle_duty = 0
+        self.limits = [False] * motors
+        self.steps = [0] * motors
+        self.lines_exposed = 0
+        self.moves_executed = 0
+        self.ticks_executed = 0
+        # parser
+        self._words_rec = 0
+        self._instr_rec = 0
+        self._rle_words_rec = 0
+        self._words_scanline = self.plf_cfg.hdl_cfg.words_scanline
+        # dispatcher
+        self._busy_until = 0.0
+        self._motion_until = 0.0
+        self._accumulators = [0] * motors
+        # laserhead
+        self.process_lines = False
+        self._sync_t0 = None
+        self._linecnt = 0
+        self._lh_free = 0.0
+        self._last_facet = None
+        self._lh_step = 0
+        self._lh_stepcnt = 0
+        self._repeats = 0
+        self._replay = False
+        self.facet_mask = (1 << self.laser_timing["facets"]) - 1
+        self.facet_offsets = [0] * self.laser_timing["facets"]
+        # periods per facet since the statistics were read
+        self.facet_counts = [0] * self.laser_timing["facets"]
+        self._stats_until = 0.0
+
+    # ------------------------------------------------------------------ status
+    @property
+    def seconds(self):
+        """Elapsed model time in seconds."""
+        return self.now / self.laser_timing["crystal_hz"]
+
+    @property
+    def busy(self):
+        return (
+            self.process_lines or max(self._busy_until, self._motion_until) > self.now
+        )
+
+    @property
+    def synchronized(self):
+        return self._sync_t0 is not None and self.now >= self._sync_t0
+
+    @property
+    def fifo_full(self):
+        """Level of the fifo_full pin, i.e. the reserve for a chunk is used."""
+        return self.fifo.space_available <= self.plf_cfg.hdl_cfg.space_available
+
+    @property
+    def fifo_low(self):
+        """Level of the fifo_low pin, space available exceeds the watermark."""
+        return self.fifo.space_available > self.watermark
+
+    @property
+    def state_word(self):
+        """Cat(state, pin_state, space) as returned by read and write commands."""
+        status = Spi.State
+        state = (
+            (self.fifo_full << status.full)
+            | (self.parse << status.parsing)
+            | (self.error << status.error)
+            | (self.fifo.empty << status.empty)
+        )
+        motors = self.plf_cfg.hdl_cfg.motors
+        pin_state = 0
+        for idx, limit in enumerate(self.limits):
+            pin_state |= int(limit) << idx
+        # the laserhead turns on prism and laser while synchronizing
+        prism = bool((self.pins >> 2) & 1) or self._synchronize
+        lasers = bool(self.pins & 0b11) or self._synchronize
+        pin_state |= int(prism and lasers) << motors
+        pin_state |= int(self.synchronized) << (motors + 1)
+        return state | (pin_state << 8) | (self.fifo.space_available << 16)
+
+    @property
+    def debug_word(self):
+        """Cat(facetcnt, tickcounter) of the last synchronized facet."""
+        self._update_facet()
+        if self._last_facet is None:
+            return 0
+        return (self.laser_timing["facet_ticks"] << 8) | self._last_facet
+
+    @property
+    def facet_stats_words(self):
+        """Facet statistics words, [count, min, max], sum and sum of squares."""
+        self._update_stats()
+        ticks = self.laser_timing["facet_ticks"]
+        count_bits = Spi.facet_stats["count"]
+        ticks_bits = Spi.facet_stats["ticks"]
+        words = []
+        for count in self.facet_counts:
+            count = min(count, (1 << count_bits) - 1)
+            head = count | ticks << count_bits | ticks << (count_bits + ticks_bits)
+            words += [head if count else 0, count * ticks, count * ticks * ticks]
+        return words
+
+    @property
+    def _synchronize(self):
+        return bool((self.pins >> 3) & 1)
+
+    @property
+    def _singlefacet(self):
+        return bool((self.pins >> 4) & 1)
+
+    # --------------------------------------------------------------------- SPI
+    def exchange(self, data):
+        """
+        Exchange bytes over the modelled SPI bus.
+
+        Args:
+            data (bytes): One or more commands, each a command byte plus a
+                word. A burst command is followed by several words.
+
+        Returns:
+            bytearray: Response with the same length as data.
+        """
+        cmd = Spi.Commands
+        word_bytes = Spi.word_bytes
+        response = bytearray(len(data))
+        idx = 0
+        while idx < len(data):
+            command = data[idx]
+            burst = bool(command & cmd.burst)
+            if burst:
+                words = (command & (cmd.burst - 1)) + 1
+            elif command == cmd.facet_stats:
+                words = self.plf_cfg.hdl_cfg.words_facet_stats
+            else:
+                words = 1
+            if idx + Spi.command_bytes + words * word_bytes > len(data):
+                raise ValueError("SPI data ends within a command")
+            # command byte is shifted in, response is latched
+            self.advance(self.spi_cycles_per_byte * Spi.command_bytes)
+            word_to_send = self._command(command)
+            if command == cmd.facet_stats:
+                # statistics are held while read and cleared afterwards
+                stats = self.facet_stats_words
+                self.facet_counts = [0] * len(self.facet_counts)
+            idx += Spi.command_bytes
+            # the parser drops the rest of a burst after an invalid word
+            accept = burst or command == cmd.write
+            for word_idx in range(words):
+                if command == cmd.facet_stats:
+                    word_to_send = stats[word_idx]
+                response[idx : idx + word_bytes] = word_to_send.to_bytes(
+                    word_bytes, "big"
+                )
+                self.advance(self.spi_cycles_per_byte * word_bytes)
+                word = int.from_bytes(data[idx : idx + word_bytes], "big")
+                if accept:
+                    accept = self._write_word(word) or not burst
+                elif command == cmd.watermark:
+                    mask = (1 << self.plf_cfg.hdl_cfg.mem_depth.bit_length()) - 1
+                    self.watermark = word & mask
+                idx += word_bytes
+        return response
+
+    def _command(self, command):
+        cmd = Spi.Commands
+        if command == cmd.start:
+            self.parse = True
+        elif command == cmd.stop:
+            self.parse = False
+        elif command == cmd.flush:
+            self.fifo.flush()
+        elif command == cmd.debug:
+            return self.debug_word
+        elif command in (cmd.write, cmd.read, cmd.watermark) or command & cmd.burst:
+            return self.state_word
+        return 0
+
+    def _write_word(self, word):
+        """Parse a written word, returns False if the word is rejected."""
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        instr = Spi.Instructions
+        if self._words_rec == 0:
+            byte0 = word & 0xFF
+            rle_words = self._rle_words(word)
+            valid_rle = 0 < rle_words < self._words_scanline
+            if not 0 < byte0 <= 10 or (byte0 == instr.rle_scanline and not valid_rle):
+                self.error = True
+                return False
+            self._instr_rec = byte0
+            self._rle_words_rec = rle_words
+            # raw lines take the words of the scanline length
+            register = (word >> 8) & 0xFF
+            scanline_length = Spi.laser_timing_registers.index("scanline_length")
+            if byte0 == instr.laser_timing and register == scanline_length:
+                self._words_scanline = Spi.words_scanline(
+                    {"scanline_length": word >> 16},
+                    hdl_cfg.laser_channels,
+                    hdl_cfg.laser_bits,
+                )
+        self.fifo.write(word)
+        self._words_rec += 1
+
+        if self._instr_rec == instr.move:
+            ready = self._words_rec == hdl_cfg.words_move
+        elif self._instr_rec == instr.scanline:
+            ready = self._words_rec == self._words_scanline
+        elif self._instr_rec == instr.rle_scanline:
+            ready = self._words_rec == self._rle_words_rec + 1
+        else:
+            ready = True
+        if ready:
+            self._words_rec = 0
+            self.fifo.write_commit()
+        return True
+
+    @staticmethod
+    def _rle_words(word):
+        """Data words of a run-length encoded scanline from its header."""
+        header = Spi.scanline_header
+        shift = 8 + header["direction"] + header["half_period"]
+        return (word >> shift) & ((1 << header["words"]) - 1)
+
+    # -------------------------------------------------------------- execution
+    def advance(self, cycles):
+        """Run the dispatcher and laserhead for a number of clock cycles."""
+        self._run(self.now + cycles)
+
+    def run_until_idle(self, max_seconds=3600):
+        """
+        Run until the FIFO is drained and the dispatcher is idle.
+
+        Returns:
+            bool: True if idle, False if the model can not make progress
+            (parsing disabled, error, or laserhead not synchronizing).
+        """
+        limit = self.now + max_seconds * self.laser_timing["crystal_hz"]
+        self._run(limit, stop_when_idle=True)
+        return not self.busy and self.fifo.empty and not self.error
+
+    def _run(self, until, stop_when_idle=False):
+        while not self.error:
+            if self.process_lines:
+                pulse = self._next_read_pulse()
+                if pulse is None and stop_when_idle:
+                    return
+                if pulse is None or pulse > until:
+                    break
+                self.now = max(self.now, pulse)
+                self._lh_free = pulse + 1
+                self._laserhead_read()
+                continue
+            if self.fifo.empty or not self.parse:
+                if stop_when_idle:
+                    idle = max(self._busy_until, self._motion_until)
+                    self.now = max(self.now, min(idle, until))
+                    return
+                break
+            start = max(self.now, self._busy_until)
+            if start > until:
+                break
+            self.now = start
+            self._dispatch()
+        if not stop_when_idle:
+            self.now = max(self.now, until)
+
+    def _dispatch(self):
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        instr = Spi.Instructions
+        fifo = self.fifo
+        word = fifo.read()
+        instruction = word & 0xFF
+        payload = word >> 8
+        duration = self.INSTRUCTION_CYCLES
+
+        if instruction != instr.move and self._motion_until > self.now:
+            # parsed again once the motion has finished
+            fifo.read_discard()
+            self._busy_until = self._motion_until
+            return
+        if instruction == instr.move:
+            ncoeff = hdl_cfg.motors * hdl_cfg.pol_degree
+            width = hdl_cfg.bit_shift + 1
+            coeffs = []
+            for _ in range(ncoeff):
+                value = fifo.read() & ((1 << width) - 1)
+                if value >> (width - 1):
+                    value -= 1 << width
+                coeffs.append(value)
+            fifo.read_commit()
+            ticks = payload & ((1 << hdl_cfg.move_ticks.bit_length()) - 1)
+            self._move(ticks, coeffs)
+            # segment starts once loaded and the running segment has ended,
+            # the preload bank is free again from that moment
+            start = max(self.now + duration + 2 * ncoeff + 1, self._motion_until)
+            self._motion_until = start + ticks * self.divider
+            duration = start - self.now
+        elif instruction == instr.write_pin:
+            fifo.read_commit()
+            self._set_pins(payload & 0xFF)
+        elif instruction in (instr.facet_mask, instr.facet_offset, instr.laser_timing):
+            fifo.read_commit()
+            self._write_config(word)
+        elif instruction in (instr.scanline, instr.rle_scanline, instr.last_scanline):
+            fifo.read_discard()
+            self._set_pins(self.pins | (1 << 3))
+            self.process_lines = True
+        elif instruction == instr.set_fan:
+            fifo.read_commit()
+            self.fan_duty = payload & 0xFF
+        elif instruction == instr.set_spindle:
+            fifo.read_commit()
+            self.spindle_duty = payload & 0xFF
+        else:
+            self.error = True
+        self._busy_until = self.now + duration
+
+    def _set_pins(self, pins):
+        self._update_stats()
+        if (pins >> 3) & 1 and not self._synchronize:
+            laz_tim = self.laser_timing
+            # spin up, first photodiode pulse is not within the jitter window
+            spinup = laz_tim["spinup_ticks"] + 2 * laz_tim["facet_ticks"]
+            self._sync_t0 = self.now + spinup
+            self._linecnt = 0
+            self._last_facet = None
+        elif not (pins >> 3) & 1:
+            self._sync_t0 = None
+            self._linecnt = 0
+            self._last_facet = None
+            self._repeats = 0
+            self._replay = False
+        self.pins = pins
+
+    # ---------------------------------------------------------------- motion
+    def _move(self, ticks, coeffs):
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        degree = hdl_cfg.pol_degree
+        period = 1 << (hdl_cfg.bit_shift + 1)
+        self.moves_executed += 1
+        self.ticks_executed += ticks
+        for motor in range(hdl_cfg.motors):
+            d = coeffs[motor * degree : (motor + 1) * degree] + [0, 0]
+            # fractional part is kept across segments
+            start = self._accumulators[motor] % period
+            jerk = d[2] if degree > 2 else 0
+            end, steps = self._segment(start, d[0], d[1], jerk, ticks)
+            self._accumulators[motor] = end
+            if motor != self.laser_idx or not self.process_lines:
+                self.steps[motor] += steps
+
+    def _segment(self, acc, d1, d2, d3, ticks):
+        """Forward differencing in closed form, returns (accumulator, steps)."""
+
+        def velocity(k):
+            return d1 + k * d2 + d3 * k * (k - 1) // 2
+
+        def position(k):
+            return (
+                acc + k * d1 + d2 * k * (k - 1) // 2 + d3 * k * (k - 1) * (k - 2) // 6
+            )
+
+        # split into pieces where the velocity has a constant sign
+        bounds = [0, ticks]
+        if d3 != 0:
+            vertex = -(d2 // d3)
+            if 0 < vertex < ticks:
+                bounds.insert(1, vertex)
+        pieces = [0]
+        for lo, hi in pairwise(bounds):
+            if hi - lo < 1:
+                continue
+            if (velocity(lo) >= 0) != (velocity(hi - 1) >= 0):
+                sign = velocity(lo) >= 0
+                left, right = lo, hi - 1
+                while right - left > 1:
+                    mid = (left + right) // 2
+                    if (velocity(mid) >= 0) == sign:
+                        left = mid
+                    else:
+                        right = mid
+                pieces.append(right)
+            pieces.append(hi)
+
+        half = 1 << self.plf_cfg.hdl_cfg.bit_shift
+        period = half << 1
+        steps = 0
+        for lo, hi in pairwise(pieces):
+            if hi <= lo:
+                continue
+            p_lo, p_hi = position(lo), position(hi)
+            if velocity(lo) >= 0:
+                # rising edge of the step bit while counting up
+                steps += (p_hi - half) // period - (p_lo - half) // period
+            else:
+                # rising edge of the step bit while counting down
+                steps -= p_lo // period - p_hi // period
+        return position(ticks), steps
+
+    # -------------------------------------------------------------- laserhead
+    def _pulse_facet(self, pulse):
+        facet_ticks = self.laser_timing["facet_ticks"]
+        facets = self.laser_timing["facets"]
+        return round((pulse - self._sync_t0) / facet_ticks) % facets
+
+    def _update_stats(self):
+        """Add the synchronized periods up to now to the facet counts."""
+        if self._sync_t0 is not None and self.now >= self._sync_t0:
+            facet_ticks = self.laser_timing["facet_ticks"]
+            facets = self.laser_timing["facets"]
+            # pulse k ends a period of facet k % facets
+            first = max(floor((self._stats_until - self._sync_t0) / facet_ticks) + 1, 0)
+            last = floor((self.now - self._sync_t0) / facet_ticks)
+            for facet in range(facets):
+                self.facet_counts[facet] += (last - facet) // facets - (
+                    first - 1 - facet
+                ) // facets
+        self._stats_until = self.now
+
+    def _update_facet(self):
+        """Facet of the last photodiode pulse, used for the debug word."""
+        if not self.synchronized:
+            return
+        facet_ticks = self.laser_timing["facet_ticks"]
+        passed = int((self.now - self._sync_t0) // facet_ticks)
+        self._last_facet = passed % self.laser_timing["facets"]
+
+    def _next_read_pulse(self):
+        """
+        Time of the next photodiode pulse at which a line is read.
+
+        The line counter moves on past disabled facets like in the laserhead.
+        """
+        if self._sync_t0 is None:
+            return None
+        laz_tim = self.laser_timing
+        facet_ticks = laz_tim["facet_ticks"]
+        facets = laz_tim["facets"]
+        mask = 1 if self._singlefacet else self.facet_mask
+        if not mask:
+            return None
+        earliest = max(self.now, self._lh_free, self._sync_t0)
+        k = ceil((earliest - self._sync_t0) / facet_ticks)
+        # wait for the facet of the line, disabled facets pass it on
+        k += (self._linecnt - k) % facets
+        while not (mask >> (k % facets)) & 1:
+            k += 1
+        self._linecnt = k % facets
+        return self._sync_t0 + k * facet_ticks
+
+    def _write_config(self, word):
+        """Facet mask, facet offset or laser timing instruction to the registers."""
+        laz_tim = self.laser_timing
+        instr = Spi.Instructions
+        instruction = word & 0xFF
+        if instruction == instr.facet_mask:
+            self.facet_mask = (word >> 8) & ((1 << laz_tim["facets"]) - 1)
+        elif instruction == instr.facet_offset:
+            bits = Spi.facet_offset_bits
+            offset = (word >> 16) & ((1 << bits) - 1)
+            if offset >> (bits - 1):
+                offset -= 1 << bits
+            self.facet_offsets[(word >> 8) & 0xFF] = offset
+        elif instruction == instr.laser_timing:
+            registers = Spi.laser_timing_registers
+            register = (word >> 8) & 0xFF
+            name = registers[register] if register < len(registers) else None
+            if name == "facet_ticks" and self._sync_t0 is not None:
+                # the pulses continue from the last pulse at the new period
+                self._update_stats()
+                passed = floor((self.now - self._sync_t0) / laz_tim["facet_ticks"])
+                last = self._sync_t0 + max(passed, 0) * laz_tim["facet_ticks"]
+                self._sync_t0 = last - max(passed, 0) * (word >> 16)
+            if name is not None:
+                laz_tim[name] = word >> 16
+
+    def _laserhead_read(self):
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        laz_tim = self.laser_timing
+        fifo = self.fifo
+        instr = Spi.Instructions
+        if fifo.empty:
+            # underrun, wait for the same facet in the next rotation
+            return
+        facet = self._pulse_facet(self.now)
+        word = fifo.read()
+        instruction = word & 0xFF
+        # configuration between lines, the next instruction is read for the
+        # same facet, a mask waits for the next enabled facet
+        while instruction in (instr.facet_offset, instr.laser_timing):
+            fifo.read_commit()
+            self._write_config(word)
+            if fifo.empty:
+                self._linecnt = (facet + 1) % laz_tim["facets"]
+                return
+            word = fifo.read()
+            instruction = word & 0xFF
+        if instruction in (instr.scanline, instr.rle_scanline):
+            header = Spi.scanline_header
+            direction = (word >> 8) & 1
+            halfperiod = (word >> 9) & ((1 << self.stephalfperiod_bits) - 1)
+            if not self._replay:
+                self._repeats = word >> (
+                    8 + header["direction"] + header["half_period"] + header["words"]
+                )
+            if instruction == instr.rle_scanline:
+                data_words = self._rle_words(word)
+            else:
+                data_words = (
+                    Spi.words_scanline(
+                        laz_tim, hdl_cfg.laser_channels, hdl_cfg.laser_bits
+                    )
+                    - 1
+                )
+            for _ in range(data_words):
+                fifo.read()
+            if self._repeats:
+                fifo.read_discard()
+                self._repeats -= 1
+                self._replay = True
+            elif hdl_cfg.single_line and fifo.empty:
+                fifo.read_discard()
+            else:
+                fifo.read_commit()
+                self._replay = False
+            self._linecnt = (facet + 1) % laz_tim["facets"]
+            self._scanline_steps(halfperiod, direction)
+            self.lines_exposed += 1
+        elif instruction == instr.facet_mask:
+            fifo.read_commit()
+            self._write_config(word)
+            self._linecnt = (facet + 1) % laz_tim["facets"]
+        elif instruction == instr.last_scanline:
+            fifo.read_commit()
+            self._replay = False
+            self.process_lines = False
+            self._linecnt = 0
+            self._busy_until = self.now + self.INSTRUCTION_CYCLES
+        else:
+            self.error = True
+
+    def _scanline_steps(self, halfperiod, direction):
+        """Steps generated by the laserhead for the axis orthogonal to the line."""
+        evaluations = self.laser_timing["scanline_length"] + 1
+        first = max(halfperiod - self._lh_stepcnt, 0) + 1
+        if evaluations < first:
+            self._lh_stepcnt += evaluations
+            return
+        toggles = 1 + (evaluations - first) // (halfperiod + 1)
+        self._lh_stepcnt = (evaluations - first) % (halfperiod + 1)
+        rising = (toggles + (self._lh_step == 0)) // 2
+        self._lh_step ^= toggles & 1
+        self.steps[self.laser_idx] += rising if direction else -rising
+
+
+class ModelHost(BaseHost):
+    """
+    Host interface backed by the behavioral FPGA model.
+
+    Runs complete jobs in seconds. The model is available as ``host.model``,
+    model time in seconds as ``host.model.seconds``.
+
+    Args:
+        test (bool): Use the test platform configuration.
+        spi_cycles_per_byte (float): See :class:`FPGAModel`.
+        pol_degree (int): Polynomial order, see :class:`BaseHost`.
+        laser_channels (int): Laser channels, see :class:`BaseHost`.
+        laser_bits (int): Bits per pixel, see :class:`BaseHost`.
+    """
+
+    def __init__(
+        self,
+        test=True,
+        spi_cycles_per_byte=None,
+        pol_degree=2,
+        laser_channels=1,
+        laser_bits=1,
+    ):
+        super().__init__(
+            test=test,
+            pol_degree=pol_degree,
+            laser_channels=laser_channels,
+            laser_bits=laser_bits,
+        )
+        self.model = FPGAModel(self.cfg, spi_cycles_per_byte)
+        self.spi_tries = 10_000
+        # telemetry runs on model time
+        self.telemetry = Telemetry(clock_us=lambda: int(self.model.seconds * 1e6))
+
+    async def send_command(self, command, timeout=0):
+        model = self.model
+        telemetry = self.telemetry
+        if timeout and model.fifo_full:
+            start = telemetry.now()
+            await self.wait_mem_empty()
+            self._record_mem_full(start)
+        start = telemetry.now()
+        response = model.exchange(bytes(command))
+        self._record_send(len(command), start)
+        return response
+
+    @property
+    def fifo_low(self):
+        return self.model.fifo_low
+
+    async def wait_mem_empty(self):
+        """
+        Wait for room like the ESP32, i.e. on the edge of the fifo_low pin.
+
+        A task in place of the board runs the model a facet at a time and
+        sets the flag at a rising edge of fifo_low, like the pin interrupt.
+
+        Raises:
+            TimeoutError: no room after spi_tries facets or the model failed.
+        """
+        flag = Event()
+        board = ensure_future(self._fifo_low_edges(flag))
+        waiter = ensure_future(self._wait_fifo_low(flag))
+        done, _ = await wait([board, waiter], return_when=FIRST_COMPLETED)
+        board.cancel()
+        waiter.cancel()
+        if waiter not in done:
+            raise TimeoutError
+
+    async def _fifo_low_edges(self, flag):
+        """Run the model and set the flag at rising edges of fifo_low."""
+        model = self.model
+        step = self.cfg.laser_timing["facet_ticks"]
+        level = model.fifo_low
+        for _ in range(self.spi_tries):
+            model.advance(step)
+            if model.error:
+                return
+            if model.fifo_low and not level:
+                flag.set()
+            level = model.fifo_low
+            await sleep(0)
+
+    async def wait_fifo_empty(self, poll_interval=0.01, check_sensors=False):
+        if check_sensors and any(self.model.limits):
+            await self.set_parsing(False)
+            await self.flush_buffer()
+            return [int(limit) for limit in self.model.limits]
+        self.model.run_until_idle()
+        return None
+
+    @property
+    def position_steps(self):
+        """Step position per motor as tracked by the model."""
+        return list(self.model.steps)
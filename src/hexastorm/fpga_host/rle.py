@@ -0,0 +1,82 @@
+"""
+Run-length encoding of scanlines.
+
+A compressed scanline (Spi.Instructions.rle_scanline) carries runs instead of
+one bit per pixel. A run is a byte, bits 0-6 hold the run length minus one and
+bit 7 the laser state. Runs are packed from the least significant byte of a
+FIFO word upward, like the raw laser bits.
+
+Lines with many short runs are larger encoded than raw, :func:`encode`
+returns None for those so the caller can send the line uncompressed.
+"""
+
+from ..config import Spi
+
+RUN_LENGTH = 1 << (Spi.rle_run_bits - 1)
+
+
+def runs_to_bytes(values, lengths):
+    """
+    Convert runs to encoded bytes, long runs are split.
+
+    Args:
+        values: laser state per run (0 or 1)
+        lengths: pixels per run, larger than 0
+    """
+    out = bytearray()
+    for value, length in zip(values, lengths):
+        laser = 0x80 if value else 0
+        while length > RUN_LENGTH:
+            out.append(laser | (RUN_LENGTH - 1))
+            length -= RUN_LENGTH
+        out.append(laser | (length - 1))
+    return out
+
+
+def runs(bits):
+    """Split bits in runs, returns (values, lengths)."""
+    values = []
+    lengths = []
+    prev = None
+    for bit in bits:
+        bit = 1 if bit else 0
+        if bit == prev:
+            lengths[-1] += 1
+        else:
+            values.append(bit)
+            lengths.append(1)
+            prev = bit
+    return values, lengths
+
+
+def words(encoded):
+    """Number of data words required for encoded runs."""
+    return (len(encoded) + Spi.word_bytes - 1) // Spi.word_bytes
+
+
+def encode(bits, words_scanline):
+    """
+    Encode laser bits if this is smaller than the raw scanline.
+
+    Args:
+        bits: laser bits of the scanline
+        words_scanline: words of a raw scanline including its header
+
+    Returns:
+        bytearray or None: encoded runs, None if RLE does not pay off
+    """
+    values, lengths = runs(bits)
+    encoded = runs_to_bytes(values, lengths)
+    if words(encoded) + 1 >= words_scanline:
+        return None
+    return encoded
+
+
+def decode(encoded, length):
+    """Expand encoded runs to a list with length bits, inverse of encode."""
+    bits = []
+    for run in encoded:
+        bits.extend([run >> 7] * ((run & (RUN_LENGTH - 1)) + 1))
+        if len(bits) >= length:
+            break
+    return bits[:length]
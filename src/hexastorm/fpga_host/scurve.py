@@ -0,0 +1,153 @@
+"""
+Jerk limited (S-curve) motion profiles for third order polynomials.
+
+A rest-to-rest move is split in up to seven phases of constant jerk:
+jerk up, constant acceleration, jerk down, cruise and the mirrored
+deceleration. The peak speed is lowered for moves too short to reach the
+requested speed.
+
+:func:`fit_segments` converts a profile into move segments for the
+polynomial of the FPGA, i.e. forward differences [D1, D2, D3] per axis in
+the fixed-point counts of ``bit_shift``. The jerk D3 is rounded toward zero,
+so the configured jerk is never exceeded. D1 is chosen such that every
+segment ends on the ideal position, the rounding errors do not accumulate.
+"""
+
+from math import sqrt
+
+# jerk segments are kept short, truncating D3 moves the stage a fraction of a
+# step within a segment which is corrected by the velocity of the next one
+JERK_TICKS = 2_000
+
+
+class SCurve:
+    """
+    Rest-to-rest S-curve along a path.
+
+    Args:
+        distance (float): path length in mm, larger than 0
+        speed (float): maximum speed in mm/s
+        acceleration (float): maximum acceleration in mm/s^2
+        jerk (float): maximum jerk in mm/s^3
+
+    Attributes:
+        phases: list of (duration in s, jerk in mm/s^3)
+        peak_speed: speed reached in mm/s
+        duration: duration of the move in s
+    """
+
+    def __init__(self, distance, speed, acceleration, jerk):
+        if min(distance, speed, acceleration, jerk) <= 0:
+            raise ValueError("Distance and limits must be positive")
+        self.distance = distance
+        self.acceleration = acceleration
+        self.jerk = jerk
+
+        peak = speed
+        if self._ramp_distance(peak) > distance:
+            # bisect the peak speed at which the ramps cover the distance
+            low, high = 0.0, speed
+            for _ in range(60):
+                peak = (low + high) / 2
+                if self._ramp_distance(peak) > distance:
+                    high = peak
+                else:
+                    low = peak
+            peak = low
+        self.peak_speed = peak
+
+        if peak * jerk < acceleration * acceleration:
+            # acceleration limit is not reached
+            t_jerk = sqrt(peak / jerk)
+            t_acc = 0.0
+        else:
+            t_jerk = acceleration / jerk
+            t_acc = peak / acceleration - t_jerk
+        t_cruise = (distance - self._ramp_distance(peak)) / peak
+        phases = [
+            (t_jerk, jerk),
+            (t_acc, 0.0),
+            (t_jerk, -jerk),
+            (t_cruise, 0.0),
+            (t_jerk, -jerk),
+            (t_acc, 0.0),
+            (t_jerk, jerk),
+        ]
+        self.phases = [(t, j) for t, j in phases if t > 0]
+        self.duration = sum(t for t, _ in self.phases)
+
+    def _ramp_distance(self, peak):
+        """Distance of the acceleration and deceleration ramp to peak speed."""
+        acc, jerk = self.acceleration, self.jerk
+        if peak * jerk < acc * acc:
+            ramp_time = 2 * sqrt(peak / jerk)
+        else:
+            ramp_time = peak / acc + acc / jerk
+        # ramps are point symmetric, i.e. average speed is half the peak speed
+        return peak * ramp_time
+
+    def state(self, t):
+        """Returns (position, speed, acceleration, jerk) at time t in s."""
+        pos = vel = acc = 0.0
+        for duration, jerk in self.phases:
+            dt = min(t, duration)
+            pos += vel * dt + acc * dt**2 / 2 + jerk * dt**3 / 6
+            vel += acc * dt + jerk * dt**2 / 2
+            acc += jerk * dt
+            if t <= duration:
+                return pos, vel, acc, jerk
+            t -= duration
+        return self.distance, 0.0, 0.0, 0.0
+
+
+def fit_segments(profile, counts, motor_freq, max_ticks):
+    """
+    Fit move segments with forward differences to an S-curve.
+
+    Args:
+        profile (SCurve): path profile
+        counts (list[int]): displacement per axis in polynomial counts
+        motor_freq (float): polynomial update frequency in Hz
+        max_ticks (int): maximum ticks of a segment, see hdl_cfg.move_ticks
+
+    Returns:
+        list of (ticks, coefficients), coefficients are [D1, D2, D3] per axis
+    """
+    # segment boundaries in ticks, phases are split in segments of equal length
+    bounds = [0]
+    elapsed = 0.0
+    for duration, jerk in profile.phases:
+        elapsed += duration
+        end = round(elapsed * motor_freq)
+        limit = JERK_TICKS if jerk else max_ticks
+        pieces = -(-(end - bounds[-1]) // limit)
+        start = bounds[-1]
+        for piece in range(1, pieces + 1):
+            bounds.append(start + (end - start) * piece // pieces)
+    if bounds[-1] == 0:
+        bounds.append(1)
+
+    scale = [count / profile.distance for count in counts]
+    position = [0] * len(counts)
+    segments = []
+    for idx in range(1, len(bounds)):
+        begin, end = bounds[idx - 1], bounds[idx]
+        n = end - begin
+        acc = profile.state(begin / motor_freq)[2]
+        jerk = profile.state((begin + end) / 2 / motor_freq)[3]
+        target = profile.state(end / motor_freq)[0]
+        pairs = n * (n - 1) // 2
+        triples = pairs * (n - 2) // 3
+        coefficients = []
+        for axis, factor in enumerate(scale):
+            d3 = int(factor * jerk / motor_freq**3)
+            d2 = round(factor * acc / motor_freq**2) + d3
+            if idx == len(bounds) - 1:
+                goal = counts[axis]
+            else:
+                goal = round(factor * target)
+            d1 = round((goal - position[axis] - pairs * d2 - triples * d3) / n)
+            position[axis] += n * d1 + pairs * d2 + triples * d3
+            coefficients += [d1, d2, d3]
+        segments.append((n, coefficients))
+    return segments
@@ -11,6 +11,14 @@ Example usage:
 
 import asyncio
 
+try:
+    import threading
+
+    THREADED = hasattr(asyncio, "run_coroutine_threadsafe")
+except ImportError:
+    # MicroPython without _thread, the single event loop is reused
+    THREADED = False
+
 
 def _is_coro_like(obj):
     """Return True if `obj` looks like a coroutine/generator (MicroPython/CPython)."""
@@ -33,6 +41,9 @@ def _loop_is_running():
         try:
             get_running_loop()
             return True
+        except RuntimeError:
+            # authoritative on CPython, no need for the deprecated fallback
+            return False
         except Exception:
             pass
     # CPython older: get_event_loop().is_running()
@@ -48,50 +59,84 @@ def _loop_is_running():
     return False
 
 
+class _BackgroundLoop:
+    """Long-lived event loop shared by all sync calls.
+
+    CPython: the loop runs forever on a daemon thread and coroutines are
+    submitted with run_coroutine_threadsafe. Creating and closing a loop per
+    call with asyncio.run() is avoided.
+    MicroPython: there is a single event loop, it is reused with
+    run_until_complete.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self._lock = threading.Lock() if THREADED else None
+
+    def _start(self):
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(ready.set)
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="syncwrap-loop", daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def run(self, coro):
+        if not THREADED:
+            return asyncio.get_event_loop().run_until_complete(coro)
+        with self._lock:
+            if self.loop is None or self.loop.is_closed():
+                self._start()
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            # e.g. KeyboardInterrupt in the REPL, do not leave the task running
+            future.cancel()
+            raise
+
+    def stop(self):
+        """Stop the background loop, a new one is started on the next call."""
+        if self.loop is None or not THREADED:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        self.thread = None
+
+
+_background = _BackgroundLoop()
+
+
 def _run_sync(coro):
-    """Run a coroutine to completion when no loop is active.
-    If a loop is running, close the coroutine to avoid 'never awaited' warnings,
-    then raise RuntimeError.
+    """Run a coroutine to completion on the shared background loop.
+    If a loop is running in the calling thread, close the coroutine to avoid
+    'never awaited' warnings, then raise RuntimeError; blocking here would
+    deadlock the running loop.
     """
-    if not _loop_is_running():
-        # Case 1: No loop is running (e.g., in REPL or simple sync function).
-        # Use asyncio.run, which handles loop creation and cleanup.
-        return asyncio.run(coro)
-
-    # Case 2: A loop is already running (e.g., inside an async test or task).
-    # We MUST NOT call asyncio.run() or it will raise the error.
-    # Instead, we get the active loop and use its run_until_complete.
-    # This is generally acceptable in test contexts where you block a thread
-    # to wait for an async result.
-    try:
-        # Get the running loop. get_event_loop() is used here for broadest compatibility.
-        loop = asyncio.get_event_loop()
-
-        # NOTE: loop.is_running() should be True at this point based on the check above,
-        # but using get_event_loop() is the most reliable way to get a loop object
-        # that *might* be running if current_task/get_running_loop failed.
-
-        # Run the coroutine to completion, blocking the current thread.
-        return loop.run_until_complete(coro)
-
-    except RuntimeError as e:
-        # If get_event_loop() raises a RuntimeError (e.g., "no current event loop"),
-        # or if run_until_complete fails in a nested context, re-raise it.
-        # Ensure coroutine closure to prevent 'never awaited' warning.
+    if _loop_is_running():
         closer = getattr(coro, "close", None)
         if callable(closer):
             closer()
         raise RuntimeError(
             "Cannot run synchronously while an event loop is running. "
             "If inside an async function, use 'await' directly."
-        ) from e
+        )
+    return _background.run(coro)
 
 
 class SyncProxy:
     """
     Proxy that wraps an object and automatically runs async methods
-    synchronously using asyncio.run(). Useful in tests or REPL when
-    you want to call async APIs like normal functions.
+    synchronously on a persistent background event loop. Useful in tests or
+    REPL when you want to call async APIs like normal functions.
     """
 
     __slots__ = ("_obj",)
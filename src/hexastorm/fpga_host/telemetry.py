@@ -0,0 +1,192 @@
+"""
+Low-overhead host telemetry.
+
+Counters and fixed-size log2 histograms of integer samples. No allocation
+happens while recording, so it is safe to keep enabled during a job on
+MicroPython. A snapshot can be taken at any moment as a dict or JSON string.
+
+Metrics recorded by the hosts:
+    commands, bytes_sent              -- SPI transactions and payload
+    send_latency_us                   -- duration of a single send_command
+    mem_full_waits, mem_full_wait_us  -- time blocked on the mem_full pin
+    fifo_empty_polls                  -- status polls in wait_fifo_empty
+    scanlines                         -- scanline instructions queued
+"""
+
+import json
+
+try:
+    from time import ticks_diff, ticks_ms, ticks_us
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1_000_000)
+
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+class Histogram:
+    """
+    Histogram with power-of-two buckets.
+
+    Bucket 0 counts zeros and bucket i values in [2**(i-1), 2**i), i.e. the
+    bit length of the value. The last bucket collects all larger values.
+
+    Args:
+        buckets (int): Number of buckets, 27 covers 0 to ~67 s in microseconds.
+    """
+
+    def __init__(self, buckets=27):
+        self.buckets = [0] * buckets
+        self.reset()
+
+    def reset(self):
+        for idx in range(len(self.buckets)):
+            self.buckets[idx] = 0
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def add(self, value):
+        value = int(value)
+        value = max(value, 0)
+        # MicroPython ints have no bit_length
+        idx = 0
+        last = len(self.buckets) - 1
+        while idx < last and value >> idx:
+            idx += 1
+        self.buckets[idx] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        self.max = max(self.max, value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket containing the given fraction of samples."""
+        if self.count == 0:
+            return 0
+        target = fraction * self.count
+        seen = 0
+        last = len(self.buckets) - 1
+        for idx, cnt in enumerate(self.buckets[:last]):
+            seen += cnt
+            if seen >= target:
+                return min((1 << idx) - 1, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else 0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "buckets": list(self.buckets),
+        }
+
+
+class Telemetry:
+    """
+    Collection of named counters and histograms.
+
+    Args:
+        enabled (bool): If False, recording calls return immediately.
+        clock_us (callable): Optional monotonic clock in microseconds, used by
+            simulated hosts. Defaults to time.ticks_us.
+
+    Usage:
+        start = telemetry.now()
+        ...
+        telemetry.observe("send_latency_us", telemetry.since(start))
+        telemetry.snapshot()
+    """
+
+    COUNTERS = (
+        "commands",
+        "bytes_sent",
+        "mem_full_waits",
+        "fifo_empty_polls",
+        "scanlines",
+    )
+    HISTOGRAMS = ("send_latency_us", "mem_full_wait_us")
+
+    def __init__(self, enabled=True, clock_us=None):
+        self.enabled = enabled
+        self._clock_us = clock_us
+        self.counters = {name: 0 for name in self.COUNTERS}
+        self.histograms = {name: Histogram() for name in self.HISTOGRAMS}
+        self.reset()
+
+    def now(self):
+        """Timestamp in microseconds, only meaningful for :meth:`since`."""
+        if self._clock_us is None:
+            return ticks_us()
+        return self._clock_us()
+
+    def since(self, start):
+        """Microseconds elapsed since a timestamp from :meth:`now`."""
+        if self._clock_us is None:
+            return ticks_diff(ticks_us(), start)
+        return self._clock_us() - start
+
+    def _now_ms(self):
+        if self._clock_us is None:
+            return ticks_ms()
+        return self._clock_us() // 1000
+
+    def reset(self):
+        """Clear all metrics and restart the rate window."""
+        for name in self.counters:
+            self.counters[name] = 0
+        for hist in self.histograms.values():
+            hist.reset()
+        self._start_ms = self._now_ms()
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] += amount
+
+    def observe(self, name, value):
+        if self.enabled:
+            self.histograms[name].add(value)
+
+    def snapshot(self):
+        """
+        Return all metrics as a dictionary.
+
+        Rates are computed over the time since the last reset.
+        """
+        if self._clock_us is None:
+            elapsed_ms = ticks_diff(ticks_ms(), self._start_ms)
+        else:
+            elapsed_ms = self._now_ms() - self._start_ms
+        elapsed = elapsed_ms / 1000
+        counters = self.counters
+        rates = {}
+        for name, key in (
+            ("bytes_per_sec", "bytes_sent"),
+            ("scanlines_per_sec", "scanlines"),
+            ("commands_per_sec", "commands"),
+        ):
+            rates[name] = counters[key] / elapsed if elapsed > 0 else 0
+        return {
+            "elapsed_s": elapsed,
+            "counters": dict(counters),
+            "rates": rates,
+            "histograms": {
+                name: hist.snapshot() for name, hist in self.histograms.items()
+            },
+        }
+
+    def to_json(self):
+        """Snapshot serialized as JSON string."""
+        return json.dumps(self.snapshot())
@@ -90,11 +90,27 @@ def _jit_fypos(
     return ypos / params["samplegridsize"]
 
 
+@jit(nopython=True, cache=True)
+def _jit_sweep_lanes(lanes: int, channels: int, offset: int) -> int:
+    """
+    Number of lanes swept by the stage to expose the lanes of the image.
+
+    With two laser channels, the second channel exposes the lane `offset`
+    lanes next to the first. The stage sweeps `offset` neighbouring lanes,
+    which expose a block of 2 * offset lanes, and then moves to the next block.
+    """
+    block = channels * offset
+    return offset * ((lanes + block - 1) // block)
+
+
 @jit(nopython=True, cache=True)
 def _jit_calculate_grid(params: Any) -> Tuple[np.ndarray, Dict[str, float]]:
     """
     Generates the lookup coordinate grid using pre-allocation to avoid
     Numba concatenation errors.
+
+    With two laser channels, a sweep exposes two lanes and the points of
+    both channels are interleaved per pixel, see _jit_sweep_lanes.
     """
     if not params["sampleysize"] or not params["samplexsize"]:
         raise ValueError("Sampleysize or samplexsize are set to zero.")
@@ -111,8 +127,12 @@ def _jit_calculate_grid(params: Any) -> Tuple[np.ndarray, Dict[str, float]]:
     end_x = _jit_fxpos(params["bitsinscanline"] - 1, params, 0, 0.0)
     lanewidth = (start_x - end_x) * params["samplegridsize"]
 
-    # Calculate required lanes
-    lanes = math.ceil(params["samplexsize"] / lanewidth)
+    # Calculate required lanes, swept lanes expose a lane per channel
+    channels = int(params["laserchannels"])
+    offset = int(params["channeloffset"]) if channels > 1 else 1
+    lanes = _jit_sweep_lanes(
+        math.ceil(params["samplexsize"] / lanewidth), channels, offset
+    )
 
     # Calculate required facets
     facets_inlane = math.ceil(
@@ -124,7 +144,7 @@ def _jit_calculate_grid(params: Any) -> Tuple[np.ndarray, Dict[str, float]]:
     # --- PRE-CALCULATE SIZE & ALLOCATE MEMORY ---
     # This replaces the dynamic list appending
     points_per_sweep = int(params["bitsinscanline"])
-    total_points = int(lanes * facets_inlane * points_per_sweep)
+    total_points = int(lanes * facets_inlane * points_per_sweep * channels)
 
     # Pre-allocate the final arrays with the exact size needed
     x_final = np.empty(total_points, dtype=np.int32)
@@ -153,7 +173,7 @@ def _jit_calculate_grid(params: Any) -> Tuple[np.ndarray, Dict[str, float]]:
 
     for l_idx in range(lanes):
         is_forward = l_idx % 2 == 0
-        lane_x_offset = l_idx * x_width_pixels
+        first_lane = (l_idx // offset) * channels * offset + l_idx % offset
 
         for f_lane_idx in range(facets_inlane):
             facet_idx = f_lane_idx % num_physical_facets
@@ -175,10 +195,17 @@ def _jit_calculate_grid(params: Any) -> Tuple[np.ndarray, Dict[str, float]]:
 
             # --- DIRECT INSERTION ---
             # Instead of append, we slice directly into the final array
-            end_idx = current_idx + points_per_sweep
-
-            x_final[current_idx:end_idx] = (x_sweep + lane_x_offset).astype(np.int32)
-            y_final[current_idx:end_idx] = y_sweep.astype(np.int32)
+            end_idx = current_idx + points_per_sweep * channels
+
+            # The writer reverses the line, the first channel is placed last
+            # so it ends up first in every pixel as sent to the laserhead.
+            for channel in range(channels):
+                lane_x_offset = (first_lane + channel * offset) * x_width_pixels
+                start_idx = current_idx + channels - 1 - channel
+                x_final[start_idx:end_idx:channels] = (x_sweep + lane_x_offset).astype(
+                    np.int32
+                )
+                y_final[start_idx:end_idx:channels] = y_sweep.astype(np.int32)
 
             # Move the pointer forward
             current_idx = end_idx
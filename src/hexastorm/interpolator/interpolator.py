@@ -10,6 +10,8 @@ from PIL import Image
 import cv2
 
 from hexastorm.config import PlatformConfig
+from hexastorm.fpga_host.jobsim import JobSimulator
+from hexastorm.fpga_host.model import ModelHost
 from . import geometry
 from . import io
 
@@ -30,11 +32,40 @@ class Interpolator:
     2.  Maps these non-linear, curved scan coordinates onto the rectilinear grid
         of the input image.
     3.  Samples the image at these points to determine if the laser should be ON or OFF.
+
+    With two laser channels, every sweep exposes two lanes which are
+    `channel_offset` lanes apart, so a job needs half the lanes.
+
+    With `laser_bits` of 2 or 4, samples are grayscale levels, i.e. the
+    fraction of the pixel covered by the anti-aliased image, and a single
+    exposure sets the dose which otherwise takes several exposures.
+
+    The optional `laser_timing` slices for the timing set on the laserhead at
+    runtime, e.g. ``dict(laser_hz=...)``, see BaseHost.set_laser_timing.
     """
 
-    def __init__(self, correction: bool = False, exposures: int = 1):
-        self.cfg = PlatformConfig(test=False)
+    def __init__(
+        self,
+        correction: bool = False,
+        exposures: int = 1,
+        facet_offsets: bool = False,
+        laser_channels: int = 1,
+        channel_offset: int = 1,
+        laser_timing: dict = None,
+        laser_bits: int = 1,
+    ):
+        self.cfg = PlatformConfig(
+            test=False, laser_channels=laser_channels, laser_bits=laser_bits
+        )
+        if laser_timing:
+            self.cfg.set_laser_timing(**laser_timing)
+        self.laser_timing = laser_timing
         self.correction = correction
+        # scan corrections are applied by the laserhead, see set_facet_offsets
+        self.facet_offsets = facet_offsets
+        if channel_offset < 1:
+            raise ValueError("channel_offset must be at least one lane")
+        self.channel_offset = channel_offset
         self.exposures = exposures
         self.set_optical_params(correction=correction, exposures=exposures)
         self.debug_folder = self.cfg.paths["base"] / "debug"
@@ -47,16 +78,22 @@ class Interpolator:
             self.correction = correction
         if exposures is not None:
             self.exposures = exposures
-        # Initialize math parameters via config (pure python side)
-        raw_params = self.cfg.get_optical_params(
-            correction=self.correction, exposures=self.exposures
-        )
         # Initialize the Scanner model (JIT-compiled geometry calculations)
-        self.geo = geometry.ScannerModel(raw_params)
+        self.geo = geometry.ScannerModel(self._optical_params())
 
         # Link self.params to the JIT class params so we can read them easily
         self.params = self.geo.params
 
+    def _optical_params(self) -> dict:
+        """Math parameters via config (pure python side)."""
+        raw_params = self.cfg.get_optical_params(
+            correction=self.correction,
+            exposures=self.exposures,
+            scan_correction=not self.facet_offsets,
+        )
+        raw_params["channeloffset"] = float(self.channel_offset)
+        return raw_params
+
     def svgtopil(self, svg_filepath: Path) -> Image.Image:
         """
         Converts SVG vector graphics to a raster PIL Image.
@@ -84,8 +121,9 @@ class Interpolator:
         """
         Converts PIL Image to a numpy array and crops it to the region of interest.
         Also updates the system parameters (samplexsize/sampleysize) to match the actual image dimensions.
+        Grayscale exposure keeps the gray values, i.e. the coverage of the pixels.
         """
-        img_array = np.array(img.convert("1"))
+        img_array = np.array(img.convert("1" if self.cfg.laser_bits == 1 else "L"))
         if img_array.max() == 0:
             raise Exception("Image is empty")
 
@@ -166,15 +204,19 @@ class Interpolator:
             pil = self.imgtopil(file_path, pixelsize)
 
         layerarr = self.piltoarray(pil).astype(np.uint8)
+        # samples are levels, 0 is black, max_level white
+        max_level = (1 << self.cfg.laser_bits) - 1
+        if max_level > 1:
+            layerarr = np.round(layerarr * (max_level / 255)).astype(np.uint8)
         # laser is black in the current images
         if laser_compensate:
             layerarr = self.laser_compensation(layerarr, erode=False)
-            Image.fromarray(layerarr.astype(np.uint8) * 255).save(
+            Image.fromarray(layerarr.astype(np.uint8) * (255 // max_level)).save(
                 self.debug_folder / "erosioncheck.png"
             )
         if test:
             self.debug_folder.mkdir(parents=True, exist_ok=True)
-            img = Image.fromarray(layerarr.astype(np.uint8) * 255)
+            img = Image.fromarray(layerarr.astype(np.uint8) * (255 // max_level))
             img.save(self.debug_folder / "simplecheck.png")
 
         logger.debug("Retrieved image")
@@ -213,23 +255,36 @@ class Interpolator:
         logger.debug("Completed interpolation")
         logger.debug(f"Elapsed {time() - ctime:.2f} seconds")
 
-        if ptrn.min() < 0 or ptrn.max() > 1:
-            raise Exception("This is not a bit list")
+        if ptrn.min() < 0 or ptrn.max() > max_level:
+            raise Exception("This is not a list of levels")
 
         # 4. Handle Polarity and Padding
         # 'mask' defines the valid image area. '~mask' is the padding/overscan area.
         if not self.params["positiveresist"]:
             # Negative Resist: Invert image.
             # Force padding to 0 (Laser OFF) to avoid "white edge" artifacts.
-            ptrn = np.logical_not(ptrn)
+            ptrn = max_level - ptrn
             ptrn[~mask] = 0
         else:
             # Positive Resist: Keep image polarity.
             # WARNING: This logic sets padding to 1. Ensure this is intended behavior
             # (i.e., you want the laser ON outside the image area).
-            ptrn[~mask] = 1
-
-        ptrn = np.repeat(ptrn, self.params["downsamplefactor"])
+            ptrn[~mask] = max_level
+
+        # a level takes laser_bits bits, most significant first, as the
+        # line is reversed when written the laserhead reads it lsb first
+        level_bits = self.cfg.laser_bits
+        if level_bits > 1:
+            ptrn = np.unpackbits(ptrn[:, None], axis=1, bitorder="big")
+            ptrn = ptrn[:, 8 - level_bits :].reshape(-1)
+
+        # repeat pixels, i.e. the bits of all channels together
+        channels = int(self.params["laserchannels"])
+        ptrn = np.repeat(
+            ptrn.reshape(-1, channels * level_bits),
+            self.params["downsamplefactor"],
+            axis=0,
+        ).flatten()
         ptrn = np.packbits(ptrn, bitorder=self.bitorder)
         return ptrn
 
@@ -262,11 +317,18 @@ class Interpolator:
     ) -> float:
         """
         Calculates expected job duration in minutes directly from the pattern array.
+
+        For the machine, the job is simulated with raw lines at the default
+        SPI rate, see JobSimulator for FIFO margin and underruns.
         """
         if camera:
             # Unpack the bytes back to bits to easily check line by line
             data_bits = np.unpackbits(ptrn_packed, bitorder=self.bitorder)
-            scanline_length = self.cfg.laser_timing["scanline_length"]
+            scanline_length = (
+                self.cfg.laser_channels
+                * self.cfg.laser_bits
+                * self.cfg.laser_timing["scanline_length"]
+            )
 
             # Reshape into a 2D array: (total_lines, bits_per_line)
             lines2d = data_bits.reshape(-1, scanline_length)
@@ -278,22 +340,25 @@ class Interpolator:
             total_min = active_lines / 180.0
 
         else:
-            # Machine physical calculation
-            laz_tim = self.cfg.laser_timing
-            lanes = self.params["lanes"]
-            facets = self.params["facetsinlane"]
-
-            line_min = laz_tim["facets"] * laz_tim["rpm"]
-
-            expose_time = (lanes * facets) / line_min
-            startup_time = 0.8
-            lane_change_time = lanes * 0.2
-
-            total_min = startup_time + expose_time + lane_change_time
+            # stream the job to the behavioral model of the FPGA
+            cfg = self.cfg
+            host = ModelHost(
+                test=False,
+                laser_channels=cfg.laser_channels,
+                laser_bits=cfg.laser_bits,
+            )
+            sim = JobSimulator(host, laser_timing=self.laser_timing)
+            total_min = sim.run_params(self.params)["duration"] / 60
 
         return total_min
 
-    def writebin(self, pixeldata: np.ndarray, filename: Union[str, Path] = "test.bin"):
+    def writebin(
+        self,
+        pixeldata: np.ndarray,
+        filename: Union[str, Path] = "test.bin",
+        rle: bool = True,
+        burst: bool = False,
+    ):
         """Wrapper for io.write_binary_file"""
         # Resolve path: default to debug folder if not absolute
         out_path = Path(filename)
@@ -301,7 +366,7 @@ class Interpolator:
         if not out_path.is_absolute():
             out_path = self.cfg.paths["patterns"] / out_path
 
-        io.write_binary_file(pixeldata, self.params, out_path)
+        io.write_binary_file(pixeldata, self.params, out_path, rle=rle, burst=burst)
 
     def readbin(self, filename: Union[str, Path] = None) -> dict:
         """Wrapper for io.read_binary_file"""
@@ -314,10 +379,19 @@ class Interpolator:
 
         # Unpack the tuple internally
         facets, lanes, width, data_bytes = io.read_binary_file(
-            in_path, self.cfg.laser_timing, self.params["bitsinscanline"]
+            in_path,
+            self.cfg.laser_timing,
+            int(self.params["bitsinscanline"]),
+            self.cfg.laser_channels,
+            self.cfg.laser_bits,
         )
 
         data_bits = np.unpackbits(data_bytes, bitorder=self.bitorder)
+        level_bits = self.cfg.laser_bits
+        if level_bits > 1:
+            # grayscale, data holds a level per sample
+            weights = 1 << np.arange(level_bits - 1, -1, -1)
+            data_bits = data_bits.reshape(-1, level_bits) @ weights
 
         # Return a clean dictionary
         return {
@@ -349,10 +423,7 @@ class Interpolator:
 
         # 1. Setup Local Parameters (Start fresh, don't touch self.params)
         # We get the default hardware config (speeds, frequencies, etc.)
-        raw_params = self.cfg.get_optical_params(
-            correction=self.correction, exposures=self.exposures
-        )
-        local_params = geometry.ScannerModel.to_numba_dict(raw_params)
+        local_params = geometry.ScannerModel.to_numba_dict(self._optical_params())
 
         # A. Calculate the 'lanewidth' for this specific hardware config
         # We calculate this fresh to ensure it matches the JIT's logic
@@ -363,8 +434,10 @@ class Interpolator:
         calc_lanewidth = (start_x - end_x) * local_params["samplegridsize"]
 
         # B. Reverse-Engineer 'samplexsize'
-        # x_size = lanes * width
-        local_params["samplexsize"] = float(metadata["lanes"] * calc_lanewidth)
+        # x_size = lanes * channels * width, a sweep exposes a lane per channel
+        local_params["samplexsize"] = float(
+            metadata["lanes"] * local_params["laserchannels"] * calc_lanewidth
+        )
 
         # C. Reverse-Engineer 'sampleysize'
         # The formula used to create facets was:
@@ -443,7 +516,7 @@ class Interpolator:
                 # Check if this slice has any active bits
                 # (Optimization: boolean indexing is faster than creating sub-arrays)
                 lbits = bits_plot[start:end]
-                active_indices = np.where(lbits == 1)[0]
+                active_indices = np.where(lbits > 0)[0]
 
                 if active_indices.size > 0:
                     # Map local indices back to global indices
@@ -456,7 +529,7 @@ class Interpolator:
                     canvas[x_plot[global_indices], y_plot[global_indices]] = val
         else:
             # Standard Monochrome (assign 255 to all active pixels)
-            active_mask = bits_plot == 1
+            active_mask = bits_plot > 0
             canvas[x_plot[active_mask], y_plot[active_mask]] = VAL_ALL
 
         # 8. Apply Laser Compensation ONCE
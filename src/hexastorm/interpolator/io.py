@@ -2,10 +2,12 @@ import logging
 import struct
 import zlib
 from pathlib import Path
-from typing import Dict, Tuple, Any, Union
+from typing import Any
 
 import numpy as np
 from hexastorm.config import Spi
+from hexastorm.fpga_host import rle as rle_codec
+from .geometry import _jit_sweep_lanes
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +15,10 @@ logger = logging.getLogger(__name__)
 def write_binary_file(
     pixeldata: np.ndarray,
     params: Any,  # Can be dict or Numba typed dict
-    filepath: Union[str, Path],
+    filepath: str | Path,
     compression_level: int = 9,
+    rle: bool = True,
+    burst: bool = False,
 ) -> None:
     """
     Encodes and writes pixel data to a compressed binary file optimized for FPGA streaming.
@@ -25,6 +29,13 @@ def write_binary_file(
         direction (Zig/Zag) and timing configuration (Half-Period).
     3.  **SPI Packetization**: Chunks the data into 9-byte words (1 Write Command Byte + 8 Data Bytes).
     4.  **Endianness Correction**: Reverses the bit/byte order within chunks to match the FPGA's SPI shift register.
+    5.  **Run-Length Encoding**: Optionally, lines which are smaller run-length encoded
+        are written as RLE scanline instruction. Other lines stay raw, so the
+        number of words per line varies. Lines of two laser channels, with
+        interleaved bits, and grayscale lines are always raw.
+    6.  **Burst Writes**: Optionally, the words of a line follow a single burst
+        command byte instead of a write command byte each. The stream must then
+        be sent to the FPGA in one SPI transaction per burst.
 
     File Format:
         [Header: lanewidth(f32), facets(u32), lanes(u32)]
@@ -35,6 +46,8 @@ def write_binary_file(
         params: Geometry settings dict (must contain lanewidth, facetsinlane, etc.).
         filepath: Output destination path.
         compression_level: Zlib compression level (0-9).
+        rle: Run-length encode lines if this reduces their size.
+        burst: Write every line as burst, saves a command byte per word.
     """
     out_path = Path(filepath)
     # Ensure parent directory exists
@@ -47,9 +60,14 @@ def write_binary_file(
     bits_in_scanline = int(params["bitsinscanline"])
     samplexsize = float(params["samplexsize"])
     stepsperline = float(params["stepsperline"])
+    channels = int(params["laserchannels"])
+    level_bits = int(params["laserbits"])
+    offset = int(params["channeloffset"]) if channels > 1 else 1
 
-    lanes = int(np.ceil(samplexsize / lanewidth))
-    bytes_in_line = int(np.ceil(bits_in_scanline / 8))
+    lanes = _jit_sweep_lanes(int(np.ceil(samplexsize / lanewidth)), channels, offset)
+    bytes_in_line = int(np.ceil(channels * level_bits * bits_in_scanline / 8))
+    # run-length encoded lines drive a single laser channel with on/off pixels
+    rle = rle and channels * level_bits == 1
 
     # 2. Reshape & Global Reversal (Vectorized)
     try:
@@ -70,10 +88,13 @@ def write_binary_file(
 
     # 3. Pre-calculate Headers
     # Calculate the 7-byte configuration header once
-    def make_header(direction):
+    header_bits = Spi.scanline_header
+    words_shift = header_bits["direction"] + header_bits["half_period"]
+
+    def make_header(direction, words=0):
         half_period = int((bits_in_scanline - 1) // (stepsperline * 2))
-        # (HalfPeriod << 1) | Direction
-        payload = (half_period << 1) | direction
+        # (RLE words << 32) | (HalfPeriod << 1) | Direction
+        payload = (words << words_shift) | (half_period << 1) | direction
         return payload.to_bytes(7, "little")
 
     # Create full headers: [CMD_SCANLINE (0x03 usually)] + [Config Bytes]
@@ -88,6 +109,9 @@ def write_binary_file(
     pad_len = (8 - (total_len % 8)) % 8
     padding = b"\x00" * pad_len
     spi_write_cmd = Spi.Commands.write.to_bytes(1, "big")
+    rle_cmd = Spi.Instructions.rle_scanline.to_bytes(1, "big")
+    words_in_line = Spi.words_scanline({"scanline_length": bits_in_scanline}, channels)
+    burst_bytes = Spi.burst_words * 8
 
     # 4. Write Loop
     compressor = zlib.compressobj(level=compression_level)
@@ -111,16 +135,35 @@ def write_binary_file(
             lane_data = grid[lane_idx]
 
             for facet_idx in range(facets):
-                # Assemble payload: [Header] + [Image Data (reversed)] + [Padding]
-                full_payload = header + lane_data[facet_idx].tobytes() + padding
+                encoded = None
+                if rle:
+                    encoded = _encode_line(
+                        lane_data[facet_idx], bits_in_scanline, words_in_line
+                    )
+                if encoded is not None:
+                    # [RLE Header] + [Runs] + [Padding]
+                    words = rle_codec.words(encoded)
+                    full_payload = (
+                        rle_cmd
+                        + make_header(int(is_forward), words)
+                        + bytes(encoded)
+                        + b"\x00" * (words * 8 - len(encoded))
+                    )
+                else:
+                    # Assemble payload: [Header] + [Image Data (reversed)] + [Padding]
+                    full_payload = header + lane_data[facet_idx].tobytes() + padding
 
                 # SPI Chunking (Replaces byte_to_cmd_list)
                 # Loop over payload in 8-byte chunks
                 for i in range(0, len(full_payload), 8):
+                    if not burst:
+                        write_buffer.extend(spi_write_cmd)
+                    elif i % burst_bytes == 0:
+                        burst_len = min(len(full_payload) - i, burst_bytes) // 8
+                        write_buffer.append(Spi.Commands.burst | (burst_len - 1))
                     chunk = full_payload[i : i + 8]
                     # Reverse chunk for SPI endianness
                     chunk_reversed = chunk[::-1]
-                    write_buffer.extend(spi_write_cmd)
                     write_buffer.extend(chunk_reversed)
 
                 if len(write_buffer) >= IO_BUFFER_SIZE:
@@ -132,24 +175,151 @@ def write_binary_file(
         f.write(compressor.flush())
 
 
+def _encode_line(line_bytes: np.ndarray, bits_in_scanline: int, words_in_line: int):
+    """
+    Run-length encode the bytes of a scanline as sent to the FPGA.
+
+    The laserhead exposes every byte starting at its least significant bit.
+    Returns None if the encoded line is not smaller than the raw line.
+    """
+    bits = np.unpackbits(line_bytes, bitorder="little")[:bits_in_scanline]
+    starts = np.flatnonzero(np.diff(bits)) + 1
+    starts = np.concatenate(([0], starts))
+    lengths = np.diff(np.append(starts, bits.size))
+    # every run takes at least one byte, skip lines which can't get smaller
+    if (starts.size + 7) // 8 + 1 >= words_in_line:
+        return None
+    encoded = rle_codec.runs_to_bytes(bits[starts].tolist(), lengths.tolist())
+    if rle_codec.words(encoded) + 1 >= words_in_line:
+        return None
+    return encoded
+
+
+def _decode_line(runs: np.ndarray, bits_in_scanline: int, bytes_in_line: int):
+    """Expand runs of a scanline to its bytes, inverse of _encode_line."""
+    values = runs >> 7
+    lengths = (runs & (rle_codec.RUN_LENGTH - 1)).astype(np.int64) + 1
+    bits = np.repeat(values, lengths)[:bits_in_scanline]
+    line = np.zeros(bytes_in_line * 8, dtype=np.uint8)
+    line[: bits.size] = bits
+    return np.packbits(line, bitorder="little")
+
+
+def _split_words(raw_payload: np.ndarray) -> np.ndarray:
+    """
+    Strip the SPI command bytes, returns the words as (n, 8) array.
+
+    Words are preceded by a write command or grouped after a burst command.
+    """
+    write = Spi.Commands.write
+    total_words = raw_payload.size // 9
+    if raw_payload.size == 0 or raw_payload[0] == write:
+        words = raw_payload[: total_words * 9].reshape(total_words, 9)
+        if np.all(words[:, 0] == write):
+            return words[:, 1:]
+    chunks = []
+    idx = 0
+    while idx < raw_payload.size:
+        command = int(raw_payload[idx])
+        count = 1
+        if command & Spi.Commands.burst:
+            count = (command & (Spi.burst_words - 1)) + 1
+        end = min(idx + 1 + count * 8, raw_payload.size)
+        count = (end - idx - 1) // 8
+        chunks.append(raw_payload[idx + 1 : idx + 1 + count * 8])
+        idx = end
+    if not chunks:
+        return np.zeros((0, 8), dtype=np.uint8)
+    return np.concatenate(chunks).reshape(-1, 8)
+
+
+def _rle_words(header: np.ndarray) -> int:
+    """Data words of a run-length encoded scanline from its header word."""
+    header_bits = Spi.scanline_header
+    words_shift = header_bits["direction"] + header_bits["half_period"]
+    config = int.from_bytes(header[1:].tobytes(), "little")
+    return (config >> words_shift) & ((1 << header_bits["words"]) - 1)
+
+
+def read_scanlines(
+    filepath: str | Path,
+    laser_timing_cfg: dict,
+    channels: int = 1,
+    laser_bits: int = 1,
+) -> tuple[int, int, float, list]:
+    """
+    Reads the scanline instructions of a binary laser file as sent to the FPGA.
+
+    Unlike read_binary_file, lines are not decoded, e.g. to replay a job on
+    the behavioral model of the FPGA.
+
+    Args:
+        filepath: Path to the .bin file.
+        laser_timing_cfg: Configuration dict to determine SPI word length.
+        channels: Laser channels, lines hold a bit per channel for every pixel.
+        laser_bits: Bits per pixel and channel, more than one for grayscale.
+
+    Returns:
+        Tuple containing: (facets_in_lane, lanes, lanewidth, lines), with the
+        bytes of every scanline instruction, instruction byte first
+    """
+    path = Path(filepath)
+    if not path.exists():
+        raise FileNotFoundError(f"Binary file not found: {path}")
+
+    with open(path, "rb") as f:
+        data = zlib.decompress(f.read())
+
+    lanewidth, facets_in_lane, lanes = struct.unpack("<fII", data[:12])
+    words_in_line = Spi.words_scanline(laser_timing_cfg, channels, laser_bits)
+    raw_payload = np.frombuffer(data, dtype=np.uint8, offset=12)
+    words = _split_words(raw_payload)[:, ::-1]
+
+    lines = []
+    word_idx = 0
+    while word_idx < words.shape[0]:
+        header = words[word_idx]
+        if header[0] == Spi.Instructions.rle_scanline:
+            line_words = _rle_words(header) + 1
+        else:
+            line_words = words_in_line
+        lines.append(words[word_idx : word_idx + line_words].tobytes())
+        word_idx += line_words
+    if len(lines) != lanes * facets_in_lane:
+        logger.warning(
+            f"File size mismatch. Expected {lanes * facets_in_lane} lines, "
+            f"found {len(lines)}."
+        )
+    return facets_in_lane, lanes, lanewidth, lines
+
+
 def read_binary_file(
-    filepath: Union[str, Path], laser_timing_cfg: Dict, bits_in_scanline: int
-) -> Tuple[int, int, float, np.ndarray]:
+    filepath: str | Path,
+    laser_timing_cfg: dict,
+    bits_in_scanline: int,
+    channels: int = 1,
+    laser_bits: int = 1,
+) -> tuple[int, int, float, np.ndarray]:
     """
     Reads, decompresses, and decodes a binary laser file back into raw pixel data.
 
     This function reverses the "FPGA-ready" formatting applied by write_binary_file.
-    It strips the SPI command bytes, reverses the endianness corrections, and
-    discards the scanline configuration headers to return the pure image bitmap.
+    It strips the SPI command bytes, reverses the endianness corrections,
+    expands run-length encoded lines and discards the scanline configuration
+    headers to return the pure image bitmap.
 
     Args:
         filepath: Path to the .bin file.
         laser_timing_cfg: Configuration dict to determine SPI word length.
         bits_in_scanline: Expected number of valid bits per line (for trimming padding).
+        channels: Laser channels, lines hold a bit per channel for every pixel.
+        laser_bits: Bits per pixel and channel, more than one for grayscale.
 
     Returns:
         Tuple containing: (facets_in_lane, lanes, lanewidth, flattened_pixel_data)
     """
+    # Handle a float from the Numba typed dict, like write_binary_file
+    bits_in_scanline = int(bits_in_scanline)
     path = Path(filepath)
     if not path.exists():
         raise FileNotFoundError(f"Binary file not found: {path}")
@@ -162,46 +332,61 @@ def read_binary_file(
     lanewidth, facets_in_lane, lanes = struct.unpack("<fII", data[:12])
 
     # Geometry for parsing
-    words_in_line = Spi.words_scanline(laser_timing_cfg)
-    bytes_in_line = int(np.ceil(bits_in_scanline / 8))
+    words_in_line = Spi.words_scanline(laser_timing_cfg, channels, laser_bits)
+    bytes_in_line = int(np.ceil(channels * laser_bits * bits_in_scanline / 8))
     total_lines = lanes * facets_in_lane
 
     # Load Raw Data
     raw_payload = np.frombuffer(data, dtype=np.uint8, offset=12)
 
-    expected_size = total_lines * words_in_line * 9
-    if raw_payload.size != expected_size:
-        trunc_lines = raw_payload.size // (words_in_line * 9)
-        logger.warning(
-            f"File size mismatch. Expected {total_lines} lines, found {trunc_lines}."
-        )
-        total_lines = trunc_lines
-        raw_payload = raw_payload[: total_lines * words_in_line * 9]
-
-    # Reshape to (Lines, Words per Line, 9 Bytes per Word)
-    grid = raw_payload.reshape(total_lines, words_in_line, 9)
-
     # --- UNDO SPI PIPELINE ---
 
-    # A. Separate Headers (Word 0) from Data (Words 1..N)
-    # The first word of every line is the Command/Header word. We discard it.
-    data_grid = grid[:, 1:, :]
-
-    # B. Remove the first byte (Write Command 0x01) from every Data Word
-    # The remaining 8 bytes are actual pixel data.
-    payload_bytes = data_grid[:, :, 1:]
-
-    # C. Reverse the SPI Chunks
-    # The writing process reversed these 8-byte chunks. We reverse them back.
-    payload_bytes = payload_bytes[..., ::-1]
-
-    # D. Flatten lines
-    lines = payload_bytes.reshape(total_lines, -1)
-
-    # E. Trim padding (if image width isn't a perfect multiple of SPI words)
+    # A. Remove the command bytes and reverse the 8-byte chunks,
+    # the writing process reversed them.
+    words = _split_words(raw_payload)[:, ::-1]
+    total_words = words.shape[0]
+
+    # B. Split lines, the first word of every line is the header.
+    # Raw lines have a fixed number of words, run-length encoded lines
+    # store their number of data words in the header.
+    raw_lines = total_words == total_lines * words_in_line and np.all(
+        words[::words_in_line, 0] == Spi.Instructions.scanline
+    )
+    if raw_lines:
+        lines = words.reshape(total_lines, -1)[:, 8:]
+    else:
+        lines = np.zeros((total_lines, words_in_line * 8 - 8), dtype=np.uint8)
+        word_idx = 0
+        for line_idx in range(total_lines):
+            if word_idx >= total_words:
+                break
+            header = words[word_idx]
+            if header[0] == Spi.Instructions.rle_scanline:
+                data_words = _rle_words(header)
+            else:
+                data_words = words_in_line - 1
+            start = word_idx + 1
+            word_idx = start + data_words
+            if word_idx > total_words:
+                break
+            line_bytes = words[start:word_idx].reshape(-1)
+            if header[0] == Spi.Instructions.rle_scanline:
+                line_bytes = _decode_line(line_bytes, bits_in_scanline, bytes_in_line)
+            lines[line_idx, : line_bytes.size] = line_bytes
+        else:
+            line_idx = total_lines
+        if line_idx != total_lines:
+            logger.warning(
+                f"File size mismatch. Expected {total_lines} lines, found {line_idx}."
+            )
+            lines = lines[:line_idx]
+        if word_idx != total_words:
+            logger.warning("File size mismatch, trailing words are ignored.")
+
+    # C. Trim padding (if image width isn't a perfect multiple of SPI words)
     lines = lines[:, :bytes_in_line]
 
-    # F. Global Reverse
+    # D. Global Reverse
     # The writing process reversed the entire line. We reverse it back.
     lines = lines[:, ::-1]
 
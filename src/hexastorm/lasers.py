@@ -1,10 +1,229 @@
-from amaranth import Elaboratable, Module, Signal, Cat, Mux
+from amaranth import Elaboratable, Module, Signal, Cat, Const, Mux, signed
+from amaranth.hdl import Array
 from amaranth.lib.io import Buffer
+from amaranth.lib.memory import Memory
 
 from .config import Spi
 from .resources import LaserscannerRecord
 from .blocks.photodiode_debounce import PhotodiodeDebounce
-from .luna.memory import TransactionalizedFIFO
+from .luna.memory import SPRAMTransactionalizedFIFO, TransactionalizedFIFO
+
+
+class FacetStatistics(Elaboratable):
+    """
+    Accumulates the period of every facet at the photodiode pulses.
+
+    Per facet the number of periods, their sum, sum of squares, minimum and
+    maximum are kept. The host reads them in one SPI transaction and gets
+    exact statistics of every revolution instead of sampling the debug word.
+    The square is calculated with a shift-add multiplier, a bit per cycle,
+    which is far shorter than a facet period. A period measured while hold is
+    high is added once hold is released. The count saturates, periods are
+    then no longer added.
+
+    All statistics words are kept in a single block RAM as quarters of 16
+    bits. The word with count, minimum and maximum of the facet is read,
+    updated and written back, then the period and its square are added to
+    the sums a quarter per cycle. The square is calculated meanwhile. The
+    word at index is fetched a quarter per cycle and valid a few cycles after
+    index changes; a write to this word also updates the fetched word.
+    Without periods a word is zero.
+
+    Inputs:
+        valid  -- Period of facet in ticks is measured.
+        facet  -- Facet of the period.
+        ticks  -- Period in ticks.
+        hold   -- Keep the statistics stable, e.g. while they are read.
+        clear  -- Reset the statistics of all facets.
+        index  -- Word to read, see Spi.facet_stats.
+
+    Outputs:
+        word   -- Statistics word at index.
+    """
+
+    # RAM rows of a facet, four quarters of each word, and the bits of a row,
+    # i.e. the width of a block RAM
+    ROWS = 16
+    ROW_BITS = 16
+
+    def __init__(self, facets, max_ticks):
+        """
+        facets     -- number of facets of the prism
+        max_ticks  -- longest period in ticks
+        """
+        self.facets = facets
+        self.ticks_bits = max_ticks.bit_length()
+        assert self.ticks_bits <= Spi.facet_stats["ticks"], "period too long"
+
+        self.valid = Signal()
+        self.facet = Signal(range(facets))
+        self.ticks = Signal(self.ticks_bits)
+        self.hold = Signal()
+        self.clear = Signal()
+        # three words per facet, see Spi.words_facet_stats
+        self.index = Signal(range(3 * facets))
+        self.word = Signal(Spi.word_bytes * 8)
+
+    def elaborate(self, platform):
+        m = Module()
+        facets = self.facets
+        ticks_bits = self.ticks_bits
+        count_bits = Spi.facet_stats["count"]
+        field_bits = Spi.facet_stats["ticks"]
+        row_bits = self.ROW_BITS
+        width = len(self.word)
+        quarters = width // row_bits
+        # the head word, sum and sum of squares
+        used_rows = 3 * quarters
+        assert quarters * row_bits == width and used_rows <= self.ROWS
+        assert count_bits + 2 * ticks_bits <= width
+
+        # rows are Cat(quarter, word, facet)
+        rows = self.ROWS << len(self.facet)
+        m.submodules.memory = memory = Memory(shape=row_bits, depth=rows, init=[])
+        read_port = memory.read_port()
+        write_port = memory.write_port()
+
+        # period being added, a new period is dropped until it is done
+        pending = Signal()
+        facet = Signal.like(self.facet)
+        ticks = Signal.like(self.ticks)
+        # the multiplier is shifted out as the product is shifted in
+        product = Signal(2 * ticks_bits)
+        partial = Signal(ticks_bits + 1)
+        bit = Signal(range(ticks_bits + 1))
+        # [count] + [min] + [max] of the facet, read from memory
+        head = Array(Signal(row_bits, name=f"head{i}") for i in range(quarters))
+        row = Signal(range(self.ROWS))
+        carry = Signal()
+        clearing = Signal()
+        clear_row = Signal.like(write_port.addr)
+
+        # the word at index is fetched a quarter per cycle if the RAM is free
+        word_facet = Signal.like(self.facet)
+        word_type = Signal(2)
+        m.d.comb += [
+            word_facet.eq(Array(idx // 3 for idx in range(3 * facets))[self.index]),
+            word_type.eq(Array(idx % 3 for idx in range(3 * facets))[self.index]),
+        ]
+        phase = Signal(range(quarters))
+        fetched = Signal(len(phase) + 1)
+        parts = Array(Signal(row_bits, name=f"quarter{i}") for i in range(quarters))
+        m.d.sync += [phase.eq(phase + 1), fetched.eq(Cat(phase, 1))]
+        m.d.comb += read_port.addr.eq(Cat(phase, word_type, word_facet))
+        with m.If(fetched[-1]):
+            m.d.sync += parts[fetched[:-1]].eq(read_port.data)
+
+        # the period updates count, minimum and maximum of the head
+        flat = Cat(*head)
+        count = flat[:count_bits]
+        lowest = flat[count_bits : count_bits + ticks_bits]
+        highest = flat[count_bits + field_bits : count_bits + field_bits + ticks_bits]
+        first = count == 0
+        padding = Const(0, field_bits - ticks_bits)
+        updated = Cat(
+            (count + 1)[:count_bits],
+            Mux(first | (ticks < lowest), ticks, lowest),
+            padding,
+            Mux(first | (ticks > highest), ticks, highest),
+            padding,
+        )
+
+        # the square is ready before the rows of the sum of squares are added
+        with m.If(bit != ticks_bits):
+            m.d.comb += partial.eq(product[ticks_bits:] + Mux(product[0], ticks, 0))
+            m.d.sync += [
+                product.eq(Cat(product[1:ticks_bits], partial)),
+                bit.eq(bit + 1),
+            ]
+
+        with m.FSM(name="facet_stats"):
+            # valid only sets pending, it ends a long path in the laserhead
+            with m.State("IDLE"):
+                with m.If(~pending):
+                    m.d.sync += [
+                        pending.eq(self.valid),
+                        facet.eq(self.facet),
+                        ticks.eq(self.ticks),
+                        product.eq(self.ticks),
+                        bit.eq(0),
+                    ]
+                with m.Elif(~self.hold & ~self.clear & ~clearing):
+                    m.d.comb += read_port.addr.eq(Cat(Const(0, len(row)), facet))
+                    m.d.sync += [pending.eq(0), row.eq(0), fetched.eq(0)]
+                    m.next = "HEAD"
+            # the head is read a row per cycle
+            with m.State("HEAD"):
+                m.d.comb += read_port.addr.eq(Cat((row + 1)[: len(row)], facet))
+                m.d.sync += [
+                    head[row[: len(phase)]].eq(read_port.data),
+                    row.eq(row + 1),
+                    fetched.eq(0),
+                ]
+                with m.If(row == quarters - 1):
+                    m.d.sync += [row.eq(0), carry.eq(0)]
+                    with m.If(count == (1 << count_bits) - 1):
+                        m.next = "IDLE"
+                    with m.Else():
+                        m.next = "ADD"
+            # the head is written, the read sum rows plus the period or its
+            # square are written back
+            with m.State("ADD"):
+                addends = Cat(
+                    updated,
+                    ticks,
+                    Const(0, width - ticks_bits),
+                    product,
+                    Const(0, width - 2 * ticks_bits),
+                )
+                addend = Array(
+                    addends[idx * row_bits : (idx + 1) * row_bits]
+                    for idx in range(used_rows)
+                )[row]
+                result = Signal(row_bits + 1)
+                in_head = row < quarters
+                # a word starts without carry
+                word_start = row[: len(phase)] == 0
+                m.d.comb += [
+                    result.eq(
+                        Mux(in_head, 0, read_port.data) + addend + (carry & ~word_start)
+                    ),
+                    read_port.addr.eq(Cat(row, facet)),
+                ]
+                m.d.sync += fetched.eq(0)
+                with m.If((row < 2 * quarters) | (bit == ticks_bits)):
+                    m.d.comb += [
+                        write_port.addr.eq(Cat(row, facet)),
+                        write_port.data.eq(result[:row_bits]),
+                        write_port.en.eq(1),
+                        read_port.addr.eq(Cat((row + 1)[: len(row)], facet)),
+                    ]
+                    m.d.sync += [carry.eq(result[row_bits]), row.eq(row + 1)]
+                    with m.If(row == used_rows - 1):
+                        m.next = "IDLE"
+
+        # the parser clears after a read, i.e. long after a period is added
+        with m.If(self.clear):
+            m.d.sync += [clearing.eq(1), clear_row.eq(0)]
+        with m.Elif(clearing):
+            m.d.comb += [
+                write_port.addr.eq(clear_row),
+                write_port.data.eq(0),
+                write_port.en.eq(1),
+            ]
+            m.d.sync += [clear_row.eq(clear_row + 1), fetched.eq(0)]
+            with m.If(clear_row == rows - 1):
+                m.d.sync += clearing.eq(0)
+
+        # a write to the word at index also updates the fetched word
+        with m.If(
+            write_port.en
+            & (write_port.addr[len(phase) :] == Cat(word_type, word_facet))
+        ):
+            m.d.sync += parts[write_port.addr[: len(phase)]].eq(write_port.data)
+
+        m.d.comb += self.word.eq(Cat(*parts))
+        return m
 
 
 class Laserhead(Elaboratable):
@@ -13,12 +232,25 @@ class Laserhead(Elaboratable):
 
     This module manages synchronization with a photodiode, precise timing of laser
     exposure, scanline processing from FIFO, and motor stepping logic. It supports
-    single-facet and multi-facet scanning modes.
+    single-facet and multi-facet scanning modes. Lines are only exposed on the
+    facets enabled by the facet mask, which is set by a facet_mask instruction.
+    The start of a line is shifted by the offset of its facet, offsets are set
+    by facet_offset instructions and correct the facets in the scan direction.
+    The period of every facet is added to the facet statistics.
+    The laser timing is kept in registers, set by laser_timing instructions
+    up to the maximums of the build, see PlatformConfig.set_laser_timing.
+    With two laser channels, a raw scanline holds a bit per channel for every
+    pixel and the lasers are driven independently. Run-length encoded lines
+    only drive the first laser. With grayscale exposure a channel takes
+    hdl_cfg.laser_bits bits per pixel, the laser is on for level / max level
+    of the laser period, rounded up to a tick.
 
     Inputs:
         synchronize     -- Start/enable synchronization process.
-        singlefacet     -- Limit operation to a single facet.
+        singlefacet     -- Limit operation to a single facet, i.e. facet mask 1.
         expose_start    -- Start exposing scanlines.
+        write_config    -- Write the facet_mask, facet_offset or laser_timing
+                           instruction in read_data to the registers.
         read_data       -- Data from scanline FIFO.
         empty           -- FIFO empty flag.
         enable_prism_in -- Enable signal for motor driver.
@@ -47,11 +279,25 @@ class Laserhead(Elaboratable):
         self.synchronize = Signal()
         self.synchronized = Signal()
         self.singlefacet = Signal()
+        assert laz_tim["facets"] <= hdl_cfg.mem_width - 8, "too many facets"
+        self.facet_mask = Signal(laz_tim["facets"], init=(1 << laz_tim["facets"]) - 1)
+        self.facet_offsets = Array(
+            Signal(signed(Spi.facet_offset_bits), name=f"facet_offset{idx}")
+            for idx in range(laz_tim["facets"])
+        )
         self.expose_start = Signal()
+        self.write_config = Signal()
         self.expose_finished = Signal()
         self.error = Signal()
         self.process_lines = Signal()
         self.facet_period_ticks = Signal(hdl_cfg.mem_width)
+        # runtime laser timing, see Spi.laser_timing_registers
+        self.timing = {
+            name: Signal(
+                range(laz_tim[f"max_{name}"] + 1), init=laz_tim[name], name=name
+            )
+            for name in Spi.laser_timing_registers
+        }
 
         # Motor and laser control
         self.enable_prism_in = Signal()
@@ -74,19 +320,27 @@ class Laserhead(Elaboratable):
             n_low=laz_tim["photodiode_trigger_ticks"],
             n_high=laz_tim["photodiode_rearm_ticks"],
         )
+        self.facet_stats = FacetStatistics(
+            facets=laz_tim["facets"],
+            max_ticks=laz_tim["max_facet_ticks"] + laz_tim["jitter_sync_ticks"],
+        )
 
     def elaborate(self, platform):
         m = Module()
         laz_tim = self.plf_cfg.laser_timing
         hdl_cfg = self.plf_cfg.hdl_cfg
         lh_rec = self.lh_rec
+        timing = self.timing
 
         enable_prism = Signal()
         lasers = Signal(2)
+        # lasers gated by the grayscale level of the pixel
+        exposed = Signal(2)
 
         m.d.comb += [
             lh_rec.en.eq(self.enable_prism_in | enable_prism),
-            lh_rec.lasers.eq(self.lasers_in | lasers),
+            lh_rec.lasers.eq(self.lasers_in | exposed),
+            exposed.eq(lasers),
         ]
 
         if platform is not None:
@@ -105,9 +359,12 @@ class Laserhead(Elaboratable):
         # Photodiode debounce
         m.submodules.pd_db = pd_db = self.pd_db
 
+        # Period statistics, periods within the jitter window are added
+        m.submodules.facet_stats = facet_stats = self.facet_stats
+
         # Pulse generator for prism motor
-        pwm_counter = Signal(range(laz_tim["motor_period"]))
-        with m.If(pwm_counter == laz_tim["motor_period"] - 1):
+        pwm_counter = Signal(range(laz_tim["max_motor_period"]))
+        with m.If(pwm_counter >= timing["motor_period"] - 1):
             m.d.sync += [
                 lh_rec.pwm.eq(~lh_rec.pwm),
                 pwm_counter.eq(0),
@@ -147,26 +404,109 @@ class Laserhead(Elaboratable):
             ]
 
         # step generator, i.e. slowest speed is 1/(2^4-1)
-        stephalfperiod = Signal(laz_tim["scanline_length"].bit_length() + 4)
+        stephalfperiod = Signal(laz_tim["max_scanline_length"].bit_length() + 4)
         stepcnt = Signal.like(stephalfperiod)
 
+        # scanline repeat, the line is read again from the FIFO
+        # by discarding the read instead of committing it
+        header = Spi.scanline_header
+        period_start = 8 + header["direction"]
+        words_start = period_start + header["half_period"]
+        repeat_start = words_start + header["words"]
+        repeats = Signal(header["repeat"])
+        replay = Signal()
+
+        # run-length encoded scanline, a word holds several runs
+        run_bits = Spi.rle_run_bits
+        runs_word = hdl_cfg.mem_width // run_bits
+        rle = Signal()
+        run_index = Signal(range(runs_word))
+        runleft = Signal(run_bits - 1)
+        runbit = Signal()
+        run = Signal(run_bits)
+
         # Laser FSM
         assert laz_tim["facets"] < 2**8, "too many facets"
         facetcnt = Signal(8)  # 1 byte, is sent back
         linecnt = Signal.like(facetcnt)
-        lasercnt = Signal(range(laz_tim["laser_ticks"]))
-        byte_index = Signal(range(laz_tim["scanline_length"] + 1))
+        lasercnt = Signal(range(laz_tim["max_laser_ticks"]))
+        byte_index = Signal(range(laz_tim["max_scanline_length"] + 1))
 
         # Auto-size the tickcounter
         tickcounter_max = max(laz_tim["spinup_ticks"], laz_tim["stable_ticks"])
         assert tickcounter_max < 2**32, "tickcounter too large"
         tickcounter = Signal(range(tickcounter_max + 1))
+        m.d.comb += [
+            facet_stats.facet.eq(facetcnt),
+            facet_stats.ticks.eq(tickcounter),
+        ]
 
         fast_timeout_en = Signal()
 
+        # tick at which the line of the current facet starts
+        assert laz_tim["start_ticks"] > 0
+        start_ticks = Signal(signed(max(len(tickcounter), Spi.facet_offset_bits) + 1))
+
+        # raw scanline, a pixel holds a bit or a grayscale level per laser channel
+        channels = hdl_cfg.laser_channels
+        level_bits = hdl_cfg.laser_bits
+        pixel_bits = channels * level_bits
+        pixels_word = hdl_cfg.mem_width // pixel_bits
         read_data = self.read_data
         read_old = Signal.like(read_data)
-        bit_index = Signal(range(hdl_cfg.mem_width))
+        bit_index = Signal(range(pixels_word))
+        levels = Signal(pixel_bits)
+
+        # grayscale, elapsed ticks of the pixel and level times laser_ticks,
+        # both times the maximum level. A dose is valid a tick after the
+        # pixel is loaded, at the first tick the laser is on for any level.
+        max_level = (1 << level_bits) - 1
+        dose_bits = level_bits + len(timing["laser_ticks"])
+        elapsed = Signal(dose_bits)
+        doses = [Signal(dose_bits, name=f"dose{i}") for i in range(channels)]
+        if level_bits > 1:
+            for channel in range(channels):
+                level = levels[channel * level_bits : (channel + 1) * level_bits]
+                m.d.sync += doses[channel].eq(level * timing["laser_ticks"])
+
+        def load_pixel(pixel):
+            """Statements which expose the first pixel of pixel data."""
+            if level_bits == 1:
+                return [lasers[:channels].eq(pixel[:channels])]
+            stmts = [levels.eq(pixel[:pixel_bits])]
+            for channel in range(channels):
+                level = pixel[channel * level_bits : (channel + 1) * level_bits]
+                stmts.append(lasers[channel].eq(level.any()))
+            return stmts
+
+        # facet of the current photodiode pulse enabled, a line waiting
+        # for a disabled facet moves on to the next facet
+        facet_enabled = Signal()
+        next_facet = Signal.like(facetcnt)
+        m.d.comb += [
+            facet_enabled.eq(
+                Mux(self.singlefacet, 1, self.facet_mask).bit_select(facetcnt, 1)
+            ),
+            next_facet.eq(Mux(facetcnt == laz_tim["facets"] - 1, 0, facetcnt + 1)),
+        ]
+
+        # configuration read by the laserhead between lines or written by
+        # the dispatcher while no lines are processed, the word is latched
+        # so the decode is not on the path from the FIFO. Other words clear
+        # it, zero is no configuration instruction.
+        config = Signal.like(read_data)
+        read_config = Signal()
+        m.d.sync += config.eq(Mux(self.write_config | read_config, read_data, 0))
+        with m.Switch(config[:8]):
+            with m.Case(Spi.Instructions.facet_mask):
+                m.d.sync += self.facet_mask.eq(config[8:])
+            with m.Case(Spi.Instructions.facet_offset):
+                offset = config[16 : 16 + Spi.facet_offset_bits]
+                m.d.sync += self.facet_offsets[config[8:16]].eq(offset)
+            with m.Case(Spi.Instructions.laser_timing), m.Switch(config[8:16]):
+                for idx, name in enumerate(Spi.laser_timing_registers):
+                    with m.Case(idx):
+                        m.d.sync += timing[name].eq(config[16:])
 
         with m.FSM(init="RESET") as laserfsm:
             with m.State("RESET"):
@@ -177,6 +517,8 @@ class Laserhead(Elaboratable):
                     lasers.eq(0),
                     linecnt.eq(0),
                     fast_timeout_en.eq(0),
+                    repeats.eq(0),
+                    replay.eq(0),
                 ]
                 m.next = "STOP"
 
@@ -192,6 +534,8 @@ class Laserhead(Elaboratable):
                     byte_index.eq(0),
                     lasercnt.eq(0),
                     lasers.eq(0),
+                    repeats.eq(0),
+                    replay.eq(0),
                 ]
                 with m.If(self.synchronize & (~self.error)):
                     # Error: photodiode cannot be high without active laser
@@ -245,29 +589,33 @@ class Laserhead(Elaboratable):
                     ]
 
                     # Check if synchronization timing is within expected range
-                    min_ticks = laz_tim["facet_ticks"] - laz_tim["jitter_sync_ticks"]
-                    max_ticks = laz_tim["facet_ticks"] + laz_tim["jitter_sync_ticks"]
-                    within = (tickcounter >= min_ticks) & (tickcounter <= max_ticks)
+                    jitter = laz_tim["jitter_sync_ticks"]
+                    within = (tickcounter + jitter >= timing["facet_ticks"]) & (
+                        tickcounter <= timing["facet_ticks"] + jitter
+                    )
                     with m.If(within):
+                        m.d.comb += facet_stats.valid.eq(1)
                         m.d.sync += [
                             self.synchronized.eq(1),
                             self.facet_period_ticks.eq(Cat(facetcnt, tickcounter)),
+                            start_ticks.eq(
+                                timing["start_ticks"] + self.facet_offsets[facetcnt]
+                            ),
                         ]
 
                         # Increment or reset facet counter
-                        with m.If(facetcnt == laz_tim["facets"] - 1):
-                            m.d.sync += facetcnt.eq(0)
-                        with m.Else():
-                            m.d.sync += facetcnt.eq(facetcnt + 1)
+                        m.d.sync += facetcnt.eq(next_facet)
 
-                        # Exit early if only a single facet should be scanned
-                        with m.If(self.singlefacet & (facetcnt > 0)):
+                        # Exit early if the facet is not scanned
+                        with m.If(~facet_enabled):
+                            with m.If(linecnt == facetcnt):
+                                m.d.sync += linecnt.eq(next_facet)
                             m.next = "WAIT_END"
                         # Exit if FIFO is empty or scanning is complete
                         with m.Elif(self.empty | ~self.process_lines):
                             m.next = "WAIT_END"
                         # Proceed to read instruction
-                        with m.Elif((linecnt == facetcnt) | self.singlefacet):
+                        with m.Elif(linecnt == facetcnt):
                             m.d.sync += [
                                 fast_timeout_en.eq(1),
                                 self.read_en.eq(1),
@@ -288,16 +636,23 @@ class Laserhead(Elaboratable):
             with m.State("READ_INSTRUCTION"):
                 m.d.sync += [
                     self.read_en.eq(0),
+                    self.read_commit.eq(0),
                     tickcounter.eq(tickcounter + 1),
                     linecnt.eq(facetcnt),
                 ]
                 instruction = read_data[:8]
                 with m.Switch(instruction):
-                    with m.Case(Spi.Instructions.scanline):
+                    with m.Case(
+                        Spi.Instructions.scanline, Spi.Instructions.rle_scanline
+                    ):
                         m.d.sync += [
+                            rle.eq(instruction == Spi.Instructions.rle_scanline),
                             self.dir.eq(read_data[8]),
-                            stephalfperiod.eq(read_data[9:]),
+                            stephalfperiod.eq(read_data[period_start:words_start]),
                         ]
+                        # count is only loaded the first time the line is read
+                        with m.If(~replay):
+                            m.d.sync += repeats.eq(read_data[repeat_start:])
                         m.next = "WAIT_FOR_DATA_RUN"
                     with m.Case(Spi.Instructions.last_scanline):
                         m.d.sync += [
@@ -305,8 +660,25 @@ class Laserhead(Elaboratable):
                             self.read_commit.eq(1),
                             self.process_lines.eq(0),
                             linecnt.eq(0),
+                            replay.eq(0),
                         ]
                         m.next = "WAIT_END"
+                    # a new mask can disable this facet, the next line waits
+                    # for an enabled facet
+                    with m.Case(Spi.Instructions.facet_mask):
+                        m.d.comb += read_config.eq(1)
+                        m.d.sync += self.read_commit.eq(1)
+                        m.next = "WAIT_END"
+                    # the next instruction is read for the same facet
+                    with m.Case(
+                        Spi.Instructions.facet_offset, Spi.Instructions.laser_timing
+                    ):
+                        m.d.comb += read_config.eq(1)
+                        m.d.sync += self.read_commit.eq(1)
+                        with m.If(self.empty):
+                            m.next = "WAIT_END"
+                        with m.Else():
+                            m.d.sync += self.read_en.eq(1)
                     with m.Default():
                         m.d.sync += self.error.eq(1)
                         m.next = "READ_INSTRUCTION"
@@ -317,18 +689,31 @@ class Laserhead(Elaboratable):
                     bit_index.eq(0),
                     byte_index.eq(0),
                     lasercnt.eq(0),
+                    run_index.eq(0),
+                    runleft.eq(0),
                 ]
-                start_threshold = int(laz_tim["start_frac"] * laz_tim["facet_ticks"])
-                assert start_threshold > 0
-                with m.If(tickcounter >= start_threshold):
+                with m.If(tickcounter >= start_ticks):
                     m.d.sync += self.read_en.eq(1)
                     m.next = "DATA_RUN"
 
             with m.State("DATA_RUN"):
-                m.d.sync += [
-                    tickcounter.eq(tickcounter + 1),
-                    lasers[1].eq(lasers[0]),
-                ]
+                m.d.sync += tickcounter.eq(tickcounter + 1)
+                # a single channel line is repeated, delayed, on the second laser
+                if channels == 1:
+                    m.d.sync += lasers[1].eq(exposed[0])
+                if level_bits > 1:
+                    # the laser is on while elapsed / laser_ticks < level / max,
+                    # both sides are registers, see doses
+                    with m.If(lasercnt == 0):
+                        m.d.sync += elapsed.eq(0)
+                    with m.Else():
+                        m.d.sync += elapsed.eq(elapsed + max_level)
+                    with m.If(~rle):
+                        for channel in range(channels):
+                            m.d.comb += exposed[channel].eq(
+                                lasers[channel]
+                                & ((elapsed == 0) | (elapsed < doses[channel]))
+                            )
                 # NOTE:
                 #      lasercnt used to pulse laser at certain freq
                 with m.If(lasercnt == 0):
@@ -339,53 +724,99 @@ class Laserhead(Elaboratable):
                         m.d.sync += stepcnt.eq(stepcnt + 1)
 
                     # End of scanline reached
-                    with m.If(byte_index >= laz_tim["scanline_length"]):
-                        m.d.sync += (lasers[0].eq(0),)
+                    with m.If(byte_index >= timing["scanline_length"]):
+                        m.d.sync += (lasers[:channels].eq(0),)
 
-                        # Commit or discard based on configuration and FIFO status
-                        with m.If(hdl_cfg.single_line & self.empty):
+                        # Commit or discard based on repeats, configuration
+                        # and FIFO status
+                        with m.If(repeats != 0):
+                            m.d.sync += [
+                                self.read_discard.eq(1),
+                                repeats.eq(repeats - 1),
+                                replay.eq(1),
+                            ]
+                        with m.Elif(hdl_cfg.single_line & self.empty):
                             m.d.sync += self.read_discard.eq(1)
                         with m.Else():
-                            m.d.sync += self.read_commit.eq(1)
+                            m.d.sync += [self.read_commit.eq(1), replay.eq(0)]
 
                         m.next = "WAIT_END"
 
                     # Still scanning — advance and output laser bit
                     with m.Else():
                         m.d.sync += [
-                            lasercnt.eq(laz_tim["laser_ticks"] - 1),
+                            lasercnt.eq(timing["laser_ticks"] - 1),
                             byte_index.eq(byte_index + 1),
                         ]
-                        with m.If(bit_index == 0):
+                        # Compressed: start the next run or continue the run
+                        with m.If(rle):
+                            with m.If(runleft == 0):
+                                m.d.comb += run.eq(
+                                    Mux(run_index == 0, read_data, read_old)
+                                )
+                                m.d.sync += [
+                                    lasers[0].eq(run[-1]),
+                                    runbit.eq(run[-1]),
+                                    runleft.eq(run[:-1]),
+                                    run_index.eq(
+                                        Mux(
+                                            run_index == runs_word - 1,
+                                            0,
+                                            run_index + 1,
+                                        )
+                                    ),
+                                ]
+                                with m.If(run_index == 0):
+                                    m.d.sync += [
+                                        read_old.eq(read_data >> run_bits),
+                                        self.read_en.eq(0),
+                                    ]
+                                with m.Else():
+                                    m.d.sync += read_old.eq(read_old >> run_bits)
+                            with m.Else():
+                                m.d.sync += [
+                                    lasers[0].eq(runbit),
+                                    runleft.eq(runleft - 1),
+                                ]
+                        with m.Elif(bit_index == 0):
+                            m.d.sync += load_pixel(read_data)
                             m.d.sync += [
-                                lasers[0].eq(read_data[0]),
-                                read_old.eq(read_data >> 1),
+                                read_old.eq(read_data >> pixel_bits),
                                 self.read_en.eq(0),
                             ]
                         with m.Else():
-                            m.d.sync += lasers[0].eq(read_old[0])
+                            m.d.sync += load_pixel(read_old)
                 with m.Else():
                     m.d.sync += lasercnt.eq(lasercnt - 1)
                     # NOTE: read enable can only be high for 1 cycle
                     #       as a result this is done right before the "read"
-                    with m.If(lasercnt == 1):
+                    with m.If(rle):  # noqa: SIM117 (starts an If/Elif chain)
+                        # Fetch the next word if its first run starts next
+                        with m.If(
+                            (lasercnt == 1)
+                            & (runleft == 0)
+                            & (run_index == 0)
+                            & (byte_index < timing["scanline_length"])
+                        ):
+                            m.d.sync += self.read_en.eq(1)
+                    with m.Elif(lasercnt == 1):
                         # Advance read bit position
                         with m.If(bit_index == 0):
                             m.d.sync += [bit_index.eq(bit_index + 1)]
                         # Last bit in word — fetch next byte if needed
-                        with m.Elif(bit_index == hdl_cfg.mem_width - 1):
+                        with m.Elif(bit_index == pixels_word - 1):
                             # If fifo is empty it will give errors later
                             # so it can be ignored here
                             # Only grab a new line if more than current
                             # is needed
                             # -1 as counting in python is different
-                            with m.If(byte_index < (laz_tim["scanline_length"])):
+                            with m.If(byte_index < timing["scanline_length"]):
                                 m.d.sync += self.read_en.eq(1)
                             m.d.sync += bit_index.eq(0)
                         with m.Else():
                             m.d.sync += [
                                 bit_index.eq(bit_index + 1),
-                                read_old.eq(read_old >> 1),
+                                read_old.eq(read_old >> pixel_bits),
                             ]
             with m.State("WAIT_END"):
                 m.d.sync += [
@@ -401,17 +832,13 @@ class Laserhead(Elaboratable):
                 #    automatically forces the read pointer to roll back to the start of the
                 #    last successfully read block.
                 # Result: The 'full' line repeats indefinitely until 'single_line' is deactivated.
-                with m.If(hdl_cfg.single_line & self.empty):
-                    m.d.sync += self.read_discard.eq(0)
-                with m.Else():
-                    m.d.sync += self.read_commit.eq(0)
+                # A scanline with a repeat count is discarded in the same way.
+                m.d.sync += [self.read_discard.eq(0), self.read_commit.eq(0)]
 
                 # -1 as you count till range-1 in python
                 # -2 as you need 1 tick to process
-                exposure_end = round(
-                    laz_tim["facet_ticks"] - laz_tim["jitter_sync_ticks"] - 2
-                )
-                with m.If(tickcounter >= exposure_end):
+                exposure_end = laz_tim["jitter_sync_ticks"] + 2
+                with m.If(tickcounter + exposure_end >= timing["facet_ticks"]):
                     m.d.sync += lasers.eq(0b10)
                     m.next = "WAIT_STABLE"
                 with m.Else():
@@ -428,6 +855,7 @@ class Laserhead(Elaboratable):
             self.lasercnt = lasercnt
             self.facetcnt = facetcnt
             self.linecnt = linecnt
+            self.repeats = repeats
             self.laserfsm = laserfsm
         return m
 
@@ -460,14 +888,18 @@ class DiodeSimulator(Laserhead):
         lh_rec = self.lh_rec
         pd_db = self.pd_db
 
-        diode_cnt = Signal(range(laz_tim["facet_ticks"]))
+        # the prism follows the facet period of the laserhead
+        facet_ticks = self.timing["facet_ticks"]
+        diode_cnt = Signal(range(laz_tim["max_facet_ticks"]))
         self.diode_cnt = diode_cnt
 
         if self.addfifo:
             # FIFO 1:
-            fifo = TransactionalizedFIFO(
-                width=hdl_cfg.mem_width, depth=hdl_cfg.mem_depth
-            )
+            if hdl_cfg.fifo_memory == "spram":
+                fifo_type = SPRAMTransactionalizedFIFO
+            else:
+                fifo_type = TransactionalizedFIFO
+            fifo = fifo_type(width=hdl_cfg.mem_width, depth=hdl_cfg.mem_depth)
             m.submodules.fifo = fifo
             self.fifo = fifo
 
@@ -479,9 +911,9 @@ class DiodeSimulator(Laserhead):
                 self.read_data.eq(fifo.read_data),
             ]
 
-        with m.If(diode_cnt == (laz_tim["facet_ticks"] - 1)):
+        with m.If(diode_cnt >= facet_ticks - 1):
             m.d.sync += diode_cnt.eq(0)
-        with m.Elif(diode_cnt > (laz_tim["facet_ticks"] - 5)):
+        with m.Elif(diode_cnt + 5 > facet_ticks):
             m.d.sync += [
                 pd_db.raw.eq(~(lh_rec.en & (lh_rec.lasers.any()))),
                 diode_cnt.eq(diode_cnt + 1),
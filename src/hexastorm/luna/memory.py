@@ -8,7 +8,7 @@
 This module contains definitions of memory units that work well for USB applications.
 """
 
-from amaranth import Elaboratable, Module, Signal
+from amaranth import ClockSignal, Elaboratable, Instance, Module, Mux, Signal
 from amaranth.lib.memory import Memory
 
 # FIX: DomainRenamer zit nu direct in amaranth.hdl (niet meer in .xfrm)
@@ -55,23 +55,6 @@ class TransactionalizedFIFO(Elaboratable):
         # Range shortcuts for internal signals.
         address_range = range(0, self.depth + 1)
 
-        #
-        # Core internal "backing store".
-        #
-        # Create the memory module
-        m.submodules[self.name] = memory = Memory(
-            shape=self.width, depth=self.depth + 1, init=[]
-        )
-        read_port = memory.read_port()
-        write_port = memory.write_port()
-
-        # Always connect up our memory's data/en ports to ours.
-        m.d.comb += [
-            self.read_data.eq(read_port.data),
-            write_port.data.eq(self.write_data),
-            write_port.en.eq(self.write_en & ~self.full),
-        ]
-
         #
         # Write port.
         #
@@ -80,7 +63,6 @@ class TransactionalizedFIFO(Elaboratable):
         # This will allow us to rapidly backtrack to our pre-commit position.
         committed_write_pointer = Signal(address_range)
         current_write_pointer = Signal(address_range)
-        m.d.comb += write_port.addr.eq(current_write_pointer)
 
         # Compute the location for the next write, accounting for wraparound. We'll not assume a binary-sized
         # buffer; so we'll compute the wraparound manually.
@@ -122,10 +104,15 @@ class TransactionalizedFIFO(Elaboratable):
         # Our memory always takes a single cycle to provide its read output; so we'll update its address
         # "one cycle in advance". Accordingly, if we're about to advance the FIFO, we'll use the next read
         # address as our input. If we're not, we'll use the current one.
-        with m.If(self.read_en & ~self.empty):
-            m.d.comb += read_port.addr.eq(next_read_pointer)
+        read_address = Signal(address_range)
+        with m.If(self.flush):
+            m.d.comb += read_address.eq(0)
+        with m.Elif(self.read_discard):
+            m.d.comb += read_address.eq(committed_read_pointer)
+        with m.Elif(self.read_en & ~self.empty):
+            m.d.comb += read_address.eq(next_read_pointer)
         with m.Else():
-            m.d.comb += read_port.addr.eq(current_read_pointer)
+            m.d.comb += read_address.eq(current_read_pointer)
 
         # If we're reading from our the fifo, update our current read position.
         with m.If(self.read_en & ~self.empty):
@@ -172,8 +159,133 @@ class TransactionalizedFIFO(Elaboratable):
                 committed_read_pointer.eq(0),
             ]
 
+        #
+        # Core internal "backing store".
+        #
+        self.elaborate_storage(
+            m,
+            platform,
+            read_address=read_address,
+            write_address=current_write_pointer,
+            write_en=self.write_en & ~self.full,
+        )
+
         # If we're not supposed to be in the sync domain, rename our sync domain to the target.
         if self.domain != "sync":
             m = DomainRenamer({"sync": self.domain})(m)
 
         return m
+
+    def elaborate_storage(self, m, platform, *, read_address, write_address, write_en):
+        """Add the memory holding the FIFO words.
+
+        read_data shows the word at read_address one cycle later, i.e. the
+        word at the read pointer of the next cycle.
+        """
+        m.submodules[self.name] = memory = Memory(
+            shape=self.width, depth=self.depth + 1, init=[]
+        )
+        read_port = memory.read_port()
+        write_port = memory.write_port()
+
+        # Always connect up our memory's data/en ports to ours.
+        m.d.comb += [
+            self.read_data.eq(read_port.data),
+            read_port.addr.eq(read_address),
+            write_port.data.eq(self.write_data),
+            write_port.addr.eq(write_address),
+            write_port.en.eq(write_en),
+        ]
+
+
+class SinglePortRAM(Elaboratable):
+    """Single-port RAM, backed by the SB_SPRAM256KA blocks of the iCE40UP5K.
+
+    A block holds 16384 words of 16 bits, wider words use blocks in parallel.
+    Per cycle, the RAM either writes data_in or reads the word at addr; the
+    read word is available on data_out the next cycle, a write keeps
+    data_out. Without a platform, e.g. in simulation, an equivalent memory is
+    used.
+    """
+
+    BLOCK_DEPTH = 16384
+    BLOCK_WIDTH = 16
+
+    def __init__(self, *, width, depth):
+        assert depth <= self.BLOCK_DEPTH, "SPRAM depth is limited to 16384 words"
+        self.width = width
+        self.depth = depth
+
+        self.addr = Signal(range(self.BLOCK_DEPTH))
+        self.data_in = Signal(width)
+        self.data_out = Signal(width)
+        self.write_en = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        if platform is None:
+            m.submodules.memory = memory = Memory(
+                shape=self.width, depth=self.depth, init=[]
+            )
+            read_port = memory.read_port(transparent_for=())
+            write_port = memory.write_port()
+            m.d.comb += [
+                read_port.addr.eq(self.addr),
+                read_port.en.eq(~self.write_en),
+                self.data_out.eq(read_port.data),
+                write_port.addr.eq(self.addr),
+                write_port.data.eq(self.data_in),
+                write_port.en.eq(self.write_en),
+            ]
+            return m
+
+        blocks = -(-self.width // self.BLOCK_WIDTH)
+        data_in = Signal(blocks * self.BLOCK_WIDTH)
+        data_out = Signal(blocks * self.BLOCK_WIDTH)
+        m.d.comb += [data_in.eq(self.data_in), self.data_out.eq(data_out)]
+        for idx in range(blocks):
+            bits = slice(idx * self.BLOCK_WIDTH, (idx + 1) * self.BLOCK_WIDTH)
+            m.submodules[f"spram_{idx}"] = Instance(
+                "SB_SPRAM256KA",
+                i_ADDRESS=self.addr,
+                i_DATAIN=data_in[bits],
+                i_MASKWREN=0b1111,
+                i_WREN=self.write_en,
+                i_CHIPSELECT=1,
+                i_CLOCK=ClockSignal(),
+                i_STANDBY=0,
+                i_SLEEP=0,
+                i_POWEROFF=1,
+                o_DATAOUT=data_out[bits],
+            )
+        return m
+
+
+class SPRAMTransactionalizedFIFO(TransactionalizedFIFO):
+    """TransactionalizedFIFO stored in single-port RAM (SPRAM).
+
+    The iCE40UP5K has 1 Mbit of SPRAM, roughly eight times its block RAM.
+    A single port can read or write per cycle, writes take precedence. Every
+    cycle without a write reads the word at the read address; the RAM keeps
+    its output during a write. The read address is not compared or held, so
+    it reaches the RAM through a single multiplexer. A read which collides
+    with a write, or follows a write to the word under the read pointer, is
+    done in the next free cycle. As a result, read_data can lag one cycle
+    behind the TransactionalizedFIFO in that case.
+    """
+
+    def __init__(self, *, width, depth, name=None, domain="sync"):
+        assert depth < SinglePortRAM.BLOCK_DEPTH, "depth excludes one spare word"
+        super().__init__(width=width, depth=depth, name=name, domain=domain)
+
+    def elaborate_storage(self, m, platform, *, read_address, write_address, write_en):
+        m.submodules[self.name] = ram = SinglePortRAM(
+            width=self.width, depth=self.depth + 1
+        )
+        m.d.comb += [
+            ram.addr.eq(Mux(write_en, write_address, read_address)),
+            ram.data_in.eq(self.write_data),
+            ram.write_en.eq(write_en),
+            self.read_data.eq(ram.data_out),
+        ]
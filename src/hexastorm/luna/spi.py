@@ -6,7 +6,8 @@
 
 """SPI and derived interfaces."""
 
-from amaranth import Signal, Module, Cat, Elaboratable
+from amaranth import Cat, Elaboratable, Module, Signal
+
 from ..utils import LunaGatewareTestCase
 
 
@@ -14,12 +15,14 @@ class SPIBus:
     """
     Modern replacement for the luna SPIBus Record.
     Uses simple Signals to avoid 'amaranth.hdl.rec' deprecation warnings.
+
+    With several lanes, sdi and sdo carry one bit per lane.
     """
 
-    def __init__(self):
+    def __init__(self, lanes=1):
         self.sck = Signal(name="sck")
-        self.sdi = Signal(name="sdi")
-        self.sdo = Signal(name="sdo")
+        self.sdi = Signal(lanes, name="sdi")
+        self.sdo = Signal(lanes, name="sdo")
         self.cs = Signal(name="cs")
 
 
@@ -28,8 +31,8 @@ class SPICommandInterface(Elaboratable):
 
     I/O signals:
         I: sck           -- SPI clock, from the SPI master
-        I: sdi           -- SPI data in
-        O: sdo           -- SPI data out
+        I: sdi           -- SPI data in, one bit per lane
+        O: sdo           -- SPI data out, one bit per lane
         I: cs            -- chip select, active high (internal logic)
 
         O: command       -- the command read from the SPI bus
@@ -38,21 +41,29 @@ class SPICommandInterface(Elaboratable):
         O: word_received -- the most recent word received
         O: word_complete -- strobe indicating a new word is present on word_in
         I: word_to_send  -- the word to be loaded; latched in on next word_complete and while cs is low
+        I: word_follows  -- if high when a word completes, the next word follows
+                            without a command
 
         O: idle          -- true iff the register interface is currently doing nothing
         O: stalled       -- true iff the register interface cannot accept data until this transaction ends
+
+    Dual and quad SPI are supported via lanes, every clock transfers a bit
+    per lane in both directions, the most significant bit on the highest lane.
     """
 
-    def __init__(self, command_size=8, word_size=32):
+    def __init__(self, command_size=8, word_size=32, lanes=1):
+        if command_size % lanes or word_size % lanes:
+            raise ValueError("Command and word size must be a multiple of lanes")
         self.command_size = command_size
         self.word_size = word_size
+        self.lanes = lanes
 
         #
         # I/O port.
         #
 
         # SPI
-        self.spi = SPIBus()
+        self.spi = SPIBus(lanes)
 
         # Command I/O.
         self.command = Signal(self.command_size)
@@ -62,6 +73,7 @@ class SPICommandInterface(Elaboratable):
         self.word_received = Signal(self.word_size)
         self.word_to_send = Signal.like(self.word_received)
         self.word_complete = Signal()
+        self.word_follows = Signal()
 
         # Status
         self.idle = Signal()
@@ -70,6 +82,7 @@ class SPICommandInterface(Elaboratable):
     def elaborate(self, platform):
         m = Module()
         spi = self.spi
+        lanes = self.lanes
 
         # Detect falling edge of SPI clock
         past_sck = Signal()
@@ -118,8 +131,8 @@ class SPICommandInterface(Elaboratable):
                 with m.If(bit_count < self.command_size):
                     with m.If(sample_edge):
                         m.d.sync += [
-                            bit_count.eq(bit_count + 1),
-                            current_command.eq(Cat(spi.sdi, current_command[:-1])),
+                            bit_count.eq(bit_count + lanes),
+                            current_command.eq(Cat(spi.sdi, current_command[:-lanes])),
                         ]
 
                 # ... and then pass that command out to our controller.
@@ -146,14 +159,14 @@ class SPICommandInterface(Elaboratable):
                 with m.If(~spi.cs):
                     m.next = "IDLE"
 
-                m.d.sync += spi.sdo.eq(current_word[-1])
+                m.d.sync += spi.sdo.eq(current_word[-lanes:])
 
                 # Continue shifting data until we have a full word.
                 with m.If(bit_count < self.word_size):
                     with m.If(sample_edge):
                         m.d.sync += [
-                            bit_count.eq(bit_count + 1),
-                            current_word.eq(Cat(spi.sdi, current_word[:-1])),
+                            bit_count.eq(bit_count + lanes),
+                            current_word.eq(Cat(spi.sdi, current_word[:-lanes])),
                         ]
 
                 # ... and then output that word on our bus.
@@ -164,8 +177,12 @@ class SPICommandInterface(Elaboratable):
                         self.word_received.eq(current_word),
                     ]
 
-                    # Go back to receiving more commands
-                    m.next = "RECEIVE_COMMAND"
+                    # Receive another word of a burst, or go back to receiving
+                    # more commands
+                    with m.If(self.word_follows):
+                        m.next = "LATCH_OUTPUT"
+                    with m.Else():
+                        m.next = "RECEIVE_COMMAND"
 
         return m
 
@@ -205,7 +222,7 @@ class SPIGatewareTestCase(LunaGatewareTestCase):
 
     async def spi_exchange_byte(self, datum, *, msb_first=True):
         """Sends a byte over the virtual SPI bus."""
-        bits = "{:08b}".format(datum)
+        bits = f"{datum:08b}"
         data_received = ""
 
         if not msb_first:
@@ -235,3 +252,31 @@ class SPIGatewareTestCase(LunaGatewareTestCase):
         await sim.tick()
 
         return response
+
+
+class MultiLaneSPIGatewareTestCase(SPIGatewareTestCase):
+    """SPIGatewareTestCase for a dual or quad SPI bus.
+
+    Every clock transfers spi_lanes bits, the most significant bit of a
+    group is put on the highest lane.
+    """
+
+    spi_lanes = 4
+
+    async def spi_exchange_byte(self, datum, *, msb_first=True):
+        """Sends a byte over the virtual SPI bus, spi_lanes bits per clock."""
+        lanes = self.spi_lanes
+        mask = (1 << lanes) - 1
+
+        if not msb_first:
+            datum = int(f"{datum:08b}"[::-1], 2)
+
+        data_received = 0
+        for shift in range(8 - lanes, -1, -lanes):
+            received = await self.spi_send_bit((datum >> shift) & mask)
+            data_received = (data_received << lanes) | received
+
+        if not msb_first:
+            data_received = int(f"{data_received:08b}"[::-1], 2)
+
+        return data_received
@@ -31,18 +31,23 @@ class Polynomial(Elaboratable):
         and the bit at `bit_shift` triggers a physical motor step when it toggles.
         Non-step fractional parts are preserved across motion segments for perfect continuity.
 
+        The coefficients and tick limit are double buffered. `coeff` and `tick_limit`
+        form a preload bank which is copied to the active registers when a segment
+        starts. A segment started while another one runs is kept `pending` and starts
+        on the tick after the running segment ends, so chained segments have no gap.
+
         The module also supports external laser control. When `override_laser` is high,
         the step and direction signals for the configured laser axis are seamlessly
         hijacked by the external `step_laser` and `dir_laser` inputs.
 
         Assumptions:
-        - Max ticks per move is configured by `move_ticks` (e.g., 10_000).
+        - Max ticks per move is configured by `move_ticks` (e.g., 2**20 - 1).
         - Base update frequency is typically 1 MHz.
         - Absolute position tracking is handled by the host controller.
 
         Inputs:
         - `coeff`:          Array of coefficients [a, b, c] for each motor.
-        - `start`:          Start signal to initiate polynomial evaluation.
+        - `start`:          Start signal, queues the preloaded segment.
         - `tick_limit`:     Maximum number of ticks (duration) for the motion segment.
         - `step_laser`:     External step signal override for the laser axis.
         - `dir_laser`:      External direction signal override for the laser axis.
@@ -50,6 +55,7 @@ class Polynomial(Elaboratable):
 
     Outputs:
         - `busy`:           High while segment evaluation is in progress.
+        - `pending`:        High while a preloaded segment waits for the running one.
     """
 
     def __init__(self, plf_cfg):
@@ -74,6 +80,7 @@ class Polynomial(Elaboratable):
 
         # Output
         self.busy = Signal()
+        self.pending = Signal()
 
         # Mixed
         self.steppers = [StepperRecord() for _ in range(hdl_cfg.motors)]
@@ -89,12 +96,54 @@ class Polynomial(Elaboratable):
         divider = int(ice40_cfg["clks"][ice40_cfg["hfosc_div"]])
         cntr = Signal(range(divider))
         ticks = Signal(hdl_cfg.move_ticks.bit_length())
+        tick_limit = Signal.like(self.tick_limit)
 
         # Internal signed counters per motor per order
         max_steps = int(hdl_cfg.move_ticks / 2)  # Nyquist
         max_bits = (max_steps << hdl_cfg.bit_shift).bit_length()
         cntrs = Array(Signal(signed(max_bits + 1)) for _ in range(len(self.coeff)))
         assert max_bits <= 64
+        # Active highest order difference, constant during a segment
+        consts = Array(Signal.like(self.coeff[0]) for _ in range(hdl_cfg.motors))
+        step_bit = hdl_cfg.bit_shift + 1
+
+        def load_segment(final):
+            """Copy the preload bank to the active registers
+
+            final -- True if the last tick of the previous segment is
+                     evaluated in the same clock cycle
+            """
+            for motor in range(hdl_cfg.motors):
+                base = motor * hdl_cfg.pol_degree
+
+                D1 = self.coeff[base]
+                D2 = self.coeff[base + 1] if hdl_cfg.pol_degree > 1 else 0
+
+                # Load initial Forward Differences based on degree
+                # The host now pre-calculates these, saving massive LUT overhead.
+                if hdl_cfg.pol_degree >= 3:
+                    m.d.sync += cntrs[base + 2].eq(D2)
+                if hdl_cfg.pol_degree >= 2:
+                    m.d.sync += cntrs[base + 1].eq(D1)
+                m.d.sync += consts[motor].eq(self.coeff[base + hdl_cfg.pol_degree - 1])
+
+                # Keep the fractional part from the previous segment for position continuity
+                if final:
+                    position = cntrs[base] + (
+                        cntrs[base + 1] if hdl_cfg.pol_degree >= 2 else consts[motor]
+                    )
+                else:
+                    position = cntrs[base]
+                m.d.sync += cntrs[base].eq(position[:step_bit])
+            m.d.sync += [
+                tick_limit.eq(self.tick_limit),
+                ticks.eq(0),
+                self.pending.eq(0),
+                self.busy.eq(1),
+            ]
+
+        with m.If(self.start):
+            m.d.sync += self.pending.eq(1)
 
         if platform is None:
             # Expose internals for simulation
@@ -103,16 +152,17 @@ class Polynomial(Elaboratable):
         else:
             # Connect to platform stepper resources
             steppers_res = get_all_resources(platform, "stepper", dir="-")
-            for i, stepper in enumerate(steppers_res):
+            # connectors without a configured motor are left unused
+            for stepper, record in zip(steppers_res, steppers):
                 m.submodules += [
                     step_buf := Buffer("o", stepper.step),
                     dir_buf := Buffer("o", stepper.dir),
                     lim_buf := Buffer("i", stepper.limit),
                 ]
                 m.d.comb += [
-                    step_buf.o.eq(steppers[i].step),
-                    dir_buf.o.eq(steppers[i].dir),
-                    steppers[i].limit.eq(lim_buf.i),
+                    step_buf.o.eq(record.step),
+                    dir_buf.o.eq(record.dir),
+                    record.limit.eq(lim_buf.i),
                 ]
 
         # Generate step pulse based on toggling specific bit
@@ -169,8 +219,8 @@ class Polynomial(Elaboratable):
                     # -1 gets the sign bit. ~ inverts it so positive = 1, negative = 0
                     m.d.sync += steppers[motor].dir.eq(~cntrs[idx + 1][-1])
                 else:
-                    # Constant velocity is in coeff[idx]
-                    m.d.sync += steppers[motor].dir.eq(~self.coeff[idx][-1])
+                    # Constant velocity is in the active register
+                    m.d.sync += steppers[motor].dir.eq(~consts[motor][-1])
 
         # State machine for execution
         with m.FSM(init="RESET", name="polynomial_fsm"):
@@ -179,32 +229,15 @@ class Polynomial(Elaboratable):
                 m.next = "WAIT_START"
 
             with m.State("WAIT_START"):
-                with m.If(self.start):
-                    for motor in range(hdl_cfg.motors):
-                        base = motor * hdl_cfg.pol_degree
-                        step_bit = hdl_cfg.bit_shift + 1
-
-                        D1 = self.coeff[base]
-                        D2 = self.coeff[base + 1] if hdl_cfg.pol_degree > 1 else 0
-
-                        # Load initial Forward Differences based on degree
-                        # The host now pre-calculates these, saving massive LUT overhead.
-                        if hdl_cfg.pol_degree >= 3:
-                            m.d.sync += cntrs[base + 2].eq(D2)
-                        if hdl_cfg.pol_degree >= 2:
-                            m.d.sync += cntrs[base + 1].eq(D1)
-
-                        # Keep the fractional part from the previous segment for position continuity
-                        m.d.sync += cntrs[base].eq(cntrs[base][:step_bit])
-
-                    m.d.sync += self.busy.eq(1)
+                with m.If(self.pending):
+                    load_segment(final=False)
                     m.next = "RUNNING"
                 with m.Else():
                     m.d.sync += self.busy.eq(0)
 
             with m.State("RUNNING"):
                 # Tick handling and polynomial evaluation
-                with m.If((ticks < self.tick_limit) & (cntr >= divider - 1)):
+                with m.If((ticks < tick_limit) & (cntr >= divider - 1)):
                     m.d.sync += [ticks.eq(ticks + 1), cntr.eq(0)]
 
                     for motor in range(hdl_cfg.motors):
@@ -213,27 +246,36 @@ class Polynomial(Elaboratable):
                         # Pipelined Forward Differencing (1 adder per layer per clock tick)
 
                         if hdl_cfg.pol_degree >= 3:
-                            D3 = self.coeff[base + 2]
+                            D3 = consts[motor]
                             m.d.sync += cntrs[base + 2].eq(cntrs[base + 2] + D3)
 
                         if hdl_cfg.pol_degree >= 2:
                             D2 = (
                                 cntrs[base + 2]
                                 if hdl_cfg.pol_degree >= 3
-                                else self.coeff[base + 1]
+                                else consts[motor]
                             )
                             m.d.sync += cntrs[base + 1].eq(cntrs[base + 1] + D2)
 
                         D1 = (
                             cntrs[base + 1]
                             if hdl_cfg.pol_degree >= 2
-                            else self.coeff[base]
+                            else consts[motor]
                         )
                         m.d.sync += cntrs[base].eq(cntrs[base] + D1)
 
-                with m.Elif(ticks < self.tick_limit):
+                    # Chain the preloaded segment on the last tick, the next
+                    # segment evaluates its first tick one period later
+                    with m.If((ticks == tick_limit - 1) & self.pending):
+                        load_segment(final=True)
+
+                with m.Elif(ticks < tick_limit):
                     m.d.sync += cntr.eq(cntr + 1)
 
+                # Segment was queued too late to chain
+                with m.Elif(self.pending):
+                    load_segment(final=False)
+
                 with m.Else():
                     m.d.sync += ticks.eq(0)
                     m.next = "WAIT_START"
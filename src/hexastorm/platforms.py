@@ -1,8 +1,14 @@
+import hashlib
+import logging
 import os
 import platform as pltf
+import re
+import shutil
 import subprocess
+from pathlib import Path
 
 from amaranth.build import Attrs, Pins, PinsN, Resource, Subsignal, Clock
+from amaranth.build.run import LocalBuildProducts
 from amaranth.vendor import LatticeICE40Platform
 from amaranth_boards.resources import LEDResources
 from amaranth_boards.test.blinky import Blinky
@@ -15,6 +21,59 @@ from .resources import (
     StepperResource,
 )
 
+logger = logging.getLogger(__name__)
+
+# products stored in the build cache, the nextpnr log holds utilization and timing
+CACHED_PRODUCTS = (".bin", ".rpt", ".tim")
+# the cache is keyed by content and shared by checkouts, outside the source tree
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "hexastorm"
+
+
+def toolchain_versions():
+    """Version strings of yosys and nextpnr, set by Firestarter.build."""
+    return "\n".join(
+        subprocess.getoutput(f'"{os.environ[tool]}" {flag}')
+        for tool, flag in (("YOSYS", "-V"), ("NEXTPNR_ICE40", "--version"))
+    )
+
+
+def build_key(plan, versions):
+    """
+    Key of a build in the cache.
+
+    The build plan holds the elaborated RTLIL, the constraints and the
+    yosys and nextpnr options. Together with the toolchain versions
+    these determine the bitstream.
+    """
+    hasher = hashlib.blake2b(plan.digest(), digest_size=16)
+    hasher.update(versions.encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def build_report(products, name="top"):
+    """
+    Utilization and timing of a build, read from the nextpnr log.
+
+    Returns:
+        dict: "utilization" maps a cell type to (used, available),
+            "fmax" maps a clock to its maximum frequency in MHz after routing
+            and "passed" to whether that meets the clock constraint
+    """
+    log = products.get(f"{name}.tim", "t")
+    utilization = {
+        cell: (int(used), int(available))
+        for cell, used, available in re.findall(
+            r"^Info:\s+(\w+):\s+(\d+)/\s*(\d+)\s+\d+%", log, re.MULTILINE
+        )
+    }
+    # later estimates replace the ones before routing
+    estimates = re.findall(
+        r"Max frequency for clock '([^']+)': ([\d.]+) MHz \((PASS|FAIL)", log
+    )
+    fmax = {clock: float(mhz) for clock, mhz, _ in estimates}
+    passed = {clock: result == "PASS" for clock, _, result in estimates}
+    return {"utilization": utilization, "fmax": fmax, "passed": passed}
+
 
 class Firestarter(LatticeICE40Platform):
     """Kicad board: https://github.com/hstarmans/firestarter/"""
@@ -43,6 +102,7 @@ class Firestarter(LatticeICE40Platform):
             Subsignal("sdo", Pins("14")),
             Subsignal("cs", PinsN("16")),
             Subsignal("fifo_full", Pins("25")),
+            Subsignal("fifo_low", Pins("28")),
             Attrs(IO_STANDARD="SB_LVCMOS"),
         ),
         # Laserscanner resource
@@ -106,13 +166,67 @@ class Firestarter(LatticeICE40Platform):
         LatticeICE40Platform.__init__(self)
         self.esp32_cfg = PlatformConfig(test=False).esp32_cfg
 
-    def build(self, *args, **kwargs):
+    def build(
+        self,
+        elaboratable,
+        name="top",
+        build_dir="build",
+        do_build=True,
+        program_opts=None,
+        do_program=False,
+        cache=True,
+        cache_dir=CACHE_DIR / "bitstreams",
+        **kwargs,
+    ):
+        """
+        Build and optionally program a design.
+
+        Bitstreams are stored in cache_dir under the key of the build,
+        see build_key. An unchanged design reuses the bitstream and the logs
+        of the toolchain, build_report reads utilization and timing from them.
+        Set cache to False to always run the toolchain.
+        """
         search_command = "where" if pltf.system() == "Windows" else "which"
         base = f"{search_command} yowasp-"
         os.environ["YOSYS"] = subprocess.getoutput(base + "yosys")
         os.environ["NEXTPNR_ICE40"] = subprocess.getoutput(base + "nextpnr-ice40")
         os.environ["ICEPACK"] = subprocess.getoutput(base + "icepack")
-        super().build(*args, **kwargs)
+        if not (do_build and cache):
+            return super().build(
+                elaboratable,
+                name,
+                build_dir,
+                do_build,
+                program_opts,
+                do_program,
+                **kwargs,
+            )
+
+        plan = self.prepare(elaboratable, name, **kwargs)
+        key = build_key(plan, toolchain_versions())
+        cache_dir = Path(cache_dir) / key
+        files = [f"{name}{extension}" for extension in CACHED_PRODUCTS]
+        if all((cache_dir / file).exists() for file in files):
+            logger.info(f"Reusing bitstream {key} from build cache")
+            # the sources are extracted to keep the build directory consistent
+            root = plan.extract(build_dir)
+            for file in files:
+                shutil.copyfile(cache_dir / file, root / file)
+            products = LocalBuildProducts(root)
+        else:
+            products = plan.execute_local(build_dir)
+            # copied first, an interrupted copy is never taken for a build
+            partial = cache_dir.with_suffix(".partial")
+            shutil.rmtree(partial, ignore_errors=True)
+            partial.mkdir(parents=True)
+            for file in files:
+                (partial / file).write_bytes(products.get(file))
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            partial.rename(cache_dir)
+        if not do_program:
+            return products
+
+        self.toolchain_program(products, name, **(program_opts or {}))
 
     def toolchain_program(self, products, name, **kwargs):
         device = self.esp32_cfg["device"]
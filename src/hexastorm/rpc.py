@@ -0,0 +1,296 @@
+"""
+Binary RPC protocol between the host computer and the ESP32.
+
+This module is shared by both ends of the serial link. The host imports it
+directly, the ESP32Controller uploads its source once into the raw REPL of
+the board where :func:`serve` runs the request loop. The code must therefore
+stay compatible with MicroPython.
+
+Frame layout, all integers big-endian:
+
+    magic (2 bytes) | kind (u8) | sequence (u16) | length (u32) | payload
+
+Payloads are values in a compact tagged encoding, see :func:`encode`.
+Supported types are None, bool, int (64 bit), float, str, bytes, list, tuple
+and dict. Bytes are transferred as is, e.g. scanlines don't need repr.
+
+Frame kinds:
+    DEFINE  -- host to board, payload [name, source], function is exec'd
+    CALL    -- host to board, payload [name, args, kwargs]
+    RESULT  -- board to host, payload is the return value
+    ERROR   -- board to host, payload is the formatted traceback
+    STOP    -- host to board and acknowledged, ends the request loop
+    READY   -- board to host, the request loop has started
+    DATA    -- host to board, offset (u32) | crc32 (u32) | chunk of a file
+    ACK     -- board to host, chunk written, payload is the next offset (u32)
+    NAK     -- board to host, chunk rejected, payload is the expected offset
+
+Files are transferred by calling ``file_open``, sending DATA frames and
+calling ``file_close``. These functions are always in the registry.
+"""
+
+from binascii import crc32
+from struct import pack, unpack
+
+MAGIC = b"\xa5\x5a"
+HEADER = ">BHI"
+HEADER_BYTES = 7
+
+DEFINE = 1
+CALL = 2
+RESULT = 3
+ERROR = 4
+STOP = 5
+READY = 6
+DATA = 7
+ACK = 8
+NAK = 9
+
+# state of the file transfer
+_transfer = {"file": None, "offset": 0, "crc": 0}
+
+
+def file_open(path, resume=False):
+    """
+    Open a file on the board for a transfer.
+
+    If resume is set, data already present is kept and new chunks are
+    appended. Otherwise the file is truncated.
+
+    Returns:
+        list: [offset, crc32] of the data kept
+    """
+    file_close()
+    offset = crc = 0
+    if resume:
+        try:
+            with open(path, "rb") as f:
+                buf = bytearray(4096)
+                while True:
+                    nbytes = f.readinto(buf)
+                    if not nbytes:
+                        break
+                    crc = crc32(memoryview(buf)[:nbytes], crc)
+                    offset += nbytes
+        except OSError:
+            offset = crc = 0
+    # closed by file_close, the file stays open between chunks
+    _transfer["file"] = open(path, "ab" if offset else "wb")  # noqa: SIM115
+    _transfer["offset"] = offset
+    _transfer["crc"] = crc
+    return [offset, crc]
+
+
+def file_close():
+    """
+    Close the file of the transfer.
+
+    Returns:
+        list: [size, crc32] of the file
+    """
+    if _transfer["file"] is not None:
+        _transfer["file"].close()
+        _transfer["file"] = None
+    return [_transfer["offset"], _transfer["crc"]]
+
+
+def _write_chunk(seq, payload):
+    """Write a DATA frame to the open file and return the reply frame."""
+    if _transfer["file"] is None:
+        raise OSError("No file opened for transfer")
+    offset, crc = unpack(">II", payload[:8])
+    data = memoryview(payload)[8:]
+    expected = _transfer["offset"]
+    if offset != expected or crc32(data) != crc:
+        return frame(NAK, seq, pack(">I", expected))
+    _transfer["file"].write(data)
+    _transfer["offset"] = expected + len(data)
+    _transfer["crc"] = crc32(data, _transfer["crc"])
+    return frame(ACK, seq, pack(">I", _transfer["offset"]))
+
+
+# functions defined via DEFINE, survive a restart of the request loop
+_registry = {"file_open": file_open, "file_close": file_close}
+
+
+def _encode(value, out):
+    if value is None:
+        out.append(b"N")
+    elif value is True:
+        out.append(b"T")
+    elif value is False:
+        out.append(b"F")
+    elif isinstance(value, int):
+        out.append(b"i" + pack(">q", value))
+    elif isinstance(value, float):
+        out.append(b"d" + pack(">d", value))
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        out.append(b"s" + pack(">I", len(data)))
+        out.append(data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        out.append(b"b" + pack(">I", len(data)))
+        out.append(data)
+    elif isinstance(value, (list, tuple)):
+        out.append(b"l" + pack(">I", len(value)))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(b"m" + pack(">I", len(value)))
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise TypeError("Cannot encode " + str(type(value)))
+
+
+def encode(value):
+    """Encode a value to bytes."""
+    out = []
+    _encode(value, out)
+    return b"".join(out)
+
+
+def _decode(data, idx):
+    tag = data[idx]
+    idx += 1
+    if tag == 78:  # N
+        return None, idx
+    if tag == 84:  # T
+        return True, idx
+    if tag == 70:  # F
+        return False, idx
+    if tag == 105:  # i
+        return unpack(">q", data[idx : idx + 8])[0], idx + 8
+    if tag == 100:  # d
+        return unpack(">d", data[idx : idx + 8])[0], idx + 8
+    length = unpack(">I", data[idx : idx + 4])[0]
+    idx += 4
+    if tag == 115:  # s
+        return str(data[idx : idx + length], "utf-8"), idx + length
+    if tag == 98:  # b
+        return bytes(data[idx : idx + length]), idx + length
+    if tag == 108:  # l
+        items = []
+        for _ in range(length):
+            item, idx = _decode(data, idx)
+            items.append(item)
+        return items, idx
+    if tag == 109:  # m
+        items = {}
+        for _ in range(length):
+            key, idx = _decode(data, idx)
+            items[key], idx = _decode(data, idx)
+        return items, idx
+    raise ValueError("Unknown tag " + str(tag))
+
+
+def decode(data):
+    """Decode bytes created by :func:`encode`."""
+    value, idx = _decode(data, 0)
+    if idx != len(data):
+        raise ValueError("Trailing bytes in payload")
+    return value
+
+
+def frame(kind, seq, payload=b""):
+    """Create a frame with the given kind, sequence number and payload."""
+    return MAGIC + pack(HEADER, kind, seq & 0xFFFF, len(payload)) + payload
+
+
+def _read_exact(rx, nbytes):
+    buf = bytearray(nbytes)
+    view = memoryview(buf)
+    received = 0
+    while received < nbytes:
+        received += rx.readinto(view[received:]) or 0
+    return buf
+
+
+def read_frame(rx):
+    """
+    Read the next frame from a blocking binary stream.
+
+    Bytes before the magic are skipped.
+
+    Returns:
+        tuple: (kind, sequence, payload)
+    """
+    prev = b""
+    while True:
+        byte = _read_exact(rx, 1)
+        if prev + byte == MAGIC:
+            break
+        prev = byte
+    kind, seq, length = unpack(HEADER, _read_exact(rx, HEADER_BYTES))
+    return kind, seq, _read_exact(rx, length)
+
+
+def _format_exception(exc):
+    try:
+        import io
+        import sys
+
+        buf = io.StringIO()
+        sys.print_exception(exc, buf)
+        return buf.getvalue()
+    except AttributeError:
+        import traceback
+
+        return "".join(traceback.format_exception(exc))
+
+
+def serve(namespace, rx=None, tx=None):
+    """
+    Request loop executed on the board.
+
+    Keyboard interrupts are disabled so binary payloads can contain 0x03.
+    The loop ends on a STOP frame, the raw REPL is usable again afterwards.
+
+    Args:
+        namespace (dict): Globals in which functions are defined, typically
+            the globals of the REPL so functions share state like ``host``.
+        rx, tx: Binary streams, default to stdin and stdout.
+    """
+    import sys
+
+    if rx is None:
+        rx = sys.stdin.buffer
+    if tx is None:
+        tx = sys.stdout.buffer
+    try:
+        from micropython import kbd_intr
+    except ImportError:
+        kbd_intr = None
+    if kbd_intr is not None:
+        kbd_intr(-1)
+    try:
+        tx.write(frame(READY, 0))
+        while True:
+            kind, seq, payload = read_frame(rx)
+            if kind == STOP:
+                tx.write(frame(STOP, seq))
+                break
+            try:
+                if kind == DEFINE:
+                    name, source = decode(payload)
+                    exec(source, namespace)  # noqa: S102 (functions sent by the host)
+                    _registry[name] = namespace[name]
+                    result = None
+                elif kind == CALL:
+                    name, args, kwargs = decode(payload)
+                    result = _registry[name](*args, **kwargs)
+                elif kind == DATA:
+                    tx.write(_write_chunk(seq, payload))
+                    continue
+                else:
+                    raise ValueError("Unknown frame kind " + str(kind))
+                reply = frame(RESULT, seq, encode(result))
+            # any error is returned to the host, the loop keeps serving
+            except Exception as exc:  # noqa: BLE001
+                reply = frame(ERROR, seq, encode(_format_exception(exc)))
+            tx.write(reply)
+    finally:
+        if kbd_intr is not None:
+            kbd_intr(3)
@@ -11,6 +11,8 @@ def connect_synchronized_spi(m, board_spi, spi_interface, singlestage_sync=False
         board_spi      -- Requested resource (with .sck/.cs/.sdi/.sdo), requested with dir="-"
         spi_interface  -- An instance of Luna's SPIDeviceInterface
         singestage_sync -- If True, use single-stage synchronization (may be less reliable)
+
+    For dual or quad SPI, sdi and sdo of the resource have a pin per lane.
     """
 
     # Wrap I/O pins with direction-aware buffers
@@ -19,6 +21,10 @@ def connect_synchronized_spi(m, board_spi, spi_interface, singlestage_sync=False
     sdi = Buffer("i", board_spi.sdi)
     sdo = Buffer("o", board_spi.sdo)
 
+    lanes = len(spi_interface.spi.sdi)
+    if len(board_spi.sdi) != lanes or len(board_spi.sdo) != lanes:
+        raise ValueError(f"SPI resource does not provide {lanes} data lanes")
+
     # Register buffers as submodules
     m.submodules += [sck, cs, sdi, sdo]
 
@@ -26,7 +32,7 @@ def connect_synchronized_spi(m, board_spi, spi_interface, singlestage_sync=False
         # Create synchronized input signals
         synced_clk = Signal()
         synced_csn = Signal()
-        synced_mosi = Signal()
+        synced_mosi = Signal(lanes)
 
         # Add synchronizers
         m.submodules += [
@@ -47,7 +53,7 @@ def connect_synchronized_spi(m, board_spi, spi_interface, singlestage_sync=False
         # Create single-stage registered signals
         synced_sck = Signal()
         synced_cs = Signal()
-        synced_sdi = Signal()
+        synced_sdi = Signal(lanes)
 
         # Register inputs on the FPGA clock
         m.d.sync += [
@@ -0,0 +1,201 @@
+"""Resource and Fmax benchmark of the gateware.
+
+Builds the Dispatcher for a matrix of PlatformConfig variants with the
+bundled yowasp tools on the UP5K:
+
+    python -m hexastorm.tests.bench_gateware
+    python -m hexastorm.tests.bench_gateware --baseline
+    python -m hexastorm.tests.bench_gateware default spram
+
+Every run appends the LUT (ICESTORM_LC), EBR (ICESTORM_RAM) and SPRAM use
+and the nextpnr Fmax of each variant to a JSON history. A variant which does
+not place, route or meet the clock constraint fails the run. Results are
+compared with the last run marked as baseline, more cells or a lower Fmax
+beyond the tolerance are reported as regression. Unchanged variants are taken
+from the build cache, see Firestarter.build.
+"""
+
+import argparse
+import json
+import subprocess
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from amaranth.build.run import LocalBuildProducts
+
+from hexastorm.config import PlatformConfig
+from hexastorm.core import Dispatcher
+from hexastorm.platforms import CACHE_DIR, Firestarter, build_report
+
+# resources of a result and their nextpnr cell
+CELLS = {"lut": "ICESTORM_LC", "ebr": "ICESTORM_RAM", "spram": "ICESTORM_SPRAM"}
+
+# PlatformConfig arguments per variant, besides these
+#   motors -- number of motors, the first axes of the motor configuration
+#   laser_timing -- changes to the laser timing, e.g. laser_hz sets words_scanline
+VARIANTS = {
+    "default": {},
+    "spram": {"fifo_memory": "spram"},
+    "two_motors": {"motors": 2},
+    "short_lines": {"laser_timing": {"laser_hz": 200e3}},
+    "dual": {"fifo_memory": "spram", "laser_channels": 2},
+    "grayscale": {"fifo_memory": "spram", "laser_bits": 4},
+}
+
+
+def platform_config(variant):
+    """Production configuration of a variant."""
+    options = dict(VARIANTS[variant])
+    motors = options.pop("motors", None)
+    laser_timing = options.pop("laser_timing", None)
+    cfg = PlatformConfig(test=False, **options)
+    if motors is not None:
+        steps = cfg.motor_cfg["steps_mm"]
+        cfg.motor_cfg["steps_mm"] = OrderedDict(list(steps.items())[:motors])
+    if laser_timing:
+        cfg.laser_timing.update(laser_timing)
+        cfg.update_laser_timing()
+    return cfg
+
+
+def measure(variant, build_dir=CACHE_DIR / "bench"):
+    """
+    Build a variant, returns its cell use, Fmax in MHz and if it passed.
+
+    The Fmax is None if the design does not fit or route, the cell use is
+    then read from the log of the failed build. A variant passes if it is
+    routed and every clock meets its constraint.
+    """
+    build_dir = Path(build_dir) / variant
+    built = True
+    try:
+        products = Firestarter().build(
+            Dispatcher(platform_config(variant)),
+            build_dir=str(build_dir),
+            do_program=False,
+        )
+    except subprocess.CalledProcessError:
+        built = False
+        products = LocalBuildProducts(str(build_dir))
+    try:
+        report = build_report(products)
+    except OSError:
+        # the toolchain stopped before nextpnr wrote its log
+        built = False
+        report = {"utilization": {}, "fmax": {}, "passed": {}}
+    result = {
+        key: report["utilization"].get(cell, (0, 0))[0] for key, cell in CELLS.items()
+    }
+    result["fmax"] = min(report["fmax"].values(), default=None) if built else None
+    passed = report["passed"].values()
+    result["passed"] = built and bool(passed) and all(passed)
+    return result
+
+
+def failures(results):
+    """Variants which did not place, route or meet timing."""
+    return [
+        f"{variant}: failed place, route or timing"
+        for variant, result in results.items()
+        if not result["passed"]
+    ]
+
+
+def regressions(results, baseline, tolerance=0.02, fmax_tolerance=0.05):
+    """
+    Compare results with a baseline.
+
+    Placement is seeded, so Fmax varies more than the cell count between
+    small changes.
+
+    Returns:
+        list[str]: a message per regression
+    """
+    messages = []
+    for variant, result in results.items():
+        reference = baseline.get(variant)
+        if reference is None:
+            continue
+        for key in CELLS:
+            if result[key] > reference[key] * (1 + tolerance):
+                messages.append(f"{variant}: {key} {reference[key]} -> {result[key]}")
+        # a build which failed is reported by failures
+        if result["fmax"] is None or reference["fmax"] is None:
+            continue
+        elif result["fmax"] < reference["fmax"] * (1 - fmax_tolerance):
+            messages.append(
+                f"{variant}: fmax {reference['fmax']:.2f} -> {result['fmax']:.2f} MHz"
+            )
+    return messages
+
+
+def load_history(path):
+    """Runs in the history file, oldest first."""
+    path = Path(path)
+    if not path.exists():
+        return []
+    return json.loads(path.read_text())
+
+
+def last_baseline(history):
+    """Results of the last run marked as baseline, merged per variant."""
+    baseline = {}
+    for run in history:
+        if run["baseline"]:
+            baseline.update(run["results"])
+    return baseline
+
+
+def run(
+    variants=None, history_path=None, baseline=False, build_dir=CACHE_DIR / "bench"
+):
+    """
+    Benchmark the variants, append them to the history and report failures
+    and regressions.
+
+    Returns:
+        list[str]: a message per failure or regression
+    """
+    if history_path is None:
+        history_path = PlatformConfig().paths["base"] / "bench_gateware.json"
+    history = load_history(history_path)
+    results = {}
+    for variant in variants or VARIANTS:
+        results[variant] = measure(variant, build_dir)
+        result = results[variant]
+        fmax = "failed" if result["fmax"] is None else f"{result['fmax']:6.2f} MHz"
+        if result["fmax"] is not None and not result["passed"]:
+            fmax += " FAIL"
+        print(
+            f"{variant:<12} lut {result['lut']:5d} ebr {result['ebr']:3d} "
+            f"spram {result['spram']} fmax {fmax}"
+        )
+    failed = failures(results)
+    for message in failed:
+        print("FAILED " + message)
+    messages = regressions(results, last_baseline(history))
+    for message in messages:
+        print("REGRESSION " + message)
+    history.append(
+        {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "baseline": baseline,
+            "results": results,
+        }
+    )
+    Path(history_path).write_text(json.dumps(history, indent=2))
+    return failed + messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("variants", nargs="*", help=", ".join(VARIANTS))
+    parser.add_argument("--baseline", action="store_true", help="mark run as baseline")
+    parser.add_argument("--history", help="JSON history, default output folder")
+    args = parser.parse_args()
+    for variant in args.variants:
+        if variant not in VARIANTS:
+            parser.error(f"unknown variant {variant}")
+    messages = run(args.variants, args.history, args.baseline)
+    raise SystemExit(1 if messages else 0)
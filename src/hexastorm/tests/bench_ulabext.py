@@ -0,0 +1,72 @@
+"""Micro-benchmark for bit packing in ulabext.
+
+Runs under CPython and MicroPython, e.g. the unix port with ulab:
+
+    python -m hexastorm.tests.bench_ulabext
+    micropython -m hexastorm.tests.bench_ulabext
+
+Reports microseconds per scanline for the per-bit reference loop and the
+MicroPython implementation (viper if available, else lookup table).
+On CPython the numpy implementation is timed as well.
+"""
+
+from random import getrandbits
+
+from hexastorm import ulabext
+from hexastorm.fpga_host.telemetry import ticks_diff, ticks_us
+
+
+def packbits_reference(bitlst, bitorder="big"):
+    """Per-bit implementation as used before the lookup tables."""
+    bitlst_len = len(bitlst)
+    num_bytes = (bitlst_len + 7) // 8
+    byte_arr = bytearray(num_bytes)
+    for byte_index in range(num_bytes):
+        byte_val = 0
+        for i in range(8):
+            bit_idx = byte_index * 8 + i
+            if bit_idx >= bitlst_len:
+                break
+            bit = bitlst[bit_idx]
+            if bitorder == "big":
+                byte_val = (byte_val << 1) | bit
+            else:
+                byte_val |= bit << i
+        if bitorder == "big":
+            byte_val <<= 8 - min(8, bitlst_len - byte_index * 8)
+        byte_arr[byte_index] = byte_val
+    return byte_arr
+
+
+def timeit(func, args, repeat):
+    start = ticks_us()
+    for _ in range(repeat):
+        func(*args)
+    return ticks_diff(ticks_us(), start) / repeat
+
+
+def run(length=792, repeat=200):
+    """Time packing and unpacking of a scanline with length bits."""
+    bits = [getrandbits(1) for _ in range(length)]
+    packed = bytes(packbits_reference(bits))
+    results = {}
+    results["reference packbits"] = timeit(packbits_reference, (bits,), repeat)
+    is_micropython = ulabext.IS_MICROPYTHON
+    if not is_micropython:
+        results["numpy packbits"] = timeit(ulabext.packbits, (bits,), repeat)
+        results["numpy unpackbits"] = timeit(ulabext.unpackbits, (packed,), repeat)
+    # MicroPython code paths, on CPython only the lookup tables can be used
+    ulabext.IS_MICROPYTHON = True
+    try:
+        path = "viper" if ulabext._pack_viper is not None else "lut"
+        results[path + " packbits"] = timeit(ulabext.packbits, (bits,), repeat)
+        results["lut unpackbits"] = timeit(ulabext.unpackbits, (packed,), repeat)
+    finally:
+        ulabext.IS_MICROPYTHON = is_micropython
+    for name, us in results.items():
+        print(f"{name:<20} {us:10.1f} us/line")
+    return results
+
+
+if __name__ == "__main__":
+    run()
@@ -8,7 +8,9 @@ from ulab import numpy as np
 
 from hexastorm.config import Spi
 from hexastorm.fpga_host.micropython import ESP32HostSync
+from hexastorm import ulabext
 from hexastorm.ulabext import assert_array_almost_equal
+from hexastorm.tests.bench_ulabext import packbits_reference
 from hexastorm.fpga_host.tools import find_shift
 
 
@@ -27,6 +29,21 @@ class Base(unittest.TestCase):
         cls.host.reset()
 
 
+class PackbitsTest(unittest.TestCase):
+    """Bit packing on the board, with the viper emitter of the port."""
+
+    def test_viper_packbits(self):
+        self.assertIsNotNone(ulabext._pack_viper)
+        # not a multiple of 8, the last byte is padded
+        bits = [1, 0, 1, 1] * 7 + [1]
+        for bitorder in ("big", "little"):
+            expected = bytes(packbits_reference(bits, bitorder))
+            actual = bytes(ulabext.packbits(bits, bitorder))
+            self.assertEqual(expected, actual)
+        with self.assertRaises(ValueError):
+            ulabext.packbits([0, 2, 1], "big")
+
+
 class StaticTest(Base):
     def test_memfull(self):
         """Fill FIFO to the brim and make sure it empties again."""
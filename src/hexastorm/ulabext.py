@@ -26,8 +26,79 @@ def sign(x):
         return np.array(result)
 
 
+# Native code paths, compiled from source so ports without the viper
+# emitter can still import this module. Returns the bitwise or of all
+# source bytes, anything above 1 is an invalid bit.
+_VIPER_SRC = """
+@micropython.viper
+def _pack_viper(src: ptr8, dst: ptr8, nbytes: int, little: int) -> int:
+    seen = 0
+    i = 0
+    for j in range(nbytes):
+        val = 0
+        for k in range(8):
+            bit = src[i + k]
+            seen |= bit
+            if little:
+                val |= bit << k
+            else:
+                val |= bit << (7 - k)
+        dst[j] = val
+        i += 8
+    return seen
+"""
+
+
+def _compile_viper(scope):
+    """Compile the viper source in scope, holding micropython."""
+    exec(_VIPER_SRC, scope)  # noqa: S102 (fixed source, see above)
+    return scope["_pack_viper"]
+
+
+_pack_viper = None
+if IS_MICROPYTHON:
+    try:
+        import micropython
+
+        _pack_viper = _compile_viper({"micropython": micropython})
+    except (ImportError, SyntaxError, ValueError):
+        pass
+
+# lookup tables per bitorder, built on first use
+_PACK_LUT = {}
+_UNPACK_LUT = {}
+
+
+def _bits_of(value, bitorder):
+    if bitorder == "big":
+        return bytes((value >> (7 - i)) & 1 for i in range(8))
+    return bytes((value >> i) & 1 for i in range(8))
+
+
+def _pack_lut(bitorder):
+    """Maps 8 bytes with a bit each to the packed byte."""
+    lut = _PACK_LUT.get(bitorder)
+    if lut is None:
+        lut = {_bits_of(value, bitorder): value for value in range(256)}
+        _PACK_LUT[bitorder] = lut
+    return lut
+
+
+def _unpack_lut(bitorder):
+    """Maps a byte to 8 bytes with a bit each."""
+    lut = _UNPACK_LUT.get(bitorder)
+    if lut is None:
+        lut = [_bits_of(value, bitorder) for value in range(256)]
+        _UNPACK_LUT[bitorder] = lut
+    return lut
+
+
 def packbits(bitlst, bitorder="big"):
     """Packs a list of binary values into an array of uint8 bytes.
+
+    On MicroPython, a viper loop is used if the port supports it, otherwise
+    bits are packed per 8 with a lookup table.
+
     Args:
         bitlst: list or 1D array of 0s and 1s
         bitorder: "big" or "little" endian bit packing
@@ -37,28 +108,55 @@ def packbits(bitlst, bitorder="big"):
     if not IS_MICROPYTHON:
         return np.packbits(bitlst, bitorder=bitorder)
 
-    bitlst_len = len(bitlst)
-    num_bytes = math.ceil(bitlst_len / 8)
+    if isinstance(bitlst, (list, tuple, bytes, bytearray)):
+        bits = bytearray(bitlst)
+    else:
+        bits = bytearray(int(bit) for bit in bitlst)
+    num_bytes = (len(bits) + 7) // 8
+    # pad with zeros to a multiple of 8
+    bits.extend(bytes(num_bytes * 8 - len(bits)))
+    bits = bytes(bits)
     byte_arr = bytearray(num_bytes)
 
-    for byte_index in range(num_bytes):
-        byte_val = 0
-        for i in range(8):
-            bit_idx = byte_index * 8 + i
-            if bit_idx >= bitlst_len:
-                break
-            bit = bitlst[bit_idx]
-            if bitorder == "big":
-                byte_val = (byte_val << 1) | bit
-            else:  # little-endian
-                byte_val |= bit << i
-        if bitorder == "big":
-            byte_val <<= 8 - min(8, bitlst_len - byte_index * 8)
-        byte_arr[byte_index] = byte_val
-
+    if _pack_viper is not None:
+        if _pack_viper(bits, byte_arr, num_bytes, int(bitorder != "big")) > 1:
+            raise ValueError("Bits must be 0 or 1")
+    else:
+        lut = _pack_lut(bitorder)
+        try:
+            for idx in range(num_bytes):
+                byte_arr[idx] = lut[bits[8 * idx : 8 * idx + 8]]
+        except KeyError:
+            raise ValueError("Bits must be 0 or 1")
     return np.array(byte_arr, dtype=np.uint8)
 
 
+def unpackbits(bytelst, bitorder="big", count=None):
+    """Unpacks uint8 values into an array of bits, inverse of packbits.
+
+    Args:
+        bytelst: bytes, list or 1D array of uint8
+        bitorder: "big" or "little" endian bit order
+        count: number of bits to return, defaults to all
+    Returns:
+        Numpy/ulab array of uint8
+    """
+    if not IS_MICROPYTHON:
+        if isinstance(bytelst, (bytes, bytearray)):
+            bytelst = np.frombuffer(bytelst, dtype=np.uint8)
+        return np.unpackbits(
+            np.asarray(bytelst, dtype=np.uint8), count=count, bitorder=bitorder
+        )
+
+    if not isinstance(bytelst, (list, tuple, bytes, bytearray)):
+        bytelst = [int(byte) for byte in bytelst]
+    lut = _unpack_lut(bitorder)
+    bits = b"".join([lut[byte] for byte in bytelst])
+    if count is not None:
+        bits = bits[:count]
+    return np.array(bytearray(bits), dtype=np.uint8)
+
+
 def assert_array_almost_equal(x, y, decimal=6, err_msg="", verbose=True):
     """Assert that two arrays are almost equal up to a given decimal precision."""
 
@@ -41,6 +41,19 @@ class Tests(unittest.TestCase):
         self.assertEqual(result, "15")
         logger.info(f"Valid command output verified: {result}")
 
+    def test_rpc_call(self):
+        """
+        Tests that a registered function returns binary data over RPC.
+        """
+
+        def remote_bytes(length):
+            return bytes(range(length))
+
+        result = self.esp.call(remote_bytes, 200)
+        self.assertEqual(result, bytes(range(200)))
+        # the REPL is still usable afterwards
+        self.assertEqual(self.esp.exec_wait("print('done')"), "done")
+
     def test_blink(self):
         logger.info("Running Blink Test...")
         
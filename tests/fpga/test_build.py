@@ -1,11 +1,21 @@
+import tempfile
 import unittest
+from pathlib import Path
+
+from amaranth.build.run import LocalBuildProducts
 
 from hexastorm.core import Dispatcher, SPIParser
 
 from hexastorm.movement import Polynomial
 from hexastorm.lasers import Laserhead
-from hexastorm.platforms import Firestarter
+from hexastorm.platforms import Firestarter, build_key, build_report
 from hexastorm.config import PlatformConfig
+from hexastorm.tests.bench_gateware import (
+    VARIANTS,
+    failures,
+    platform_config,
+    regressions,
+)
 
 
 class TestBuild(unittest.TestCase):
@@ -20,6 +30,143 @@ class TestBuild(unittest.TestCase):
             verbose=True,
         )
 
+    def test_build_key(self):
+        """the key changes with the design and the toolchain"""
+
+        def key(versions="yosys", **kwargs):
+            plan = Firestarter().prepare(
+                Laserhead(PlatformConfig(test=False, **kwargs))
+            )
+            return build_key(plan, versions)
+
+        self.assertEqual(key(), key())
+        self.assertNotEqual(key(), key(fifo_memory="spram", laser_bits=2))
+        self.assertNotEqual(key(), key(versions="yosys 0.1"))
+
+    def test_build_report(self):
+        """utilization and the routed fmax are read from the nextpnr log"""
+        log = (
+            "Info: Device utilisation:\n"
+            "Info: \t         ICESTORM_LC:    2918/   5280    55%\n"
+            "Info: \t        ICESTORM_RAM:      28/     30    93%\n"
+            "Info: Max frequency for clock 'cd_sync.clk': "
+            "23.27 MHz (FAIL at 24.00 MHz)\n"
+            "Info: Max frequency for clock 'cd_sync.clk': "
+            "29.44 MHz (PASS at 24.00 MHz)\n"
+        )
+        with tempfile.TemporaryDirectory() as root:
+            (Path(root) / "top.tim").write_text(log)
+            report = build_report(LocalBuildProducts(root))
+        self.assertEqual(
+            report["utilization"],
+            {"ICESTORM_LC": (2918, 5280), "ICESTORM_RAM": (28, 30)},
+        )
+        self.assertEqual(report["fmax"], {"cd_sync.clk": 29.44})
+        self.assertEqual(report["passed"], {"cd_sync.clk": True})
+
+    def test_bench_variants(self):
+        """every benchmark variant elaborates for the board"""
+        for variant in VARIANTS:
+            with self.subTest(variant=variant):
+                Firestarter().prepare(Dispatcher(platform_config(variant)))
+        self.assertEqual(platform_config("two_motors").hdl_cfg.motors, 2)
+
+    def test_bench_regressions(self):
+        """more cells or a lower fmax than the baseline are reported"""
+        baseline = {
+            "default": {
+                "lut": 2900,
+                "ebr": 28,
+                "spram": 0,
+                "fmax": 30.0,
+                "passed": True,
+            }
+        }
+        noise = {
+            "default": {
+                "lut": 2910,
+                "ebr": 28,
+                "spram": 0,
+                "fmax": 29.0,
+                "passed": True,
+            }
+        }
+        self.assertEqual(regressions(noise, baseline), [])
+        self.assertEqual(regressions({"spram": noise["default"]}, baseline), [])
+        worse = {
+            "default": {
+                "lut": 3100,
+                "ebr": 28,
+                "spram": 1,
+                "fmax": 25.0,
+                "passed": True,
+            }
+        }
+        self.assertEqual(
+            regressions(worse, baseline),
+            [
+                "default: lut 2900 -> 3100",
+                "default: spram 0 -> 1",
+                "default: fmax 30.00 -> 25.00 MHz",
+            ],
+        )
+        self.assertEqual(failures(worse), [])
+
+    def test_bench_failures(self):
+        """a variant which does not fit or meet timing fails, also without baseline"""
+        failed = {
+            "default": {
+                "lut": 5297,
+                "ebr": 28,
+                "spram": 0,
+                "fmax": None,
+                "passed": False,
+            },
+            "spram": {
+                "lut": 4000,
+                "ebr": 28,
+                "spram": 4,
+                "fmax": 23.1,
+                "passed": False,
+            },
+        }
+        self.assertEqual(
+            failures(failed),
+            [
+                "default: failed place, route or timing",
+                "spram: failed place, route or timing",
+            ],
+        )
+        self.assertEqual(regressions(failed, failed), [])
+
+    def spram(self):
+        platform = Firestarter()
+        platform.build(
+            Dispatcher(PlatformConfig(test=False, fifo_memory="spram")),
+            do_program=False,
+            verbose=True,
+        )
+
+    def dual(self):
+        """two laser channels, a sweep exposes two lanes"""
+        platform = Firestarter()
+        platform.build(
+            Dispatcher(
+                PlatformConfig(test=False, fifo_memory="spram", laser_channels=2)
+            ),
+            do_program=False,
+            verbose=True,
+        )
+
+    def grayscale(self):
+        """four bits per pixel, the laser is on for a fraction of a pixel"""
+        platform = Firestarter()
+        platform.build(
+            Dispatcher(PlatformConfig(test=False, fifo_memory="spram", laser_bits=4)),
+            do_program=False,
+            verbose=True,
+        )
+
     def parser(self):
         platform = Firestarter()
         platform.build(
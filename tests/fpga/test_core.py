@@ -5,8 +5,9 @@ from numpy.testing import assert_array_almost_equal, assert_array_equal
 
 from hexastorm.config import Spi, PlatformConfig
 from hexastorm.utils import async_test_case
-from hexastorm.luna.spi import SPIGatewareTestCase
+from hexastorm.luna.spi import SPIGatewareTestCase, MultiLaneSPIGatewareTestCase
 from hexastorm.fpga_host.mock import MockHost
+from hexastorm.fpga_host.gcode import GCodeInterpreter
 from hexastorm.core import SPIParser, Dispatcher
 
 
@@ -58,6 +59,54 @@ class TestParser(SPIGatewareTestCase):
         await self.wait_until(~self.dut.fifo.empty)
         await self.assert_fifo_written(self.hdl_cfg.words_scanline)
 
+    @async_test_case
+    async def test_burst_write_to_fifo(self, sim, lines=3):
+        """
+        Verifies that a burst writes several scanlines with a single command byte.
+        """
+        host = self.host
+        laser_timing = host.cfg.laser_timing
+        byte_lst = host.bit_to_byte_list([1] * laser_timing["scanline_length"])
+        words = lines * self.hdl_cfg.words_scanline
+        burst = host.byte_to_burst(byte_lst * lines)
+        per_word = b"".join(host.byte_to_cmd_list(byte_lst * lines))
+        # a command byte per word is saved
+        self.assertEqual(len(per_word) - len(burst), words - 1)
+        await host.send_command(burst)
+        await self.assert_fifo_written(words)
+        self.assertFalse((await host.fpga_state)["error"])
+
+    @async_test_case
+    async def test_burst_dropped_after_invalid_word(self, sim):
+        """
+        Verifies that the words of a burst after an invalid instruction are dropped.
+        """
+        pin = [0] * (Spi.word_bytes - 1) + [Spi.Instructions.write_pin]
+        invalid = [0] * Spi.word_bytes
+        await self.host.send_command([Spi.Commands.burst | 2] + invalid + pin + pin)
+        state = await self.host.fpga_state
+        self.assertTrue(state["error"])
+        self.assertTrue(state["mem_empty"])
+
+    @async_test_case
+    async def test_watermark(self, sim):
+        """
+        Verifies that fifo_low follows the programmed low-watermark.
+        """
+        host = self.host
+        hdl_cfg = self.hdl_cfg
+        self.assertTrue(sim.get(self.dut.fifo_low))
+        with self.assertRaises(ValueError):
+            await host.set_watermark(hdl_cfg.mem_depth)
+        await host.set_watermark(hdl_cfg.mem_depth - 1)
+        self.assertTrue(sim.get(self.dut.fifo_low))
+        await host.enable_comp(laser0=True, laser1=False, polygon=False)
+        await self.assert_fifo_written(1)
+        self.assertFalse(sim.get(self.dut.fifo_low))
+        await host.flush_buffer()
+        await self.advance_cycles(2)
+        self.assertTrue(sim.get(self.dut.fifo_low))
+
     @async_test_case
     async def test_scanline_empty_to_fifo(self, sim):
         """
@@ -213,13 +262,35 @@ class TestParser(SPIGatewareTestCase):
         # 5. Assert hardware reacted correctly
         self.assertTrue(sim.get(self.dut.parse))  # Parsing remains enabled
         self.assertTrue(sim.get(self.dut.fifo.empty))  # FIFO should be empty
-        self.assertTrue((await self.host.fpga_state)["mem_empty"])  # Host status should reflect empty
+        # Host status should reflect empty
+        self.assertTrue((await self.host.fpga_state)["mem_empty"])
         self.assertEqual(
             sim.get(self.dut.fifo.space_available),
             self.hdl_cfg.mem_depth,  # Space should be fully restored
         )
 
 
+class TestParserDualSPI(TestParser, MultiLaneSPIGatewareTestCase):
+    """Parser tests with two SPI data lanes per direction."""
+
+    spi_lanes = 2
+    hdl_cfg = PlatformConfig(test=True, spi_lanes=2).hdl_cfg
+    FRAGMENT_ARGUMENTS = {"hdl_cfg": hdl_cfg}
+
+    def test_lanes_simulation_only(self):
+        """the board and host have a single lane"""
+        with self.assertRaises(ValueError):
+            PlatformConfig(test=False, spi_lanes=self.spi_lanes)
+
+
+class TestParserQuadSPI(TestParserDualSPI):
+    """Parser tests with four SPI data lanes per direction."""
+
+    spi_lanes = 4
+    hdl_cfg = PlatformConfig(test=True, spi_lanes=4).hdl_cfg
+    FRAGMENT_ARGUMENTS = {"hdl_cfg": hdl_cfg}
+
+
 class TestDispatcher(SPIGatewareTestCase):
     plf_cfg = PlatformConfig(test=True)
     FRAGMENT_UNDER_TEST = Dispatcher
@@ -472,7 +543,7 @@ class TestDispatcher(SPIGatewareTestCase):
 
         # wait till instruction is received
         await self.wait_until(self.dut.pol.start)
-        await sim.tick()
+        await self.wait_until(self.dut.pol.busy)
         await self.wait_until(~self.dut.pol.busy)
 
         # confirm receipt tick limit of segment
@@ -563,6 +634,28 @@ class TestDispatcher(SPIGatewareTestCase):
             actual_pos_return, np.zeros(hdl_cfg.motors), decimal=1
         )
 
+    @async_test_case
+    async def test_gcode_stream(self, sim, steps=400, ticks=20_000):
+        """stream G-code through the interpreter and verify move and fan duty"""
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        steps_mm = list(self.plf_cfg.motor_cfg["steps_mm"].values())
+        axes = list(self.plf_cfg.motor_cfg["steps_mm"].keys())
+        mm = np.array([steps / s for s in steps_mm[: hdl_cfg.motors]])
+        feedrate = float(np.sqrt(np.sum(mm**2)) / (ticks / hdl_cfg.motor_freq)) * 60
+
+        self.simulated_positions = [0] * self.motors
+        self.prev_steps = [sim.get(s.step) for s in self.dut.pol.steppers]
+
+        target = " ".join(f"{ax.upper()}{pos:.4f}" for ax, pos in zip(axes, mm))
+        gcode = GCodeInterpreter(self.host)
+        await gcode.run(["M106 S85", f"G1 {target} F{feedrate:.2f}"])
+        await self.wait_complete()
+
+        assert_array_almost_equal(self.get_simulated_fpga_position_mm(), mm, decimal=1)
+        self.assertEqual(sim.get(self.dut.fan_duty), 85)
+        self.assertEqual(gcode.stats["moves"], 1)
+        self.assertFalse((await self.host.fpga_state)["error"])
+
     @async_test_case
     async def test_writeline(self, sim, num_lines=20, steps_line=0.5):
         """
@@ -581,7 +674,9 @@ class TestDispatcher(SPIGatewareTestCase):
         self.simulated_positions = [0] * self.motors
         self.prev_steps = [sim.get(s.step) for s in self.dut.pol.steppers]
 
-        # Queue lines
+        # Queue lines, the synchronized check depends on the SPI timing
+        # of commands per word
+        host.burst_writes = False
         for _ in range(num_lines):
             await host.write_line([1] * laz_tim["scanline_length"], steps_line, 0)
         await host.write_line([])
@@ -600,7 +695,8 @@ class TestDispatcher(SPIGatewareTestCase):
         actual_pos = self.get_simulated_fpga_position_mm()
         assert_array_almost_equal(-dist, actual_pos[idx], decimal=decimals)
 
-        # Return pass
+        # Return pass, with burst writes
+        host.burst_writes = True
         for _ in range(num_lines):
             await host.write_line([1] * laz_tim["scanline_length"], steps_line, 1)
         await host.write_line([])
@@ -635,3 +731,36 @@ class TestDispatcher(SPIGatewareTestCase):
             [ticksperiod_rec, facet_rec] = await host.read_facet_ticks_and_id()
             self.assertEqual(facet_rec, facet)
             self.assertAlmostEqual(ticksperiod_rec, ticks_facet, delta=1)
+
+    @async_test_case
+    async def test_facet_stats(self, sim):
+        """
+        Facet period statistics are read in a single transaction and cleared.
+        """
+        host = self.host
+        ticks_facet = self.plf_cfg.laser_timing["facet_ticks"]
+        await host.enable_comp(synchronize=True)
+        await self.wait_until(self.dut.lh.synchronized)
+        await self.advance_cycles(ticks_facet * 8)
+        stats = await host.read_facet_stats()
+        self.assertEqual(len(stats), self.plf_cfg.laser_timing["facets"])
+        for facet_stats in stats:
+            self.assertGreaterEqual(facet_stats["count"], 2)
+            self.assertAlmostEqual(facet_stats["mean"], ticks_facet, delta=1)
+            self.assertLessEqual(facet_stats["std"], 1)
+            self.assertAlmostEqual(facet_stats["min"], ticks_facet, delta=1)
+            self.assertAlmostEqual(facet_stats["max"], ticks_facet, delta=1)
+        await host.enable_comp(synchronize=False)
+        await self.wait_until(~self.dut.lh.synchronized)
+        await host.read_facet_stats()
+        for facet_stats in await host.read_facet_stats():
+            self.assertEqual(facet_stats["count"], 0)
+            self.assertIsNone(facet_stats["mean"])
+        self.assertFalse((await host.fpga_state)["error"])
+
+
+class TestDispatcherSPRAM(TestDispatcher):
+    """Dispatcher tests with the FIFO stored in single-port RAM."""
+
+    plf_cfg = PlatformConfig(test=True, fifo_memory="spram")
+    FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
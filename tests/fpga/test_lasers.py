@@ -75,17 +75,27 @@ class BaseTest(LunaGatewareTestCase):
                 count += 1 if sim.get(dut.dir) else -1
         return count
 
-    async def check_line(self, bit_lst, steps_per_line=1, direction=0):
-        """Verify laser produces correct scan pattern."""
+    async def check_line(self, bit_lst, steps_per_line=1, direction=0, config=0):
+        """Verify laser produces correct scan pattern.
+
+        With two laser channels, the bits of the channels are interleaved.
+        With grayscale exposure, the list holds the level of every pixel.
+        The line is preceded by config facet offset or laser timing instructions.
+        """
         sim = self.sim
         dut = self.dut
         laz_tim = self.laz_tim
+        channels = self.plf_cfg.laser_channels
+        max_level = (1 << self.plf_cfg.laser_bits) - 1
 
         if not self.plf_cfg.hdl_cfg.single_line:
             self.assertFalse(sim.get(dut.empty))
 
         await self.wait_until_state("READ_INSTRUCTION")
-        await sim.tick()
+        # one cycle per configuration instruction
+        for _ in range(config + 1):
+            self.assertEqual(await self.get_state(), "READ_INSTRUCTION")
+            await sim.tick()
         # single facet mode; linecnt not equal to facet
         # stopline reset the line cnt
         if not sim.get(dut.singlefacet) and len(bit_lst) > 0:
@@ -100,12 +110,15 @@ class BaseTest(LunaGatewareTestCase):
             await self.wait_until_state("DATA_RUN")
             await sim.tick()
 
-            for idx, bit in enumerate(bit_lst):
+            for idx in range(len(bit_lst) // channels):
+                pixel = bit_lst[idx * channels : (idx + 1) * channels]
                 self.assertEqual(sim.get(dut.lasercnt), laz_tim["laser_ticks"] - 1)
                 self.assertEqual(sim.get(dut.scanbit), idx + 1)
 
-                for _ in range(laz_tim["laser_ticks"]):
-                    self.assertEqual(sim.get(dut.lh_rec.lasers[0]), bit)
+                for tick in range(laz_tim["laser_ticks"]):
+                    for channel, level in enumerate(pixel):
+                        on = tick * max_level < level * laz_tim["laser_ticks"]
+                        self.assertEqual(sim.get(dut.lh_rec.lasers[channel]), on)
                     await sim.tick()
         else:
             self.assertTrue(sim.get(dut.expose_finished))
@@ -129,7 +142,7 @@ class BaseTest(LunaGatewareTestCase):
         await self.pulse(sim, dut.read_commit_2)
         return data_out
 
-    async def write_line(self, bit_list, steps_per_line=1, direction=0):
+    async def write_line(self, bit_list, steps_per_line=1, direction=0, repeat=0):
         """Writes a scanline into FIFO manually (no dispatcher/parser).
 
         If you write to the FIFO, the space available reduces. The write /
@@ -137,7 +150,9 @@ class BaseTest(LunaGatewareTestCase):
         If you keep reading you move to the next block, if you discard
         you move back within the last block you read.
         """
-        byte_lst = self.host.bit_to_byte_list(bit_list, steps_per_line, direction)
+        byte_lst = self.host.bit_to_byte_list(
+            bit_list, steps_per_line, direction, repeat
+        )
         dut = self.dut
         sim = self.sim
 
@@ -152,13 +167,21 @@ class BaseTest(LunaGatewareTestCase):
 
         await self.pulse(dut.fifo.write_commit)
 
+    async def write_word(self, word):
+        """Writes a single word instruction into FIFO manually."""
+        dut = self.dut
+        self.sim.set(dut.fifo.write_data, word)
+        await self.pulse(dut.fifo.write_en)
+        await self.pulse(dut.fifo.write_commit)
+
     async def scanline_ring_buffer(self, numb_lines=3):
         """Write several scanlines to FIFO and validate playback."""
         sim = self.sim
         dut = self.dut
+        pixels = self.plf_cfg.laser_channels * self.laz_tim["scanline_length"]
+        max_level = (1 << self.plf_cfg.laser_bits) - 1
         lines = [
-            [randint(0, 1) for _ in range(self.laz_tim["scanline_length"])]
-            for _ in range(numb_lines)
+            [randint(0, max_level) for _ in range(pixels)] for _ in range(numb_lines)
         ]
         lines.append([])  # end with empty line
 
@@ -440,6 +463,177 @@ class MultilineTest(BaseTest):
         """Test multiple scanlines written to and read from the ring buffer."""
         await self.scanline_ring_buffer(numb_lines=3)
 
+    @async_test_case
+    async def test_repeat(self, sim, repeat=3):
+        """A line with a repeat count is exposed repeat + 1 times."""
+        dut = self.dut
+        lines = [
+            [randint(0, 1) for _ in range(self.laz_tim["scanline_length"])]
+            for _ in range(2)
+        ]
+        await self.write_line(lines[0], repeat=repeat)
+        await self.write_line(lines[1])
+        await self.write_line([])
+        await self.pulse(dut.expose_start)
+        sim.set(dut.synchronize, 1)
+
+        for line in [lines[0]] * (repeat + 1) + lines[1:] + [[]]:
+            await self.check_line(line)
+        self.assertTrue(sim.get(dut.empty))
+        self.assertTrue(sim.get(dut.expose_finished))
+
+    @async_test_case
+    async def test_facet_mask(self, sim, mask=0b0110):
+        """Lines are only exposed on facets enabled by the facet mask."""
+        dut = self.dut
+        facets = self.laz_tim["facets"]
+        lines = [[1] * self.laz_tim["scanline_length"]] * 3
+        await self.write_word((mask << 8) | Spi.Instructions.facet_mask)
+        for line in lines:
+            await self.write_line(line)
+        await self.write_line([])
+        await self.pulse(dut.expose_start)
+        sim.set(dut.synchronize, 1)
+
+        await self.wait_until_state("READ_INSTRUCTION")
+        await self.wait_until_state("WAIT_END")
+        # the configuration is written from a register, a cycle later
+        await sim.tick()
+        self.assertEqual(sim.get(dut.facet_mask), mask)
+        for line in lines:
+            await self.check_line(line)
+            # facet counter already points to the next facet
+            facet = (sim.get(dut.facetcnt) - 1) % facets
+            self.assertTrue((mask >> facet) & 1)
+        await self.check_line([])
+        self.assertTrue(sim.get(dut.empty))
+
+    @async_test_case
+    async def test_facet_offset(self, sim, offsets=(1, -1, 0, 0)):
+        """The start of a line is shifted by the offset of its facet."""
+        dut = self.dut
+        facets = self.laz_tim["facets"]
+        for facet, offset in enumerate(offsets):
+            await self.write_word(
+                ((offset & 0xFFFF) << 16) | (facet << 8) | Spi.Instructions.facet_offset
+            )
+        lines = [[0] * self.laz_tim["scanline_length"]] * 3
+        for line in lines:
+            await self.write_line(line)
+        await self.write_line([])
+        await self.pulse(dut.expose_start)
+        sim.set(dut.synchronize, 1)
+
+        # the offsets are read with the first line, at the same facet
+        await self.check_line(lines[0], config=len(offsets))
+        stored = [sim.get(offset) for offset in dut.facet_offsets]
+        self.assertEqual(stored, list(offsets))
+        delays = []
+        for _ in lines[1:]:
+            await self.wait_until_state("READ_INSTRUCTION")
+            facet = (sim.get(dut.facetcnt) - 1) % facets
+            ticks = 0
+            while await self.get_state() != "DATA_RUN":
+                ticks += 1
+                await sim.tick()
+            delays.append(ticks - offsets[facet])
+        # corrected for the offset, all lines start at the same tick
+        self.assertEqual(len(set(delays)), 1)
+        await self.check_line([])
+        self.assertFalse(sim.get(dut.error))
+
+    @async_test_case
+    async def test_laser_timing(self, sim):
+        """Lines after a laser_timing instruction use the new timing."""
+        dut = self.dut
+        slower = PlatformConfig(test=True)
+        registers = slower.set_laser_timing(laser_ticks=self.laz_tim["laser_ticks"] + 1)
+        line = [1] * self.laz_tim["scanline_length"]
+        await self.write_line(line)
+        for idx, value in enumerate(registers):
+            word = value << 16 | idx << 8 | Spi.Instructions.laser_timing
+            await self.write_word(word)
+        self.host.cfg = slower
+        await self.write_line(line)
+        await self.write_line([])
+        await self.pulse(dut.expose_start)
+        sim.set(dut.synchronize, 1)
+
+        await self.check_line(line)
+        # the timing is read with the second line, at the next facet
+        self.laz_tim = slower.laser_timing
+        await self.check_line(line, config=len(registers))
+        stored = [sim.get(dut.timing[name]) for name in Spi.laser_timing_registers]
+        self.assertEqual(stored, registers)
+        await self.check_line([])
+        self.assertFalse(sim.get(dut.error))
+
+    @async_test_case
+    async def test_facet_stats(self, sim, periods=9):
+        """Every synchronized period is added to the statistics of its facet."""
+        dut = self.dut
+        stats = dut.facet_stats
+        facets = self.laz_tim["facets"]
+        count_bits = Spi.facet_stats["count"]
+        ticks_bits = Spi.facet_stats["ticks"]
+
+        measured = [[] for _ in range(facets)]
+        sim.set(dut.synchronize, 1)
+        while sum(map(len, measured)) < periods:
+            await sim.tick()
+            if sim.get(stats.valid):
+                measured[sim.get(stats.facet)].append(sim.get(stats.ticks))
+        sim.set(dut.synchronize, 0)
+        # the last period is added a row per cycle
+        await self.advance_cycles(stats.ticks_bits + 3 + stats.ROWS)
+        # words are fetched from memory, a quarter per cycle
+        fetch = len(stats.word) // stats.ROW_BITS + 1
+
+        for facet, ticks in enumerate(measured):
+            sim.set(stats.index, 3 * facet)
+            await self.advance_cycles(fetch)
+            head = sim.get(stats.word)
+            self.assertEqual(head & ((1 << count_bits) - 1), len(ticks))
+            self.assertEqual((head >> count_bits) & ((1 << ticks_bits) - 1), min(ticks))
+            self.assertEqual(head >> (count_bits + ticks_bits), max(ticks))
+            sim.set(stats.index, 3 * facet + 1)
+            await self.advance_cycles(fetch)
+            self.assertEqual(sim.get(stats.word), sum(ticks))
+            sim.set(stats.index, 3 * facet + 2)
+            await self.advance_cycles(fetch)
+            self.assertEqual(sim.get(stats.word), sum(t * t for t in ticks))
+        self.assertAlmostEqual(
+            max(map(max, measured)), self.laz_tim["facet_ticks"], delta=1
+        )
+
+        # memory is cleared a row per cycle, the fetched word as well
+        sim.set(stats.index, 0)
+        await self.pulse(stats.clear)
+        await self.advance_cycles(stats.ROWS * facets + 3)
+        self.assertEqual(sim.get(stats.word), 0)
+        sim.set(stats.index, 3 * (facets - 1) + 2)
+        await self.advance_cycles(fetch)
+        self.assertEqual(sim.get(stats.word), 0)
+
+    @async_test_case
+    async def test_repeat_movement(self, sim, repeat=4):
+        """Every repetition steps the orthogonal axis."""
+        dut = self.dut
+        await self.write_line([1] * self.laz_tim["scanline_length"], 1, 1, repeat)
+        await self.write_line([])
+        sim.set(dut.synchronize, 1)
+        await sim.tick()
+        await self.pulse(dut.expose_start)
+        self.assertEqual(await self.count_steps(), repeat + 1)
+        self.assertFalse(sim.get(dut.error))
+
+
+class MultilineSPRAMTest(MultilineTest):
+    """Multiline tests with the FIFO stored in single-port RAM."""
+
+    plf_cfg = PlatformConfig(test=True, fifo_memory="spram")
+    FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
+
 
 class Loweredge(BaseTest):
     """Test Laserhead scanline exposure when scanline length equals memory word width."""
@@ -499,6 +693,207 @@ class Upperedge(Loweredge):
     FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
 
 
+class RunLengthTest(BaseTest):
+    """Test run-length encoded scanlines, long enough for RLE to pay off."""
+
+    plf_cfg = PlatformConfig(test=True)
+    laz_tim = plf_cfg.laser_timing
+    laz_tim.update(
+        {
+            "facet_ticks": 700,
+            "laser_ticks": 3,
+            "scanline_length": 3 * Spi.word_bytes * 8 + 5,
+        }
+    )
+    plf_cfg.update_laser_timing()
+
+    FRAGMENT_UNDER_TEST = DiodeSimulator
+    FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
+
+    async def initialize_signals(self, sim):
+        """Initialize signals, the host shares the platform configuration."""
+        self.sim = sim
+        self.host = MockHost(fifo_full=None, sim=None)
+        self.host.cfg = self.plf_cfg
+        sim.set(self.dut.pd_db.raw, 1)
+        await sim.tick()
+
+    def compressed(self, line):
+        """True if the host sends line as run-length encoded scanline."""
+        byte_lst = self.host.bit_to_byte_list(line)
+        return byte_lst[0] == Spi.Instructions.rle_scanline
+
+    @async_test_case
+    async def test_rle_lines(self, sim):
+        """Encoded lines, with runs spanning words, are exposed bit exact."""
+        dut = self.dut
+        length = self.laz_tim["scanline_length"]
+        lines = [
+            # two runs
+            [0] * 50 + [1] * (length - 50),
+            # runs of ten bits, encoding takes several words
+            [(idx // 10) % 2 for idx in range(length)],
+            # run longer than a single run byte
+            [1] * 150 + [0] * (length - 150),
+        ]
+        for line in lines:
+            self.assertTrue(self.compressed(line))
+            await self.write_line(line)
+        await self.write_line([])
+        await self.pulse(dut.expose_start)
+        sim.set(dut.synchronize, 1)
+
+        for line in lines + [[]]:
+            await self.check_line(line)
+        self.assertTrue(sim.get(dut.empty))
+        self.assertTrue(sim.get(dut.expose_finished))
+
+    @async_test_case
+    async def test_rle_mixed(self, sim, repeat=2):
+        """Raw and encoded lines can be mixed and encoded lines repeated."""
+        dut = self.dut
+        length = self.laz_tim["scanline_length"]
+        raw = [idx % 2 for idx in range(length)]
+        encoded = [0] * 100 + [1] * (length - 100)
+        self.assertFalse(self.compressed(raw))
+        await self.write_line(encoded, repeat=repeat)
+        await self.write_line(raw)
+        await self.write_line([])
+        await self.pulse(dut.expose_start)
+        sim.set(dut.synchronize, 1)
+
+        for line in [encoded] * (repeat + 1) + [raw, []]:
+            await self.check_line(line)
+        self.assertTrue(sim.get(dut.empty))
+
+
+class DualChannelTest(BaseTest):
+    """Test scanlines of two laser channels, spanning several words."""
+
+    plf_cfg = PlatformConfig(test=True, laser_channels=2)
+    laz_tim = plf_cfg.laser_timing
+    laz_tim.update(
+        {
+            "facet_ticks": 500,
+            "laser_ticks": 3,
+            "scanline_length": Spi.word_bytes * 8 // 2 + 5,
+        }
+    )
+    plf_cfg.update_laser_timing()
+
+    FRAGMENT_UNDER_TEST = DiodeSimulator
+    FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
+
+    async def initialize_signals(self, sim):
+        """Initialize signals, the host shares the platform configuration."""
+        self.sim = sim
+        self.host = MockHost(fifo_full=None, sim=None, laser_channels=2)
+        self.host.cfg = self.plf_cfg
+        sim.set(self.dut.pd_db.raw, 1)
+        await sim.tick()
+
+    @async_test_case
+    async def test_scanlineringbuffer(self, sim):
+        """Both lasers expose their own bits of several scanlines."""
+        await self.scanline_ring_buffer(numb_lines=3)
+
+    @async_test_case
+    async def test_independent_channels(self, sim):
+        """A laser can be off while the other one exposes, lines are not encoded."""
+        dut = self.dut
+        length = self.laz_tim["scanline_length"]
+        lines = [
+            [1, 0] * length,
+            [0, 1] * length,
+            [idx // 3 % 2 for idx in range(2 * length)],
+        ]
+        for line in lines:
+            byte_lst = self.host.bit_to_byte_list(line)
+            self.assertEqual(byte_lst[0], Spi.Instructions.scanline)
+            await self.write_line(line)
+        await self.write_line([])
+        await self.pulse(dut.expose_start)
+        sim.set(dut.synchronize, 1)
+
+        for line in lines + [[]]:
+            await self.check_line(line)
+        self.assertTrue(sim.get(dut.empty))
+
+
+class GrayscaleTest(BaseTest):
+    """Test grayscale scanlines, the laser is on for a fraction of a pixel."""
+
+    plf_cfg = PlatformConfig(test=True, laser_bits=2)
+    laz_tim = plf_cfg.laser_timing
+    laz_tim.update(
+        {
+            "facet_ticks": 500,
+            "laser_ticks": 4,
+            "scanline_length": Spi.word_bytes * 8 // 2 + 5,
+        }
+    )
+    plf_cfg.update_laser_timing()
+
+    FRAGMENT_UNDER_TEST = DiodeSimulator
+    FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
+
+    async def initialize_signals(self, sim):
+        """Initialize signals, the host shares the platform configuration."""
+        self.sim = sim
+        self.host = MockHost(
+            fifo_full=None,
+            sim=None,
+            laser_channels=self.plf_cfg.laser_channels,
+            laser_bits=self.plf_cfg.laser_bits,
+        )
+        self.host.cfg = self.plf_cfg
+        sim.set(self.dut.pd_db.raw, 1)
+        await sim.tick()
+
+    @async_test_case
+    async def test_scanlineringbuffer(self, sim):
+        """Every pixel is exposed for the ticks of its level."""
+        await self.scanline_ring_buffer(numb_lines=3)
+
+    @async_test_case
+    async def test_levels(self, sim):
+        """All levels follow each other, lines are not encoded."""
+        dut = self.dut
+        pixels = self.plf_cfg.laser_channels * self.laz_tim["scanline_length"]
+        max_level = (1 << self.plf_cfg.laser_bits) - 1
+        lines = [
+            [idx % (max_level + 1) for idx in range(pixels)],
+            [max_level] * pixels,
+        ]
+        for line in lines:
+            byte_lst = self.host.bit_to_byte_list(line)
+            self.assertEqual(byte_lst[0], Spi.Instructions.scanline)
+            await self.write_line(line)
+        await self.write_line([])
+        await self.pulse(dut.expose_start)
+        sim.set(dut.synchronize, 1)
+
+        for line in lines + [[]]:
+            await self.check_line(line)
+        self.assertTrue(sim.get(dut.empty))
+
+
+class DualGrayscaleTest(GrayscaleTest):
+    """Grayscale scanlines with four bits per pixel for two laser channels."""
+
+    plf_cfg = PlatformConfig(test=True, laser_channels=2, laser_bits=4)
+    laz_tim = plf_cfg.laser_timing
+    laz_tim.update(
+        {
+            "facet_ticks": 800,
+            "laser_ticks": 5,
+            "scanline_length": Spi.word_bytes * 8 // 8 + 3,
+        }
+    )
+    plf_cfg.update_laser_timing()
+    FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
+
+
 # NOTE: new class is created to reset settings
 #       couldn't avoid this easily so kept for now
 #
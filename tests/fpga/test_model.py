@@ -0,0 +1,558 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from random import randint, seed
+
+import numpy as np
+
+from hexastorm.config import PlatformConfig, Spi
+from hexastorm.core import Dispatcher
+from hexastorm.fpga_host.jobsim import JobSimulator
+from hexastorm.fpga_host.mock import MockHost
+from hexastorm.fpga_host.model import ModelHost
+from hexastorm.interpolator import io
+from hexastorm.luna.spi import SPIGatewareTestCase
+from hexastorm.utils import async_test_case
+
+
+class TestModelConformance(SPIGatewareTestCase):
+    """Cross-check the behavioral model against the Amaranth simulation.
+
+    Every host call is executed on both the simulated dispatcher and the model.
+    """
+
+    plf_cfg = PlatformConfig(test=True)
+    FRAGMENT_UNDER_TEST = Dispatcher
+    FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
+    # 8 bits, four phases of four cycles per bit in spi_send_bit
+    SPI_CYCLES_PER_BYTE = 8 * 4 * 4
+
+    async def initialize_signals(self, sim):
+        self.sim = sim
+        self.host = MockHost(self.dut.parser.fifo_full, sim)
+        self.dut.spi = self.dut.parser.spi_command.spi
+        self.host.spi_exchange_data = self.spi_exchange_data
+        self.model_host = ModelHost(spi_cycles_per_byte=self.SPI_CYCLES_PER_BYTE)
+        self.model = self.model_host.model
+        sim.set(self.dut.spi.cs, 0)
+
+        self.motors = self.plf_cfg.hdl_cfg.motors
+        self.simulated_positions = [0] * self.motors
+        self.prev_steps = [0] * self.motors
+        await sim.tick()
+
+    def _track_steps(self):
+        steppers = self.dut.pol.steppers
+        for i in range(self.motors):
+            current_step = self.sim.get(steppers[i].step)
+            if current_step == 1 and self.prev_steps[i] == 0:
+                if self.sim.get(steppers[i].dir):
+                    self.simulated_positions[i] += 1
+                else:
+                    self.simulated_positions[i] -= 1
+            self.prev_steps[i] = current_step
+
+    async def advance_cycles(self, cycles):
+        for _ in range(cycles):
+            self._track_steps()
+            await self.sim.tick()
+
+    async def wait_complete(self, max_cycles=100):
+        current_cycle = 0
+        while self.sim.get(self.dut.busy) or current_cycle < max_cycles:
+            if self.sim.get(self.dut.pol.busy):
+                current_cycle = 0
+            else:
+                current_cycle += 1
+            self._track_steps()
+            await self.sim.tick()
+        # the laserhead commits the read of the stop line a cycle after
+        # it stops processing lines
+        self._track_steps()
+        await self.sim.tick()
+
+    async def both(self, method, *args, **kwargs):
+        """Run a host method on simulation and model."""
+        sim_result = await getattr(self.host, method)(*args, **kwargs)
+        model_result = await getattr(self.model_host, method)(*args, **kwargs)
+        return sim_result, model_result
+
+    async def exchange(self, command):
+        """Send raw bytes to both and verify the returned words are identical."""
+        sim_resp = await self.host.send_command(command)
+        model_resp = await self.model_host.send_command(command)
+        cmd_len = Spi.command_bytes + Spi.word_bytes
+        for idx in range(0, len(command), cmd_len):
+            # first byte is shifted out during the command phase and undefined
+            self.assertEqual(
+                sim_resp[idx + 1 : idx + cmd_len], model_resp[idx + 1 : idx + cmd_len]
+            )
+
+    def assert_fifo_equal(self):
+        fifo = self.dut.parser.fifo
+        self.assertEqual(
+            self.sim.get(fifo.space_available), self.model.fifo.space_available
+        )
+        self.assertEqual(bool(self.sim.get(fifo.empty)), self.model.fifo.empty)
+
+    @async_test_case
+    async def test_fifo_and_state_words(self, sim):
+        """space available and status words match while the FIFO fills"""
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        await self.both("set_parsing", False)
+        write = [Spi.Commands.write]
+        pin = write + [0] * (Spi.word_bytes - 2) + [0, Spi.Instructions.write_pin]
+        move_head = write + list((100).to_bytes(7, "big")) + [Spi.Instructions.move]
+        move = move_head + (write + [0] * Spi.word_bytes) * (hdl_cfg.words_move - 1)
+        for command in [pin, move, pin, move]:
+            await self.exchange(command)
+            self.assert_fifo_equal()
+        # status after memory is full
+        await self.exchange([Spi.Commands.read] + [0] * Spi.word_bytes)
+        self.assertTrue(self.model.fifo_full)
+        # flush restores both
+        await self.both("flush_buffer")
+        await self.advance_cycles(2)
+        self.assert_fifo_equal()
+
+    @async_test_case
+    async def test_watermark(self, sim):
+        """the low-watermark pin toggles at the same fill level"""
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        await self.both("set_parsing", False)
+        await self.both("set_watermark", hdl_cfg.mem_depth - 3)
+        pin = [Spi.Commands.write] + [0] * (Spi.word_bytes - 1)
+        pin += [Spi.Instructions.write_pin]
+        for _ in range(4):
+            await self.exchange(pin)
+            await self.advance_cycles(2)
+            self.assert_fifo_equal()
+            self.assertEqual(
+                bool(self.sim.get(self.dut.parser.fifo_low)), self.model.fifo_low
+            )
+        self.assertFalse(self.model.fifo_low)
+
+    @async_test_case
+    async def test_invalid_instruction(self, sim):
+        command = [Spi.Commands.write] + [0] * (Spi.word_bytes - 1) + [0xAA]
+        await self.exchange(command)
+        await self.advance_cycles(2)
+        await self.exchange([Spi.Commands.read] + [0] * Spi.word_bytes)
+        self.assertTrue((await self.model_host.fpga_state)["error"])
+
+    @async_test_case
+    async def test_rle_scanline_words(self, sim):
+        """the word count of encoded scanlines is validated by both"""
+        header = Spi.scanline_header
+        shift = header["direction"] + header["half_period"]
+        write = [Spi.Commands.write]
+        await self.both("set_parsing", False)
+        for words in (1, 0):
+            payload = list((words << shift).to_bytes(7, "big"))
+            rle_head = write + payload + [Spi.Instructions.rle_scanline]
+            await self.exchange(rle_head + (write + [0xFF] * Spi.word_bytes) * words)
+            await self.advance_cycles(2)
+            self.assert_fifo_equal()
+        await self.exchange([Spi.Commands.read] + [0] * Spi.word_bytes)
+        self.assertTrue((await self.model_host.fpga_state)["error"])
+
+    @async_test_case
+    async def test_burst(self, sim):
+        """bursts fill the FIFO identically, words after an invalid word are dropped"""
+        await self.both("set_parsing", False)
+        pin = [0] * (Spi.word_bytes - 1) + [Spi.Instructions.write_pin]
+        invalid = [0] * Spi.word_bytes
+        for words in ([pin, pin], [pin, invalid, pin]):
+            command = [Spi.Commands.burst | (len(words) - 1)]
+            command += [byte for word in words for byte in word]
+            sim_resp = await self.host.send_command(command)
+            model_resp = await self.model_host.send_command(command)
+            self.assertEqual(sim_resp[1:], model_resp[1:])
+            await self.advance_cycles(2)
+            self.assert_fifo_equal()
+        sim_state, model_state = await self.both("_read_fpga_state")
+        self.assertEqual(sim_state, model_state)
+        self.assertTrue(model_state["error"])
+
+    @async_test_case
+    async def test_moves(self, sim, moves=3, ticks=2_000):
+        """step positions and polynomial accumulators agree after spline moves"""
+        seed(1)
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        motors, degree = hdl_cfg.motors, hdl_cfg.pol_degree
+        for _ in range(moves):
+            velocity = [
+                randint(-(1 << hdl_cfg.bit_shift), 1 << hdl_cfg.bit_shift)
+                for _ in range(motors)
+            ]
+            coeffs = []
+            for v in velocity:
+                coeffs += [v, randint(-200, 200)] + [0] * (degree - 2)
+            await self.both("spline_move", ticks, coeffs)
+            await self.wait_complete()
+            await self.model_host.wait_fifo_empty()
+        self.assertEqual(self.simulated_positions, self.model.steps)
+        for motor in range(motors):
+            idx = motor * degree
+            self.assertEqual(
+                sim.get(self.dut.pol.cntrs[idx]), self.model._accumulators[motor]
+            )
+
+    @async_test_case
+    async def test_fan_spindle_pins(self, sim):
+        await self.both("set_fan_speed", 85)
+        await self.both("set_spindle_speed", 210)
+        await self.both("set_leds", blue=True, red=True)
+        await self.advance_cycles(50)
+        await self.model_host.wait_fifo_empty()
+        self.assertEqual(sim.get(self.dut.fan_duty), self.model.fan_duty)
+        self.assertEqual(sim.get(self.dut.spindle_duty), self.model.spindle_duty)
+        self.assertEqual(sim.get(self.dut.pins), self.model.pins)
+
+    @async_test_case
+    async def test_scanlines(self, sim, num_lines=12, steps_line=0.5):
+        """scanlines are consumed and step the orthogonal axis identically"""
+        bits = [1] * self.plf_cfg.laser_timing["scanline_length"]
+        for direction in (0, 1):
+            for _ in range(num_lines):
+                await self.both("write_line", bits, steps_line, direction)
+            await self.both("write_line", [])
+            await self.wait_complete()
+            await self.model_host.wait_fifo_empty()
+            self.assert_fifo_equal()
+            self.assertEqual(self.simulated_positions, self.model.steps)
+        self.assertEqual(self.model.lines_exposed, 2 * num_lines)
+        sim_state, model_state = await self.both("_read_fpga_state")
+        self.assertEqual(sim_state, model_state)
+
+    @async_test_case
+    async def test_scanline_repeat(self, sim, repetitions=5):
+        """repeated lines are replayed identically by both"""
+        bits = [1] * self.plf_cfg.laser_timing["scanline_length"]
+        await self.both("write_line", bits, 0.5, 1, repetitions)
+        await self.both("write_line", [])
+        await self.wait_complete()
+        await self.model_host.wait_fifo_empty()
+        self.assert_fifo_equal()
+        self.assertEqual(self.simulated_positions, self.model.steps)
+        self.assertEqual(self.model.lines_exposed, repetitions)
+
+    @async_test_case
+    async def test_facet_lines(self, sim, repetitions=3, facet=2):
+        """lines for a single facet are masked identically by both"""
+        bits = [1] * self.plf_cfg.laser_timing["scanline_length"]
+        await self.both("write_line", bits, 0.5, 1, repetitions, facet)
+        await self.both("write_line", bits, 0.5, 0)
+        await self.both("write_line", [])
+        await self.wait_complete()
+        await self.model_host.wait_fifo_empty()
+        self.assert_fifo_equal()
+        self.assertEqual(self.simulated_positions, self.model.steps)
+        self.assertEqual(self.model.lines_exposed, repetitions + 1)
+        self.assertEqual(self.sim.get(self.dut.lh.facet_mask), self.model.facet_mask)
+
+    @async_test_case
+    async def test_facet_offsets(self, sim, offsets=(0, 2, -1, 1)):
+        """facet offsets are stored identically by both"""
+        bits = [1] * self.plf_cfg.laser_timing["scanline_length"]
+        await self.both("set_facet_offsets", list(offsets))
+        await self.both("write_line", bits, 0.5, 1, 2)
+        await self.both("write_line", [])
+        await self.wait_complete()
+        await self.model_host.wait_fifo_empty()
+        self.assert_fifo_equal()
+        self.assertEqual(self.simulated_positions, self.model.steps)
+        self.assertEqual(self.model.lines_exposed, 2)
+        self.assertEqual(
+            [self.sim.get(offset) for offset in self.dut.lh.facet_offsets],
+            self.model.facet_offsets,
+        )
+        self.assertEqual(self.model.facet_offsets, list(offsets))
+        with self.assertRaises(ValueError):
+            await self.model_host.set_facet_offsets([0, 0, 0, 100])
+
+    @async_test_case
+    async def test_config_then_move(self, sim, ticks=2_000):
+        """configuration words do not start the laserhead before a move"""
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        bits = [1] * self.plf_cfg.laser_timing["scanline_length"]
+        coeffs = [100, 0] + [0] * (hdl_cfg.pol_degree - 2)
+        await self.both("set_facet_offsets", [0, 1, 0, -1])
+        await self.both("set_laser_timing")
+        await self.both("spline_move", ticks, coeffs * hdl_cfg.motors)
+        await self.wait_complete()
+        await self.model_host.wait_fifo_empty()
+        # between lines, the configuration is read for the facet of the next line
+        await self.both("write_line", bits, 0.5, 1)
+        await self.both("set_facet_offsets", [0, 0, 0, 0])
+        await self.both("write_line", bits, 0.5, 0)
+        await self.both("write_line", [])
+        await self.both("spline_move", ticks, coeffs * hdl_cfg.motors)
+        await self.wait_complete()
+        await self.model_host.wait_fifo_empty()
+        self.assert_fifo_equal()
+        self.assertEqual(self.simulated_positions, self.model.steps)
+        self.assertEqual(self.model.lines_exposed, 2)
+        self.assertFalse(self.sim.get(self.dut.lh.process_lines))
+        self.assertFalse(self.model.process_lines)
+        sim_state, model_state = await self.both("_read_fpga_state")
+        self.assertEqual(sim_state, model_state)
+        self.assertFalse(model_state["error"])
+
+
+class TestModelHost(unittest.TestCase):
+    """The model runs jobs much faster than real time."""
+
+    def test_production_job_duration(self, lines=2_000):
+        host = ModelHost(test=False)
+        laz_tim = host.cfg.laser_timing
+
+        async def job():
+            bits = [1] * laz_tim["scanline_length"]
+            await host.write_line(bits, steps_line=1, repetitions=lines)
+            await host.write_line([])
+            await host.wait_fifo_empty()
+
+        asyncio.run(job())
+        model = host.model
+        self.assertEqual(model.lines_exposed, lines)
+        self.assertFalse(model.error)
+        lines_per_sec = laz_tim["rpm"] / 60 * laz_tim["facets"]
+        spinup = laz_tim["spinup_ticks"] / laz_tim["crystal_hz"]
+        expected = lines / lines_per_sec + spinup
+        # synchronisation takes a few facets
+        self.assertAlmostEqual(model.seconds, expected, delta=3 / lines_per_sec)
+
+    def test_flow_control(self):
+        """mem_full blocks the host, the job still completes without overflow"""
+        host = ModelHost(test=False)
+        hdl_cfg = host.cfg.hdl_cfg
+        lines = 3 * hdl_cfg.mem_depth // hdl_cfg.words_scanline
+
+        async def job():
+            # alternating bits, run-length encoding would shrink the line
+            length = host.cfg.laser_timing["scanline_length"]
+            bits = [idx % 2 for idx in range(length)]
+            for _ in range(lines):
+                await host.write_line(bits)
+            self.assertTrue((await host.fpga_state)["mem_full"])
+            await host.write_line([])
+            await host.wait_fifo_empty()
+
+        asyncio.run(job())
+        self.assertEqual(host.model.lines_exposed, lines)
+        self.assertFalse(host.model.error)
+
+    def test_fifo_low_wait(self):
+        """the host sleeps until the rising edge of fifo_low at the watermark"""
+        host = ModelHost(test=False)
+        hdl_cfg = host.cfg.hdl_cfg
+        watermark = hdl_cfg.mem_depth // 2
+        length = host.cfg.laser_timing["scanline_length"]
+        bits = [idx % 2 for idx in range(length)]
+        woken = []
+
+        async def fill():
+            while not host.model.fifo_full:
+                await host.write_line(bits)
+
+        async def job():
+            await host.set_watermark(watermark)
+            await fill()
+            self.assertFalse(host.fifo_low)
+            # a stale flag, set by an edge before the FIFO filled, is cleared
+            flag = asyncio.Event()
+            flag.set()
+            board = asyncio.ensure_future(host._fifo_low_edges(flag))
+            await host._wait_fifo_low(flag)
+            board.cancel()
+            woken.append(host.model.fifo.space_available)
+            # a full FIFO blocks the next line until the edge
+            await fill()
+            await host.write_line(bits)
+            await host.write_line([])
+            await host.wait_fifo_empty()
+
+        asyncio.run(job())
+        # a line is read per facet, the edge is seen within a line
+        self.assertGreater(woken[0], watermark)
+        self.assertLessEqual(woken[0], watermark + hdl_cfg.words_scanline)
+        self.assertEqual(host.telemetry.counters["mem_full_waits"], 1)
+        self.assertFalse(host.model.error)
+
+    def test_draft_job(self, lines=100):
+        """a job at half the laser frequency has shorter lines"""
+        host = ModelHost(test=False)
+        laz_tim = host.cfg.laser_timing
+        build_length = laz_tim["scanline_length"]
+
+        async def job():
+            await host.set_laser_timing(laser_hz=laz_tim["laser_hz"] / 2)
+            length = laz_tim["scanline_length"]
+            self.assertEqual(length, build_length // 2)
+            bits = [idx % 2 for idx in range(length)]
+            for _ in range(lines):
+                await host.write_line(bits)
+            await host.write_line([])
+            await host.wait_fifo_empty()
+
+        asyncio.run(job())
+        model = host.model
+        self.assertEqual(model.lines_exposed, lines)
+        self.assertEqual(model.laser_timing["scanline_length"], build_length // 2)
+        self.assertFalse(model.error)
+
+    def test_grayscale_job(self, lines=100):
+        """grayscale lines take the words of two bits per pixel"""
+        host = ModelHost(test=False, laser_bits=2)
+        hdl_cfg = host.cfg.hdl_cfg
+        laz_tim = host.cfg.laser_timing
+        self.assertEqual(hdl_cfg.fifo_memory, "spram")
+        self.assertEqual(
+            hdl_cfg.words_scanline,
+            Spi.words_scanline(laz_tim, laser_bits=2),
+        )
+
+        async def job():
+            levels = [idx % 4 for idx in range(laz_tim["scanline_length"])]
+            for _ in range(lines):
+                await host.write_line(levels)
+            await host.write_line([])
+            await host.wait_fifo_empty()
+
+        asyncio.run(job())
+        self.assertEqual(host.model.lines_exposed, lines)
+        self.assertFalse(host.model.error)
+
+    def test_facet_stream_fills_reserve(self):
+        """reported space lets facet lines fill the FIFO beyond mem_full"""
+        host = ModelHost(test=False)
+        hdl_cfg = host.cfg.hdl_cfg
+        repetitions = 3 * hdl_cfg.mem_depth // hdl_cfg.words_scanline
+
+        async def job():
+            self.assertEqual(
+                (await host.fpga_state)["space_available"], hdl_cfg.mem_depth
+            )
+            length = host.cfg.laser_timing["scanline_length"]
+            bits = [idx % 2 for idx in range(length)]
+            await host.write_line(bits, repetitions=repetitions, facet=0)
+            state = await host.fpga_state
+            self.assertTrue(state["mem_full"])
+            self.assertLess(state["space_available"], hdl_cfg.space_available)
+            await host.write_line([])
+            await host.wait_fifo_empty()
+
+        asyncio.run(job())
+        self.assertEqual(host.model.lines_exposed, repetitions)
+        self.assertFalse(host.model.error)
+
+    def test_facet_stats(self, seconds=1):
+        """facet statistics count every revolution and are cleared when read"""
+        host = ModelHost(test=False)
+        laz_tim = host.cfg.laser_timing
+
+        async def job():
+            await host.enable_comp(synchronize=True)
+            host.model.advance(laz_tim["spinup_ticks"] + 2 * laz_tim["facet_ticks"])
+            await host.read_facet_stats()
+            host.model.advance(seconds * laz_tim["crystal_hz"])
+            stats = await host.read_facet_stats()
+            cleared = await host.read_facet_stats()
+            return stats, cleared
+
+        stats, cleared = asyncio.run(job())
+        revolutions = seconds * laz_tim["rpm"] / 60
+        for facet_stats in stats:
+            self.assertAlmostEqual(facet_stats["count"], revolutions, delta=1)
+            self.assertEqual(facet_stats["mean"], laz_tim["facet_ticks"])
+            self.assertEqual(facet_stats["std"], 0)
+            self.assertEqual(facet_stats["max"], laz_tim["facet_ticks"])
+        periods = round(revolutions * laz_tim["facets"])
+        self.assertEqual(sum(s["count"] for s in stats), periods)
+        self.assertEqual([s["count"] for s in cleared], [0] * laz_tim["facets"])
+
+
+class TestJobSimulator(unittest.TestCase):
+    """Jobs are streamed to the model as the host would."""
+
+    def params(self, lanes=2, facets=400):
+        laz_tim = PlatformConfig(test=False).laser_timing
+        return {
+            "lanes": lanes,
+            "facetsinlane": facets,
+            "lanewidth": 5.0,
+            "samplexsize": lanes * 5.0,
+            "bitsinscanline": laz_tim["scanline_length"],
+            "stepsperline": 1,
+            "laserchannels": 1,
+            "laserbits": 1,
+            "channeloffset": 1,
+        }
+
+    def test_job_duration(self):
+        """lines are exposed at the facet rate, the lane change adds a move"""
+        params = self.params()
+        sim = JobSimulator(move_speed=10.0)
+        report = sim.run_params(params)
+        laz_tim = sim.host.cfg.laser_timing
+        lines = params["lanes"] * params["facetsinlane"]
+        self.assertEqual(report["lines"], lines)
+        self.assertEqual(report["underruns"], [])
+        self.assertGreater(report["min_margin_lines"], 0)
+        lines_per_sec = laz_tim["rpm"] / 60 * laz_tim["facets"]
+        expected = (
+            lines / lines_per_sec
+            + laz_tim["spinup_ticks"] / laz_tim["crystal_hz"]
+            + params["lanewidth"] / 10.0
+        )
+        self.assertAlmostEqual(report["duration"], expected, delta=0.1)
+
+    def test_lines_chunk_margin(self):
+        """smaller chunks keep more lines queued, a chunk must fit the FIFO"""
+        params = self.params(lanes=1)
+        default = JobSimulator().run_params(params)
+        small = JobSimulator(lines_chunk=10).run_params(params)
+        self.assertGreater(small["min_margin"], default["min_margin"])
+        with self.assertRaises(ValueError):
+            JobSimulator(lines_chunk=1_000)
+
+    def test_underruns(self):
+        """a link slower than the facet rate starves the laserhead"""
+        params = self.params(lanes=1)
+        fast = JobSimulator().run_params(params)
+        slow = JobSimulator(baudrate=100e3).run_params(params)
+        self.assertEqual(slow["lines"], fast["lines"])
+        self.assertEqual(slow["min_margin_lines"], 0)
+        self.assertTrue(slow["underruns"])
+        self.assertGreater(slow["duration"], fast["duration"])
+        slow_host = JobSimulator(encode_rate=100).run_params(params)
+        self.assertTrue(slow_host["underruns"])
+
+    def test_file_job(self):
+        """a pattern file with run-length encoded lines is replayed"""
+        params = self.params()
+        sim = JobSimulator()
+        laz_tim = sim.host.cfg.laser_timing
+        lines = params["lanes"] * params["facetsinlane"]
+        line_bytes = -(-laz_tim["scanline_length"] // 8)
+        pixels = np.zeros((lines, line_bytes), dtype=np.uint8)
+        pixels[::2, :4] = 255
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "job.pat"
+            io.write_binary_file(pixels.reshape(-1), params, path)
+            facets, lanes, _, scanlines = io.read_scanlines(path, laz_tim)
+            report = sim.run_file(path)
+        self.assertEqual((facets, lanes), (params["facetsinlane"], params["lanes"]))
+        self.assertEqual(len(scanlines), lines)
+        self.assertEqual(scanlines[0][0], Spi.Instructions.rle_scanline)
+        self.assertEqual(report["lines"], lines)
+        self.assertEqual(report["underruns"], [])
+        # run-length encoded lines are smaller, more of them are queued
+        raw = sim.run_params(params)
+        self.assertGreater(report["min_margin"], raw["min_margin"])
+
+
+if __name__ == "__main__":
+    unittest.main()
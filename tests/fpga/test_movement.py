@@ -1,17 +1,25 @@
+import unittest
+from math import ceil
+
+import numpy as np
+
 from hexastorm.utils import LunaGatewareTestCase, async_test_case
+from hexastorm.fpga_host.interface import BaseHost
 from hexastorm.fpga_host.mock import MockHost
-from hexastorm.config import PlatformConfig
+from hexastorm.config import PlatformConfig, Spi
 from hexastorm.movement import Polynomial
 
 
-class TestPolynomial(LunaGatewareTestCase):
+class PolynomialTestCase(LunaGatewareTestCase):
     plf_cfg = PlatformConfig(test=True)
     FRAGMENT_UNDER_TEST = Polynomial
     FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
 
     async def initialize_signals(self, sim) -> None:
         """Initialize simulation environment and signals."""
-        self.host = MockHost(fifo_full=None, sim=None)
+        self.host = MockHost(
+            fifo_full=None, sim=None, pol_degree=self.plf_cfg.pol_degree
+        )
         self.move_ticks = self.plf_cfg.hdl_cfg.move_ticks
         self.sim = sim
         sim.set(self.dut.tick_limit, self.move_ticks)
@@ -34,7 +42,9 @@ class TestPolynomial(LunaGatewareTestCase):
                     count -= 1
         return count
 
-    async def send_coefficients(self, a: int, b: int, c: int) -> None:
+    async def send_coefficients(
+        self, a: int, b: int, c: int, start: bool = True
+    ) -> None:
         """
         Send polynomial coefficients to DUT and pulse start.
 
@@ -58,8 +68,60 @@ class TestPolynomial(LunaGatewareTestCase):
                 base_idx = motor * hdl_cfg.pol_degree + idx
                 self.sim.set(self.dut.coeff[base_idx], val)
 
-        await self.pulse(self.dut.start)
+        if start:
+            await self.pulse(self.dut.start)
+
+    def constant_speed(self, ticks: int, steps: int):
+        """Segment with forward differences moving all motors at constant speed."""
+        a = round(self.host.steps_to_count(steps) / ticks)
+        coeffs = [a] + [0] * (self.plf_cfg.hdl_cfg.pol_degree - 1)
+        return ticks, coeffs * self.plf_cfg.hdl_cfg.motors
+
+    async def run_segments(self, segments, chain: bool = True):
+        """
+        Execute segments and record the steps and position of motor 0.
 
+        segments -- list of (ticks, forward differences of all motors)
+        chain    -- if True, a segment is preloaded while the previous one runs,
+                    else the next segment is sent once the DUT is idle
+
+        Returns: (cycles until idle, cycles at which a step started,
+                  position in counts per cycle)
+        """
+        sim = self.sim
+        dut = self.dut
+        stepper = dut.steppers[0]
+        step_bit = self.plf_cfg.hdl_cfg.bit_shift + 1
+        queue = list(segments)
+        cycles, times = 0, []
+        step_old = sim.get(stepper.step)
+        counter = sim.get(dut.cntrs[0])
+        positions = [counter]
+        while queue or sim.get(dut.busy) or sim.get(dut.pending):
+            ready = not sim.get(dut.pending) and (chain or not sim.get(dut.busy))
+            if queue and ready:
+                ticks, coeffs = queue.pop(0)
+                for idx, coeff in enumerate(coeffs):
+                    sim.set(dut.coeff[idx], coeff)
+                sim.set(dut.tick_limit, ticks)
+                sim.set(dut.start, 1)
+            else:
+                sim.set(dut.start, 0)
+            await sim.tick()
+            cycles += 1
+            step = sim.get(stepper.step)
+            if step and not step_old:
+                times.append(cycles)
+            step_old = step
+            # whole steps are dropped from the counter at the start of a segment
+            delta = sim.get(dut.cntrs[0]) - counter
+            half = 1 << (step_bit - 1)
+            positions.append(positions[-1] + (delta + half) % (2 * half) - half)
+            counter = sim.get(dut.cntrs[0])
+        return cycles, times, positions
+
+
+class TestPolynomial(PolynomialTestCase):
     @async_test_case
     async def test_tick_limit(self, sim):
         """Test motor step rate at various tick limits."""
@@ -126,3 +188,109 @@ class TestPolynomial(LunaGatewareTestCase):
         delta = round(0.4 * self.move_ticks)
         await run_move_test(delta)
         await run_move_test(-delta)
+
+    @async_test_case
+    async def test_chained_segments(self, sim, segments=4, ticks=1_000, steps=50):
+        """Preloaded segments start on the tick the previous segment ends.
+
+        The step interval at constant speed is measured across the segment
+        boundaries, with and without preloading the next segment.
+        """
+        moves = [self.constant_speed(ticks, steps)] * segments
+        cycles, times, _ = await self.run_segments(moves, chain=True)
+        intervals = np.diff(times)
+        # only the start-up latency is added to the motion itself
+        self.assertLessEqual(cycles - segments * ticks, 4)
+        # steps_to_count adds a quarter step per segment
+        self.assertAlmostEqual(len(times), segments * steps, delta=1)
+        # rate only varies with the sub-step phase, i.e. one tick
+        self.assertLessEqual(intervals.max() - intervals.min(), 1)
+
+        cycles_idle, times_idle, _ = await self.run_segments(moves, chain=False)
+        intervals_idle = np.diff(times_idle)
+        self.assertEqual(len(times_idle), len(times))
+        # waiting for idle adds a gap at each boundary
+        self.assertGreater(cycles_idle, cycles + segments - 1)
+        self.assertGreater(intervals_idle.max(), intervals.max())
+
+
+class TestPolynomialJerk(PolynomialTestCase):
+    """Third order polynomial, the simulated configuration for S-curve moves."""
+
+    plf_cfg = PlatformConfig(test=True, pol_degree=3)
+    FRAGMENT_ARGUMENTS = {"plf_cfg": plf_cfg}
+
+    def test_simulation_only(self):
+        """the third order gateware does not fit the board"""
+        with self.assertRaises(ValueError):
+            PlatformConfig(test=False, pol_degree=3)
+
+    @staticmethod
+    def decode_moves(payload: bytes):
+        """Split packed move instructions in (ticks, forward differences)."""
+        words = [payload[idx : idx + 9] for idx in range(0, len(payload), 9)]
+        segments = []
+        for word in words:
+            if word[-1] == Spi.Instructions.move:
+                segments.append((int.from_bytes(word[1:8], "big"), []))
+            else:
+                coeff = int.from_bytes(word[1:], "big", signed=True)
+                segments[-1][1].append(coeff)
+        return segments
+
+    @async_test_case
+    async def test_scurve_lane_move(
+        self, sim, distance=1, speed=50, linear_speed=10, window=1_000
+    ):
+        """S-curve reaches a higher feedrate between lanes within the jerk limit.
+
+        Speed and jerk are estimated from the position with finite differences
+        over windows of 1 ms. The constant speed move of an order 2 polynomial
+        exceeds the jerk limit at the default speed of gotopoint.
+        """
+        hdl_cfg = self.plf_cfg.hdl_cfg
+        motor_cfg = self.plf_cfg.motor_cfg
+        steps_mm = motor_cfg["steps_mm"]["x"]
+        displacement = np.zeros(hdl_cfg.motors)
+        displacement[0] = distance
+        payload = b"".join(
+            chunk for _, chunk in self.host._move_chunks(displacement, speed)
+        )
+        segments = self.decode_moves(payload)
+        _, times, positions = await self.run_segments(segments)
+        self.assertEqual(len(times), distance * steps_mm)
+
+        def finite_differences(position_mm):
+            w = window
+            x = np.array(position_mm)
+            speeds = (x[w:] - x[:-w]) * hdl_cfg.motor_freq / w
+            jerks = x[3 * w :] - 3 * x[2 * w : -w] + 3 * x[w : -2 * w] - x[: -3 * w]
+            return speeds, jerks * (hdl_cfg.motor_freq / w) ** 3
+
+        counts_mm = steps_mm << (1 + hdl_cfg.bit_shift)
+        speeds, jerks = finite_differences(np.array(positions, dtype=float) / counts_mm)
+        self.assertGreater(speeds.max(), max(0.99 * speed, linear_speed))
+        self.assertLess(abs(jerks).max(), 1.01 * motor_cfg["jerk"])
+
+        ticks = np.arange(-3 * window, 3 * window)
+        line = np.maximum(ticks, 0) * linear_speed / hdl_cfg.motor_freq
+        _, jerks_line = finite_differences(line)
+        self.assertGreater(abs(jerks_line).max(), motor_cfg["jerk"])
+
+
+class TestSegmentTraffic(unittest.TestCase):
+    def test_bytes_per_mm(self, distance=100, speed=10, old_move_ticks=10_000):
+        """Wider tick counter reduces SPI traffic of a linear move"""
+        host = BaseHost()
+        hdl_cfg = host.cfg.hdl_cfg
+        displacement = np.zeros(hdl_cfg.motors)
+        displacement[0] = distance
+        ticks, velocities = host._calc_coordinated_velocities(displacement, speed)
+
+        payload = host._pack_linear_segments(ticks, velocities)
+        segment = len(host._pack_linear_segments(1, velocities))
+        self.assertEqual(len(payload), ceil(ticks / hdl_cfg.move_ticks) * segment)
+
+        bytes_per_mm = len(payload) / distance
+        old_bytes_per_mm = ceil(ticks / old_move_ticks) * segment / distance
+        self.assertLess(bytes_per_mm * 50, old_bytes_per_mm)
@@ -1,9 +1,11 @@
 import hashlib
+import zlib
 from pathlib import Path
 
 import numpy as np
 import pytest
 
+from hexastorm.config import Spi
 from hexastorm.interpolator.interpolator import Interpolator
 
 
@@ -105,3 +107,35 @@ def test_roundtrip_integrity(interpolator, tmp_path):
 
     assert len(r_data) == len(dummy_data)
     assert np.array_equal(r_data, dummy_data)
+
+
+@pytest.mark.parametrize("burst", [False, True])
+@pytest.mark.parametrize("rle", [True, False])
+def test_roundtrip_rle(interpolator, tmp_path, rle, burst):
+    """Lines with long runs are run-length encoded and read back identically."""
+    interpolator.params["samplexsize"] = 50.0  # mm
+    interpolator.params["facetsinlane"] = 100
+
+    params = interpolator.params
+    lanes = int(np.ceil(params["samplexsize"] / params["lanewidth"]))
+    facets = int(params["facetsinlane"])
+    bytes_line = int(np.ceil(params["bitsinscanline"] / 8))
+
+    # alternate between lines with long runs and random lines
+    rng = np.random.default_rng(42)
+    dummy_data = np.zeros((lanes * facets, bytes_line), dtype=np.uint8)
+    dummy_data[::2, bytes_line // 3 :] = 0xFF
+    dummy_data[1::2] = rng.integers(0, 255, size=dummy_data[1::2].shape)
+    dummy_data = dummy_data.flatten()
+
+    out_file = tmp_path / "test_rle.bin"
+    interpolator.writebin(dummy_data, out_file, rle=rle, burst=burst)
+    # burst words follow a single command, these are split on reading
+    payload = zlib.decompress(out_file.read_bytes())[12:]
+    assert bool(payload[0] & Spi.Commands.burst) == burst
+    pattern = interpolator.readbin(out_file)
+
+    assert pattern["metadata"]["facetsinlane"] == facets
+    assert pattern["metadata"]["lanes"] == lanes
+    packed = np.packbits(pattern["data"], bitorder=interpolator.bitorder)
+    assert np.array_equal(packed, dummy_data)
@@ -0,0 +1,111 @@
+import os
+import select
+import sys
+import threading
+import traceback
+
+
+class _Stream:
+    """Binary stdin and stdout of the program executed by the stand-in."""
+
+    def __init__(self, standin):
+        self.standin = standin
+
+    def read(self, nbytes):
+        return self.standin.read(nbytes)
+
+    def readinto(self, buf):
+        data = self.standin.read(len(buf))
+        buf[: len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        self.standin.write(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class _Console(_Stream):
+    """Text stream with a binary buffer, like sys.stdout on MicroPython."""
+
+    def __init__(self, standin):
+        super().__init__(standin)
+        self.buffer = _Stream(standin)
+
+    def read(self, nbytes):
+        return self.standin.read(nbytes).decode()
+
+    def write(self, text):
+        self.standin.write(text.encode())
+        return len(text)
+
+
+class RawReplStandIn:
+    """Local stand-in for the raw REPL of a MicroPython board.
+
+    Code is received on a pseudo terminal and executed by CPython, output is
+    streamed back while it runs. The port can be opened by ESP32Controller.
+    """
+
+    def __init__(self):
+        self.master, self._slave = os.openpty()
+        self.port = os.ttyname(self._slave)
+        self.namespace = {"__name__": "__main__"}
+        self.executed = 0
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop = True
+        self._thread.join(timeout=1)
+        os.close(self.master)
+        os.close(self._slave)
+
+    def read(self, nbytes):
+        data = b""
+        while len(data) < nbytes and not self._stop:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if ready:
+                data += os.read(self.master, nbytes - len(data))
+        return data
+
+    def write(self, data):
+        while data:
+            data = data[os.write(self.master, data) :]
+
+    def _execute(self, code):
+        stdin, stdout = sys.stdin, sys.stdout
+        sys.stdin = sys.stdout = _Console(self)
+        try:
+            exec(code, self.namespace)  # noqa: S102 (stands in for the REPL)
+            return b""
+        except Exception:  # noqa: BLE001 (printed like the REPL does)
+            return traceback.format_exc().encode()
+        finally:
+            sys.stdin, sys.stdout = stdin, stdout
+            self.executed += 1
+
+    def _run(self):
+        raw = False
+        code = bytearray()
+        while not self._stop:
+            char = self.read(1)
+            if char == b"\x01":
+                raw = True
+                code.clear()
+                self.write(b"raw REPL; CTRL-B to exit\r\n>")
+            elif char == b"\x02":
+                raw = False
+                self.write(b"\r\n>>> ")
+            elif char == b"\x03":
+                code.clear()
+            elif char == b"\x04" and raw:
+                self.write(b"OK")
+                err = self._execute(code.decode())
+                self.write(b"\x04" + err + b"\x04>")
+                code.clear()
+            elif raw:
+                code += char
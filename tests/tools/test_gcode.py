@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+
+from hexastorm.config import Spi
+from hexastorm.fpga_host.gcode import GCodeInterpreter
+from hexastorm.fpga_host.interface import BaseHost
+
+
+class RecordingHost(BaseHost):
+    """Host which records all payloads instead of sending them over SPI."""
+
+    def __init__(self):
+        super().__init__(test=True)
+        self.sent = []
+
+    async def send_command(self, command, timeout=0):
+        command = bytes(command)
+        self.sent.append(command)
+        return bytearray(len(command))
+
+    def words(self):
+        data = b"".join(self.sent)
+        step = Spi.word_bytes + 1
+        return [data[i : i + step] for i in range(0, len(data), step)]
+
+
+class TestGCodeInterpreter(unittest.TestCase):
+    def setUp(self):
+        self.host = RecordingHost()
+        self.gcode = GCodeInterpreter(self.host)
+
+    def run_lines(self, lines):
+        return asyncio.run(self.gcode.run(lines))
+
+    def write_words(self):
+        return [w for w in self.host.words() if w[0] == Spi.Commands.write]
+
+    def test_move_matches_gotopoint(self):
+        """A G1 move produces the same FIFO payload as gotopoint."""
+        self.run_lines(["G1 X1 Y0.5 F600"])
+        streamed = self.write_words()
+
+        reference = RecordingHost()
+        asyncio.run(reference.gotopoint([1, 0.5], speed=10, check_sensors=False))
+        expected = [w for w in reference.words() if w[0] == Spi.Commands.write]
+
+        self.assertEqual(streamed, expected)
+        self.assertEqual(self.host.mpos, [1, 0.5])
+
+    def test_workspace_offset(self):
+        """Absolute G-code targets are interpreted as workspace coordinates."""
+        self.host._position[:] = [2, 3]
+        self.host.set_workspace_zero()
+        self.run_lines(["G90", "G0 X1 ; comment", "G91", "G1 Y-1 (relative)"])
+        self.assertEqual(self.host.wpos, [1, -1])
+        self.assertEqual(self.host.mpos, [3, 2])
+
+    def test_fan_and_spindle(self):
+        self.run_lines(["M3 S200", "M106 S128", "M107", "M5"])
+        words = self.write_words()
+        self.assertEqual(
+            [(w[-1], w[-2]) for w in words],
+            [
+                (Spi.Instructions.set_spindle, 200),
+                (Spi.Instructions.set_fan, 128),
+                (Spi.Instructions.set_fan, 0),
+                (Spi.Instructions.set_spindle, 0),
+            ],
+        )
+        self.assertEqual(self.host.fan_speed, 0)
+        self.assertEqual(self.host.spindle_speed, 0)
+
+    def test_batching(self):
+        """Instructions are sent in batches, not one transaction per line."""
+        # the test configuration reserves only a few words, use a larger batch
+        self.gcode = GCodeInterpreter(self.host, batch_words=64)
+        lines = [f"G1 X{i * 0.01:.2f} F600" for i in range(1, 51)]
+        stats = self.run_lines(lines)
+        batch_bytes = self.gcode.batch_bytes
+        moves = [c for c in self.host.sent if c[0] == Spi.Commands.write]
+        self.assertLess(len(moves), len(lines))
+        self.assertTrue(all(len(c) <= batch_bytes for c in moves))
+        self.assertEqual(stats["lines"], len(lines))
+        self.assertEqual(stats["moves"], len(lines))
+        self.assertEqual(stats["bytes"], sum(len(c) for c in moves))
+        # the millisecond clock can report no elapsed time on fast runs
+        if stats["elapsed_ms"]:
+            self.assertGreater(stats["lines_per_sec"], 0)
+
+    def test_unsupported_skipped(self):
+        stats = self.run_lines(["G4 P100", "", "; only a comment"])
+        self.assertEqual(stats["skipped"], 1)
+        self.assertEqual(stats["lines"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from random import randint, seed
+
+from hexastorm.config import Spi
+from hexastorm.fpga_host import rle
+from hexastorm.fpga_host.model import ModelHost
+
+
+class TestRLE(unittest.TestCase):
+    def test_roundtrip(self, length=1000):
+        seed(3)
+        for run_max in (1, 20, 500):
+            bits = []
+            while len(bits) < length:
+                bits += [randint(0, 1)] * randint(1, run_max)
+            bits = bits[:length]
+            encoded = rle.runs_to_bytes(*rle.runs(bits))
+            self.assertEqual(rle.decode(encoded, length), bits)
+
+    def test_long_run_split(self):
+        encoded = rle.runs_to_bytes([1, 0], [rle.RUN_LENGTH + 1, 2])
+        self.assertEqual(list(encoded), [0xFF, 0x80, 0x01])
+
+    def test_fallback(self):
+        # alternating bits need a byte per bit
+        self.assertIsNone(rle.encode([0, 1] * 100, words_scanline=5))
+        encoded = rle.encode([1] * 200, words_scanline=5)
+        self.assertEqual(rle.words(encoded), 1)
+
+    def test_host_scanline(self):
+        """host sends the shortest scanline, the header holds the word count"""
+        host = ModelHost(test=False)
+        length = host.cfg.laser_timing["scanline_length"]
+        header = Spi.scanline_header
+        shift = 8 + header["direction"] + header["half_period"]
+        bits = [1] * length
+        for compress in (False, True):
+            byte_lst = host.bit_to_byte_list(bits, compress=compress)
+            header_word = int.from_bytes(bytes(byte_lst[:8]), "little")
+            words = (header_word >> shift) & ((1 << header["words"]) - 1)
+            if compress:
+                self.assertEqual(byte_lst[0], Spi.Instructions.rle_scanline)
+                self.assertEqual(len(byte_lst), (words + 1) * Spi.word_bytes)
+            else:
+                self.assertEqual(byte_lst[0], Spi.Instructions.scanline)
+                self.assertEqual(words, 0)
+                self.assertEqual(
+                    len(byte_lst), host.cfg.hdl_cfg.words_scanline * Spi.word_bytes
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import tempfile
+import unittest
+
+from hexastorm import rpc
+from hexastorm.esp32_controller import ESP32Controller, ESP32RemoteError
+
+from .repl_standin import RawReplStandIn
+
+
+def remote_add(a, b=0):
+    return a + b
+
+
+def remote_invert(line):
+    return bytes(255 - x for x in line)
+
+
+def remote_counter():
+    global counter
+    counter = globals().get("counter", 0) + 1
+    return counter
+
+
+def remote_fail():
+    raise ValueError("remote failure")
+
+
+class TestEncoding(unittest.TestCase):
+    def test_roundtrip(self):
+        value = [None, True, False, -(2**40), 1.5, "héllo", b"\x00\x03\xff", (1, 2)]
+        value.append({"nested": {"list": [1, [2]]}, 3: b""})
+        expected = value[:-2] + [[1, 2], value[-1]]
+        self.assertEqual(rpc.decode(rpc.encode(value)), expected)
+
+    def test_unsupported(self):
+        with self.assertRaises(TypeError):
+            rpc.encode(object())
+
+
+class TestRPC(unittest.TestCase):
+    def setUp(self):
+        self.standin = RawReplStandIn()
+        self.esp = ESP32Controller(port=self.standin.port)
+
+    def tearDown(self):
+        self.esp.close()
+        self.standin.close()
+
+    def test_call(self):
+        self.assertEqual(self.esp.call(remote_add, 2, b=3), 5)
+        line = bytes(range(256))
+        self.assertEqual(self.esp.call(remote_invert, line), line[::-1])
+
+    def test_source_uploaded_once(self):
+        written = []
+        write = self.esp.serial.write
+
+        def counting_write(data):
+            written.append(len(data))
+            return write(data)
+
+        self.esp.serial.write = counting_write
+        self.esp.call(remote_add, 1)
+        first = sum(written)
+        executed = self.standin.executed
+        written.clear()
+        for idx in range(10):
+            self.assertEqual(self.esp.call(remote_add, idx, 1), idx + 1)
+        # ten calls need less than the upload, no code passes the raw REPL
+        self.assertLess(sum(written), first)
+        self.assertEqual(self.standin.executed, executed)
+
+    def test_pipelining(self):
+        self.esp.rpc_window = 4
+        seqs = [self.esp.submit(remote_add, idx, idx) for idx in range(20)]
+        self.assertEqual([self.esp.result(s) for s in seqs], list(range(0, 40, 2)))
+
+    def test_remote_error(self):
+        with self.assertRaises(ESP32RemoteError) as cm:
+            self.esp.call(remote_fail)
+        self.assertIn("remote failure", str(cm.exception))
+        # the loop keeps running after an error
+        self.assertEqual(self.esp.call(remote_add, 1), 1)
+
+    def test_state_shared_with_repl(self):
+        """exec_wait stops the loop, globals and registry are retained"""
+        self.assertEqual(self.esp.call(remote_counter), 1)
+        self.assertEqual(self.esp.exec_wait("print(counter)"), "1")
+        self.assertEqual(self.esp.call("remote_counter"), 2)
+
+
+class TestPutFile(unittest.TestCase):
+    def setUp(self):
+        self.standin = RawReplStandIn()
+        self.esp = ESP32Controller(port=self.standin.port)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.local = os.path.join(self.tmp.name, "local.pat")
+        self.remote = os.path.join(self.tmp.name, "remote.pat")
+        self.data = os.urandom(200_000)
+        with open(self.local, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.esp.close()
+        self.standin.close()
+        self.tmp.cleanup()
+
+    def remote_data(self):
+        with open(self.remote, "rb") as f:
+            return f.read()
+
+    def test_transfer(self):
+        stats = self.esp.put_file(self.local, self.remote, chunk_size=8192)
+        self.assertEqual(self.remote_data(), self.data)
+        self.assertEqual(stats["bytes"], len(self.data))
+        self.assertEqual(stats["retries"], 0)
+        self.assertGreater(stats["mb_per_s"], 0)
+
+    def test_corrupted_chunk_is_resent(self):
+        write = self.esp.serial.write
+        corrupt = {8192, 102_400}
+
+        def corrupting_write(data):
+            offset = int.from_bytes(data[9:13], "big")
+            if data[2:3] == bytes([rpc.DATA]) and offset in corrupt:
+                corrupt.discard(offset)
+                data = data[:-1] + bytes([data[-1] ^ 1])
+            return write(data)
+
+        self.esp.serial.write = corrupting_write
+        stats = self.esp.put_file(self.local, self.remote, chunk_size=4096)
+        self.assertFalse(corrupt)
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(self.remote_data(), self.data)
+
+    def test_resume(self):
+        with open(self.remote, "wb") as f:
+            f.write(self.data[:50_000])
+        stats = self.esp.put_file(self.local, self.remote)
+        self.assertEqual(stats["resumed_from"], 50_000)
+        self.assertEqual(stats["bytes"], len(self.data) - 50_000)
+        self.assertEqual(self.remote_data(), self.data)
+
+    def test_resume_mismatch_restarts(self):
+        with open(self.remote, "wb") as f:
+            f.write(b"other data")
+        stats = self.esp.put_file(self.local, self.remote)
+        self.assertEqual(stats["resumed_from"], 0)
+        self.assertEqual(self.remote_data(), self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
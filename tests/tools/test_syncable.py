@@ -1,5 +1,5 @@
-import unittest
 import asyncio
+import unittest
 
 from hexastorm.fpga_host.syncwrap import syncable
 
@@ -29,6 +29,18 @@ class MyClass:
     def name(self):
         return "widget"
 
+    async def loop_id(self):
+        return id(asyncio.get_running_loop())
+
+    async def make_event(self):
+        self.event = asyncio.Event()
+
+    async def set_and_wait(self):
+        # only works if the event belongs to the loop running this coroutine
+        self.event.set()
+        await self.event.wait()
+        return True
+
 
 class TestSyncable(unittest.TestCase):
     def test_async_method_runs_sync(self):
@@ -77,3 +89,20 @@ class TestSyncable(unittest.TestCase):
                 _ = obj.foo(1)  # same for methods
 
         asyncio.run(inner())
+
+    def test_loop_is_reused(self):
+        obj = MyClass(sync=True)
+        self.assertEqual(obj.loop_id(), obj.loop_id())
+        obj.make_event()
+        self.assertTrue(obj.set_and_wait())
+
+    def test_calls_from_threads(self):
+        import threading
+
+        obj = MyClass(sync=True)
+        threads = [threading.Thread(target=obj.foo) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(obj.foo(0), 8)
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import unittest
+
+from hexastorm.fpga_host.model import ModelHost
+from hexastorm.fpga_host.telemetry import Histogram, Telemetry
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets(self):
+        hist = Histogram(buckets=8)
+        for value in [0, 1, 2, 3, 4, 1000]:
+            hist.add(value)
+        # bucket i holds values with bit_length i, last bucket overflows
+        self.assertEqual(hist.buckets, [1, 1, 2, 1, 0, 0, 0, 1])
+        self.assertEqual(hist.count, 6)
+        self.assertEqual(hist.min, 0)
+        self.assertEqual(hist.max, 1000)
+        self.assertEqual(hist.percentile(0.5), 3)
+        self.assertEqual(hist.percentile(1.0), 1000)
+
+    def test_bit_length(self):
+        """buckets follow the bit length of the value"""
+        hist = Histogram(buckets=40)
+        values = [0, 1, 5, 1 << 20, (1 << 31) - 1, 1 << 31]
+        for value in values:
+            hist.add(value)
+        expected = [0] * 40
+        for value in values:
+            expected[value.bit_length()] += 1
+        self.assertEqual(hist.buckets, expected)
+
+    def test_empty(self):
+        snapshot = Histogram().snapshot()
+        self.assertEqual(snapshot["count"], 0)
+        self.assertEqual(snapshot["mean"], 0)
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_disabled(self):
+        telemetry = Telemetry(enabled=False)
+        telemetry.count("commands")
+        telemetry.observe("send_latency_us", 10)
+        self.assertEqual(telemetry.counters["commands"], 0)
+        self.assertEqual(telemetry.histograms["send_latency_us"].count, 0)
+
+    def test_clock_and_rates(self):
+        clock = [0]
+        telemetry = Telemetry(clock_us=lambda: clock[0])
+        start = telemetry.now()
+        clock[0] = 2_000_000
+        telemetry.observe("send_latency_us", telemetry.since(start))
+        telemetry.count("bytes_sent", 1000)
+        snapshot = json.loads(telemetry.to_json())
+        self.assertEqual(snapshot["elapsed_s"], 2)
+        self.assertEqual(snapshot["rates"]["bytes_per_sec"], 500)
+        self.assertEqual(snapshot["histograms"]["send_latency_us"]["max"], 2_000_000)
+
+    def test_job_on_model(self, lines=500):
+        """a simulated job exposes throughput and mem_full waits"""
+        host = ModelHost(test=False)
+        laz_tim = host.cfg.laser_timing
+
+        async def job():
+            # alternating bits, run-length encoding would shrink the line
+            bits = [idx % 2 for idx in range(laz_tim["scanline_length"])]
+            # separate lines, repetitions would be replayed by the laserhead
+            for _ in range(lines):
+                await host.write_line(bits)
+            await host.write_line([])
+            await host.wait_fifo_empty()
+
+        asyncio.run(job())
+        snapshot = host.telemetry.snapshot()
+        counters = snapshot["counters"]
+        self.assertEqual(counters["scanlines"], lines)
+        self.assertGreater(counters["mem_full_waits"], 0)
+        self.assertEqual(
+            snapshot["histograms"]["send_latency_us"]["count"], counters["commands"]
+        )
+        # rates use model time, i.e. spin-up plus exposure at the facet rate
+        line_rate = laz_tim["rpm"] / 60 * laz_tim["facets"]
+        self.assertAlmostEqual(
+            snapshot["rates"]["scanlines_per_sec"],
+            lines / snapshot["elapsed_s"],
+        )
+        self.assertLess(snapshot["rates"]["scanlines_per_sec"], line_rate)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 from random import randint
+from types import SimpleNamespace
 
 import numpy as np
 
@@ -22,6 +23,39 @@ class TestBitPacking(unittest.TestCase):
                     actual = np.array(ulabext.packbits(bitlist, bitorder), dtype=np.uint8)
                     np.testing.assert_array_equal(expected, actual)
 
+    def test_unpackbits(self):
+        """Test unpackbits against numpy and as inverse of packbits."""
+        for bitorder in ("big", "little"):
+            for length in range(1, 30):
+                with self.subTest(bitorder=bitorder, length=length):
+                    bitlist = [randint(0, 1) for _ in range(length)]
+                    packed = ulabext.packbits(bitlist, bitorder)
+                    expected = np.unpackbits(packed, bitorder=bitorder)
+                    actual = ulabext.unpackbits(list(packed), bitorder)
+                    np.testing.assert_array_equal(expected, actual)
+                    unpacked = ulabext.unpackbits(bytes(packed), bitorder, length)
+                    np.testing.assert_array_equal(unpacked, bitlist)
+
+    def test_packbits_invalid(self):
+        with self.assertRaises(ValueError):
+            ulabext.packbits([0, 2, 1], "big")
+
+    def test_viper_packbits(self):
+        """The viper source packs and validates as the lookup tables.
+
+        The viper emitter only exists on MicroPython, under CPython the
+        source runs as plain Python with a pass-through decorator.
+        """
+        scope = {"micropython": SimpleNamespace(viper=lambda f: f), "ptr8": bytes}
+        pack_viper = ulabext._compile_viper(scope)
+        lut_only = ulabext._pack_viper
+        try:
+            ulabext._pack_viper = pack_viper
+            self.test_packbits_big_and_little()
+            self.test_packbits_invalid()
+        finally:
+            ulabext._pack_viper = lut_only
+
     def test_sign_array(self):
         """Test that sign function matches NumPy's output."""
         for length in range(1, 30):